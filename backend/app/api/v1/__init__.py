@@ -1,13 +1,21 @@
 """
 API v1路由聚合
 """
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Query, Request
+from app.core.hedging import stage1_hedge_policy
+from app.core.metrics import metrics
+from app.core.resilience import bedrock_breaker, opensearch_breaker
+from app.core.scheduler import scheduler
+from app.core.startup import import_profiler
+from app.utils.bedrock_client import bedrock_client
+from app.utils.opensearch_client import opensearch_client
 from app.api.v1.auth.routes import router as auth_router
 from app.api.v1.users.routes import router as users_router
 from app.api.v1.knowledge_bases.routes import router as kb_router
 from app.api.v1.documents.routes import router as doc_router
 from app.api.v1.sync_tasks.routes import router as sync_router
 from app.api.v1.query.routes import router as query_router
+from app.api.v1.conversations.routes import router as conversations_router
 from app.api.v1.chunks.routes import router as chunks_router
 
 api_router = APIRouter()
@@ -54,6 +62,13 @@ api_router.include_router(
     tags=["智能问答"]
 )
 
+# 挂载多轮对话路由
+api_router.include_router(
+    conversations_router,
+    prefix="/conversations",
+    tags=["智能问答"]
+)
+
 # 挂载chunks工具路由
 api_router.include_router(
     chunks_router,
@@ -73,6 +88,62 @@ async def api_root():
             "documents": "/api/v1/documents",
             "sync_tasks": "/api/v1/sync-tasks",
             "query": "/api/v1/query",
+            "conversations": "/api/v1/conversations",
+        }
+    }
+
+
+@api_router.get("/scheduler", tags=["系统"])
+async def get_scheduler_stats():
+    """
+    调度器状态
+
+    - queue_depth: 各类别（interactive/background/bulk）排队数量
+    - resources: Bedrock槽位、线程池、CPU槽位的占用情况
+    - interactive: 交互式查询的p95耗时与预算
+    - stage1_hedge: Stage 1对冲请求的当前阈值和窗口内对冲比例
+    - circuits: Bedrock / OpenSearch熔断器状态
+    """
+    return {
+        **scheduler.stats(),
+        "stage1_hedge": stage1_hedge_policy.stats(),
+        "circuits": {
+            "bedrock": bedrock_breaker.stats(),
+            "opensearch": opensearch_breaker.stats(),
+        },
+    }
+
+
+@api_router.get("/metrics", tags=["系统"])
+async def get_metrics():
+    """
+    运行指标（进程内计数器，重启后清零）
+
+    - queries_cancelled: 客户端断开后取消的查询数
+    - bedrock_calls_skipped: 因取消而未发起的Bedrock调用数
+    - bedrock_calls_aborted: 因取消而中止的进行中Bedrock调用数
+    - stage1_hedges_fired / stage1_hedges_won / stage1_hedges_denied: Stage 1对冲请求的发出、胜出和因比例上限被拒绝的次数
+    - retries: 按错误类别重试的次数
+    - circuit_<服务>_opened / circuit_<服务>_rejected: 熔断次数和熔断期间被快速拒绝的调用数
+    """
+    return metrics.snapshot()
+
+
+@api_router.get("/debug/startup", tags=["系统"])
+async def get_startup_report(limit: int = Query(20, ge=1, le=200, description="返回的模块数")):
+    """
+    调试接口：启动耗时报告
+
+    - import_seconds: 应用模块导入总耗时
+    - slowest_modules: 自身导入耗时最高的模块
+    - heavy_modules_loaded: 已加载的重型模块（torch/marker等，API进程中应为空）
+    - clients: 外部客户端是否已初始化（首次使用时才初始化）
+    """
+    return {
+        **import_profiler.report(limit=limit),
+        "clients": {
+            "opensearch": opensearch_client.initialized,
+            "bedrock": bedrock_client.initialized,
         }
     }
 
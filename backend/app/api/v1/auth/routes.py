@@ -4,23 +4,37 @@
 """
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.core.security import verify_password, create_access_token, get_password_hash
-from app.core.dependencies import get_current_user
+from app.core.database import get_db, get_read_db, run_db
+from app.core.security import verify_password_async, create_access_token, get_password_hash_async
+from app.core.dependencies import get_current_user, invalidate_cached_user
 from app.models.database import User
 from app.models.schemas import LoginRequest, LoginResponse, UserResponse, ChangePasswordRequest
 
 router = APIRouter()
 
 
+def _get_user_by_username(db: Session, username: str):
+    """按用户名查询用户（在数据库线程池中执行）"""
+    return db.query(User).filter(User.username == username).first()
+
+
+def _update_password_hash(db: Session, user_id: int, password_hash: str):
+    """更新用户密码哈希（在数据库线程池中执行）"""
+    user = db.query(User).filter(User.id == user_id).first()
+    user.password_hash = password_hash
+    db.commit()
+
+
 @router.post("/login", response_model=LoginResponse, summary="用户登录")
 async def login(
     request: LoginRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     用户登录
 
+    bcrypt在专用线程池中执行，登录高峰不会阻塞事件循环上的SSE流。
+
     Args:
         request: 登录请求（用户名+密码）
         db: 数据库会话
@@ -32,7 +46,7 @@ async def login(
         HTTPException: 401 用户名或密码错误
     """
     # 查询用户
-    user = db.query(User).filter(User.username == request.username).first()
+    user = await run_db(_get_user_by_username, db, request.username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -40,7 +54,7 @@ async def login(
         )
 
     # 验证密码
-    if not verify_password(request.password, user.password_hash):
+    if not await verify_password_async(request.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
@@ -99,14 +113,15 @@ async def change_password(
         HTTPException: 401 旧密码错误
     """
     # 验证旧密码
-    if not verify_password(request.old_password, current_user.password_hash):
+    if not await verify_password_async(request.old_password, current_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="旧密码错误"
         )
 
-    # 更新密码
-    current_user.password_hash = get_password_hash(request.new_password)
-    db.commit()
+    # 更新密码（current_user来自只读会话或缓存快照，需在写会话中重新加载）
+    password_hash = await get_password_hash_async(request.new_password)
+    await run_db(_update_password_hash, db, current_user.id, password_hash)
+    invalidate_cached_user(current_user.id)
 
     return {"message": "密码修改成功"}
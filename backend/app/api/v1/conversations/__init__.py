@@ -0,0 +1,3 @@
+"""
+Conversation API模块
+"""
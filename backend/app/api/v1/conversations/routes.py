@@ -0,0 +1,126 @@
+"""
+多轮对话API路由
+创建对话后，在/query/stream中传入conversation_id进行追问
+"""
+import json
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.core.database import get_db, get_read_db
+from app.core.logging import get_logger
+from app.core.dependencies import get_current_user
+from app.core.permissions import ensure_kb_permission, PermissionType
+from app.models.database import User
+from app.models.schemas import (
+    ConversationCreate,
+    ConversationResponse,
+    ConversationListResponse,
+    ConversationDetailResponse,
+    ConversationTurnResponse,
+    PaginationMeta
+)
+from app.services.conversation_service import ConversationService
+
+logger = get_logger(__name__)
+router = APIRouter()
+
+
+@router.post("", response_model=ConversationResponse, status_code=201)
+def create_conversation(
+    data: ConversationCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    创建对话（需要知识库读权限）
+
+    - 对话属于当前用户，只能在创建时指定的知识库中提问
+    - 标题为空时使用第一个问题
+    """
+    logger.info("api_create_conversation", kb_id=data.kb_id, user_id=current_user.id)
+
+    ensure_kb_permission(data.kb_id, current_user, PermissionType.READ, db)
+
+    conversation = ConversationService.create_conversation(db, data.kb_id, current_user.id, data.title)
+    return ConversationResponse.model_validate(conversation)
+
+
+@router.get("", response_model=ConversationListResponse)
+def list_conversations(
+    kb_id: str = Query(None, description="按知识库过滤"),
+    page: int = Query(1, ge=1, description="页码"),
+    page_size: int = Query(20, ge=1, le=100, description="每页数量"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    列出当前用户的对话
+
+    - 按最近更新时间倒序
+    - 分页返回
+    """
+    logger.info("api_list_conversations", kb_id=kb_id, user_id=current_user.id)
+
+    conversations, total = ConversationService.list_conversations(
+        db, current_user.id, kb_id=kb_id, page=page, page_size=page_size
+    )
+
+    return ConversationListResponse(
+        items=[ConversationResponse.model_validate(conversation) for conversation in conversations],
+        meta=PaginationMeta(
+            page=page,
+            page_size=page_size,
+            total=total,
+            total_pages=(total + page_size - 1) // page_size
+        )
+    )
+
+
+@router.get("/{conversation_id}", response_model=ConversationDetailResponse)
+def get_conversation(
+    conversation_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    获取对话详情（包含每轮问答、用到的文档和复用情况）
+    """
+    logger.info("api_get_conversation", conversation_id=conversation_id, user_id=current_user.id)
+
+    conversation = ConversationService.get_conversation(db, conversation_id, current_user.id)
+
+    turns = [
+        ConversationTurnResponse(
+            id=turn.id,
+            turn_index=turn.turn_index,
+            query_text=turn.query_text,
+            answer_text=turn.answer_text,
+            document_ids=json.loads(turn.document_ids) if turn.document_ids else [],
+            reused_documents=turn.reused_documents or 0,
+            read_documents=turn.read_documents or 0,
+            response_time_ms=turn.response_time_ms or 0,
+            created_at=turn.created_at
+        )
+        for turn in conversation.turns
+    ]
+
+    return ConversationDetailResponse(
+        **ConversationResponse.model_validate(conversation).model_dump(),
+        turns=turns
+    )
+
+
+@router.delete("/{conversation_id}", status_code=204)
+def delete_conversation(
+    conversation_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    删除对话（连同每轮问答和保存的Stage 1结果）
+    """
+    logger.info("api_delete_conversation", conversation_id=conversation_id, user_id=current_user.id)
+
+    ConversationService.delete_conversation(db, conversation_id, current_user.id)
+    return None
@@ -1,20 +1,27 @@
 """
 文档管理API路由
 """
-from fastapi import APIRouter, Depends, File, UploadFile, Query, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, File, Form, UploadFile, Query, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import get_db, get_read_db, run_db
 from app.core.logging import get_logger
 from app.core.dependencies import get_current_user
-from app.core.permissions import check_kb_permission, PermissionType
+from app.core.permissions import ensure_kb_permission, PermissionType
 from app.models.database import User
 from app.models.schemas import (
     DocumentResponse,
     DocumentListResponse,
     DocumentDetailResponse,
+    DocumentBatchUploadResponse,
+    DocumentBatchSkippedItem,
     PaginationMeta
 )
 from app.services.document_service import DocumentService
+from app.services.image_service import image_service, image_response
+from app.workers.queue_worker import notify_new_task
 
 logger = get_logger(__name__)
 router = APIRouter()
@@ -25,20 +32,22 @@ async def upload_document(
     kb_id: str = Query(..., description="知识库ID"),
     file: UploadFile = File(..., description="PDF文件"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db)
 ):
     """
     上传文档到知识库（需要写权限）
 
     - 检查用户是否有写权限
-    - 文件自动上传到S3
+    - 文件分块流式写入本地临时文件，同时计算大小和SHA-256
+    - 同一知识库内内容重复的文档返回409
     - 创建文档记录
     - 初始状态为uploaded
     """
     logger.info("api_upload_document", kb_id=kb_id, filename=file.filename, user_id=current_user.id)
 
-    # 检查写权限
-    check_kb_permission(kb_id, current_user, PermissionType.WRITE, db)
+    # 检查写权限（使用只读连接：写连接只有一个，不能在写入临时文件期间被占用）
+    await run_db(ensure_kb_permission, kb_id, current_user, PermissionType.WRITE, read_db)
 
     # 验证文件类型
     if not file.filename.lower().endswith('.pdf'):
@@ -47,34 +56,103 @@ async def upload_document(
             detail="只支持PDF文件"
         )
 
-    # 获取文件大小
-    content = await file.read()
-    file_size = len(content)
-    
-    # 重置文件指针
-    await file.seek(0)
+    # 流式写入临时文件（不把整个PDF读入内存）
+    staged = await run_in_threadpool(DocumentService.stage_upload, file.file)
 
     # 上传文档
-    doc = DocumentService.upload_document(
+    doc = await run_db(
+        DocumentService.upload_document,
         db=db,
         kb_id=kb_id,
-        file=file.file,
+        staged=staged,
         filename=file.filename,
-        file_size=file_size,
         content_type=file.content_type or "application/pdf"
     )
 
     return DocumentResponse.model_validate(doc)
 
 
+@router.post("/batch", response_model=DocumentBatchUploadResponse, status_code=201)
+async def upload_documents_batch(
+    kb_id: str = Query(..., description="知识库ID"),
+    files: List[UploadFile] = File(..., description="PDF文件列表"),
+    auto_sync: bool = Form(False, description="是否上传后直接创建增量同步任务"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db)
+):
+    """
+    批量上传文档到知识库（需要写权限）
+
+    - 一个multipart请求上传多个PDF，权限检查和知识库查询只做一次
+    - 文件逐个流式写入本地临时文件，所有文档记录在一个事务中创建
+    - 内容重复的文件被跳过并在skipped中返回
+    - auto_sync=true时同一事务中创建增量同步任务（携带document_ids）
+    """
+    logger.info(
+        "api_upload_documents_batch",
+        kb_id=kb_id,
+        file_count=len(files),
+        auto_sync=auto_sync,
+        user_id=current_user.id
+    )
+
+    # 检查写权限（使用只读连接：逐个写入临时文件期间不占用写连接）
+    await run_db(ensure_kb_permission, kb_id, current_user, PermissionType.WRITE, read_db)
+
+    if len(files) > settings.upload_batch_max_files:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多上传{settings.upload_batch_max_files}个文件"
+        )
+
+    # 先验证全部文件类型，避免写入一半后失败
+    invalid = [f.filename for f in files if not f.filename.lower().endswith('.pdf')]
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"只支持PDF文件: {', '.join(invalid)}"
+        )
+
+    # 逐个流式写入临时文件
+    uploads = []
+    try:
+        for f in files:
+            staged = await run_in_threadpool(DocumentService.stage_upload, f.file)
+            uploads.append((staged, f.filename))
+            await f.close()
+    except Exception:
+        for staged, _ in uploads:
+            DocumentService.discard_staged_upload(staged)
+        raise
+
+    docs, skipped, task = await run_db(
+        DocumentService.upload_documents,
+        db=db,
+        kb_id=kb_id,
+        uploads=uploads,
+        auto_sync=auto_sync
+    )
+
+    if task is not None:
+        # 唤醒内嵌Worker（独立Worker进程会通过轮询发现任务）
+        notify_new_task()
+
+    return DocumentBatchUploadResponse(
+        items=[DocumentResponse.model_validate(doc) for doc in docs],
+        skipped=[DocumentBatchSkippedItem(**item) for item in skipped],
+        sync_task_id=task.id if task else None
+    )
+
+
 @router.get("", response_model=DocumentListResponse)
-async def list_documents(
+def list_documents(
     kb_id: str = Query(..., description="知识库ID"),
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=100, description="每页数量"),
     status: str = Query(None, description="文档状态过滤"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     列出知识库中的文档（需要读权限）
@@ -92,7 +170,7 @@ async def list_documents(
     )
 
     # 检查读权限
-    check_kb_permission(kb_id, current_user, PermissionType.READ, db)
+    ensure_kb_permission(kb_id, current_user, PermissionType.READ, db)
 
     logger.info(
         "api_list_documents_old",
@@ -120,10 +198,10 @@ async def list_documents(
 
 
 @router.get("/{doc_id}", response_model=DocumentDetailResponse)
-async def get_document(
+def get_document(
     doc_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     获取文档详情（需要读权限）
@@ -136,7 +214,7 @@ async def get_document(
     doc = DocumentService.get_document(db, doc_id)
 
     # 检查读权限
-    check_kb_permission(doc.kb_id, current_user, PermissionType.READ, db)
+    ensure_kb_permission(doc.kb_id, current_user, PermissionType.READ, db)
 
     stats = DocumentService.get_document_stats(db, doc_id)
 
@@ -150,7 +228,7 @@ async def get_document(
 
 
 @router.delete("/{doc_id}", status_code=204)
-async def delete_document(
+def delete_document(
     doc_id: str,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -160,85 +238,63 @@ async def delete_document(
 
     - 检查用户是否有写权限
     - 软删除数据库记录
-    - 真删除S3文件
+    - 本地文件和chunks由删除任务在后台清理
+    - 向量删除记录为墓碑，由Worker异步批量删除
     """
     logger.info("api_delete_document", doc_id=doc_id, user_id=current_user.id)
 
     doc = DocumentService.get_document(db, doc_id)
 
     # 检查写权限
-    check_kb_permission(doc.kb_id, current_user, PermissionType.WRITE, db)
+    ensure_kb_permission(doc.kb_id, current_user, PermissionType.WRITE, db)
 
     DocumentService.delete_document(db, doc_id)
+
+    # 唤醒内嵌Worker执行清理
+    notify_new_task()
     return None
 
 
 @router.get("/{document_id}/images/{image_filename}")
-async def get_document_image(
+def get_document_image(
+    request: Request,
     document_id: str,
     image_filename: str,
+    variant: Optional[str] = Query(None, description="图片变体: thumb（缩略图） | webp"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     获取文档的图片（从本地文件系统，需要读权限）
 
-    - 检查用户是否有读权限
+    - 检查用户是否有读权限（权限决策缓存）
     - 图片存储在 markdowns/{document_id}/ 目录（与content.md同级）
-    - 返回图片二进制数据
+    - 支持ETag/If-None-Match（304）和Range请求
+    - variant可选择预生成的缩略图或WebP版本，不存在时返回原图
     """
-    from pathlib import Path
-    from fastapi.responses import FileResponse
-    from app.core.config import settings
-    from app.models.database import Document
-
-    logger.info(
-        "api_get_document_image",
-        document_id=document_id,
-        image_filename=image_filename,
-        user_id=current_user.id
-    )
-
-    # 1. 查询文档获取markdown路径
-    doc = db.query(Document).filter(Document.id == document_id).first()
-    if not doc or not doc.local_markdown_path:
+    # 1. 解析文档的知识库和图片目录（LRU缓存）
+    resolved = image_service.resolve_document(db, document_id)
+    if not resolved:
         logger.warning(
             "document_not_found",
             document_id=document_id
         )
         raise HTTPException(404, "Document not found")
 
-    # 2. 检查读权限
-    check_kb_permission(doc.kb_id, current_user, PermissionType.READ, db)
+    kb_id, markdown_dir = resolved
 
-    # 2. 构建图片路径（与markdown同目录）
-    markdown_dir = Path(doc.local_markdown_path).parent
-    image_path = markdown_dir / image_filename
+    # 2. 检查读权限（决策缓存命中时不访问数据库）
+    ensure_kb_permission(kb_id, current_user, PermissionType.READ, db)
 
-    # 3. 检查文件是否存在
-    if not image_path.exists():
+    # 3. 解析图片文件
+    image = image_service.get_image_file(markdown_dir, image_filename, variant)
+    if not image:
         logger.warning(
             "image_not_found",
             document_id=document_id,
-            image_filename=image_filename,
-            expected_path=str(image_path)
+            image_filename=image_filename
         )
         raise HTTPException(404, "Image not found")
 
-    # 4. 判断Content-Type
-    ext = image_filename.split('.')[-1].lower()
-    content_type_map = {
-        'png': 'image/png',
-        'jpg': 'image/jpeg',
-        'jpeg': 'image/jpeg',
-        'gif': 'image/gif',
-        'webp': 'image/webp'
-    }
-    content_type = content_type_map.get(ext, 'application/octet-stream')
-
-    # 5. 返回图片
-    return FileResponse(
-        image_path,
-        media_type=content_type,
-        headers={"Cache-Control": "public, max-age=86400"}
-    )
+    # 4. 返回图片（或304）
+    return image_response(request, image)
@@ -3,10 +3,17 @@
 """
 from fastapi import APIRouter, Depends, Query, HTTPException, status
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.core.logging import get_logger
 from app.core.dependencies import get_current_user
-from app.core.permissions import check_kb_permission, check_kb_ownership, can_view_kb, PermissionType
+from app.core.permissions import (
+    check_kb_permission,
+    ensure_kb_permission,
+    check_kb_ownership,
+    can_view_kb,
+    invalidate_kb_permissions,
+    PermissionType
+)
 from app.models.database import User, KnowledgeBase, KBPermission
 from app.models.schemas import (
     KnowledgeBaseCreate,
@@ -22,13 +29,14 @@ from app.models.schemas import (
     PaginationMeta
 )
 from app.services.knowledge_base_service import KnowledgeBaseService
+from app.workers.queue_worker import notify_new_task
 
 logger = get_logger(__name__)
 router = APIRouter()
 
 
 @router.post("", response_model=KnowledgeBaseResponse, status_code=201)
-async def create_knowledge_base(
+def create_knowledge_base(
     kb_data: KnowledgeBaseCreate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -48,11 +56,11 @@ async def create_knowledge_base(
 
 
 @router.get("", response_model=KnowledgeBaseListResponse)
-async def list_knowledge_bases(
+def list_knowledge_bases(
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=100, description="每页数量"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     列出知识库（需要登录，根据权限过滤）
@@ -81,10 +89,10 @@ async def list_knowledge_bases(
 
 
 @router.get("/{kb_id}", response_model=KnowledgeBaseDetailResponse)
-async def get_knowledge_base(
+def get_knowledge_base(
     kb_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     获取知识库详情（需要读权限）
@@ -108,7 +116,7 @@ async def get_knowledge_base(
 
 
 @router.patch("/{kb_id}", response_model=KnowledgeBaseResponse)
-async def update_knowledge_base(
+def update_knowledge_base(
     kb_id: str,
     kb_data: KnowledgeBaseUpdate,
     current_user: User = Depends(get_current_user),
@@ -124,14 +132,14 @@ async def update_knowledge_base(
     logger.info("api_update_knowledge_base", kb_id=kb_id, user_id=current_user.id)
 
     # 检查写权限
-    check_kb_permission(kb_id, current_user, PermissionType.WRITE, db)
+    ensure_kb_permission(kb_id, current_user, PermissionType.WRITE, db)
 
     kb = KnowledgeBaseService.update_knowledge_base(db, kb_id, kb_data)
     return KnowledgeBaseResponse.model_validate(kb)
 
 
 @router.delete("/{kb_id}", status_code=204)
-async def delete_knowledge_base(
+def delete_knowledge_base(
     kb_id: str,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -139,23 +147,25 @@ async def delete_knowledge_base(
     """
     删除知识库（仅所有者和管理员）
 
-    - 软删除数据库记录
-    - 真删除OpenSearch索引
-    - 级联删除所有关联数据（documents, chunks, tasks, queries）
+    - 软删除知识库和所有文档记录
+    - 创建删除任务，由Worker在后台删除OpenSearch索引、本地文件和chunks
     """
     logger.info("api_delete_knowledge_base", kb_id=kb_id, user_id=current_user.id)
 
     # 检查删除权限（仅所有者/管理员）
-    check_kb_permission(kb_id, current_user, PermissionType.DELETE, db)
+    ensure_kb_permission(kb_id, current_user, PermissionType.DELETE, db)
 
     KnowledgeBaseService.delete_knowledge_base(db, kb_id)
+
+    # 唤醒内嵌Worker执行清理
+    notify_new_task()
     return None
 
 
 # ============ 知识库权限管理API ============
 
 @router.put("/{kb_id}/visibility", response_model=KnowledgeBaseResponse, summary="修改知识库可见性")
-async def update_kb_visibility(
+def update_kb_visibility(
     kb_id: str,
     visibility_data: KBVisibilityUpdate,
     current_user: User = Depends(get_current_user),
@@ -178,14 +188,17 @@ async def update_kb_visibility(
     db.commit()
     db.refresh(kb)
 
+    # 可见性影响所有用户的权限决策
+    invalidate_kb_permissions(kb_id)
+
     return KnowledgeBaseResponse.model_validate(kb)
 
 
 @router.get("/{kb_id}/permissions", response_model=KBPermissionListResponse, summary="查看知识库权限列表")
-async def list_kb_permissions(
+def list_kb_permissions(
     kb_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     查看知识库的共享权限列表（仅所有者和管理员）
@@ -221,7 +234,7 @@ async def list_kb_permissions(
 
 
 @router.post("/{kb_id}/permissions", response_model=KBPermissionResponse, status_code=201, summary="添加知识库权限")
-async def add_kb_permission(
+def add_kb_permission(
     kb_id: str,
     perm_data: KBPermissionCreate,
     current_user: User = Depends(get_current_user),
@@ -259,6 +272,7 @@ async def add_kb_permission(
         existing.permission_type = perm_data.permission_type
         db.commit()
         db.refresh(existing)
+        invalidate_kb_permissions(kb_id, target_user.id)
         return KBPermissionResponse(
             id=existing.id,
             kb_id=existing.kb_id,
@@ -279,6 +293,7 @@ async def add_kb_permission(
     db.add(new_perm)
     db.commit()
     db.refresh(new_perm)
+    invalidate_kb_permissions(kb_id, target_user.id)
 
     return KBPermissionResponse(
         id=new_perm.id,
@@ -292,7 +307,7 @@ async def add_kb_permission(
 
 
 @router.delete("/{kb_id}/permissions/{user_id}", status_code=204, summary="移除知识库权限")
-async def remove_kb_permission(
+def remove_kb_permission(
     kb_id: str,
     user_id: int,
     current_user: User = Depends(get_current_user),
@@ -317,5 +332,6 @@ async def remove_kb_permission(
     if perm:
         db.delete(perm)
         db.commit()
+        invalidate_kb_permissions(kb_id, user_id)
 
     return None
@@ -2,28 +2,98 @@
 查询API路由
 智能问答接口
 """
+import asyncio
 import json
-from fastapi import APIRouter, Depends, Query
+from typing import AsyncGenerator, Dict, Optional
+
+from fastapi import APIRouter, Depends, Query, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.database import get_read_db, run_db
+from app.core.errors import ConversationNotFoundError
 from app.core.logging import get_logger
 from app.core.dependencies import get_current_user
-from app.core.permissions import check_kb_permission, PermissionType
+from app.core.permissions import ensure_kb_permission, PermissionType
 from app.models.database import User
+from app.models.schemas import BatchQueryRequest
+from app.services.conversation_service import conversation_service
 from app.services.query_service import query_service
 
 logger = get_logger(__name__)
 router = APIRouter()
 
+# 检查客户端是否断开的间隔（秒）
+DISCONNECT_POLL_SECONDS = 1.0
+
+
+class ClientDisconnected(Exception):
+    """客户端已断开连接"""
+
+
+async def _wait_for_disconnect(request: Request):
+    """轮询直到客户端断开连接"""
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+async def _until_disconnected(
+    request: Request,
+    events: AsyncGenerator[Dict, None]
+) -> AsyncGenerator[Dict, None]:
+    """
+    转发事件，客户端断开时立即取消正在等待的事件
+
+    取消会传递到查询执行器：停止排队中的Stage 1文档、关闭正在读取的Bedrock流并释放槽位。
+    不能只依赖StreamingResponse：它只在下一次发送失败时才发现断开，且不会关闭事件生成器。
+
+    Args:
+        request: 请求对象
+        events: 查询事件生成器
+
+    Yields:
+        查询事件
+
+    Raises:
+        ClientDisconnected: 客户端已断开
+    """
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(request))
+    next_event = None
+    try:
+        while True:
+            next_event = asyncio.ensure_future(events.__anext__())
+            await asyncio.wait({next_event, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+
+            if not next_event.done():
+                raise ClientDisconnected()
+
+            try:
+                event = next_event.result()
+            except StopAsyncIteration:
+                return
+            yield event
+    finally:
+        disconnect.cancel()
+        # 取消仍在等待的事件，CancelledError会在执行器内部传递并清理
+        if next_event is not None and not next_event.done():
+            next_event.cancel()
+            await asyncio.wait({next_event})
+        await events.aclose()
+
 
 @router.post("/stream")
 async def query_stream(
+    request: Request,
     kb_id: str = Query(..., description="知识库ID"),
     query: str = Query(..., min_length=1, max_length=1000, description="用户问题"),
+    deadline_seconds: Optional[int] = Query(
+        None, ge=30, le=3600, description="整体截止时间（秒），默认使用知识库设置或全局配置"
+    ),
+    conversation_id: Optional[str] = Query(
+        None, description="对话ID（多轮追问时复用之前检索和阅读的结果）"
+    ),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     流式问答接口（SSE，需要读权限）
@@ -33,6 +103,9 @@ async def query_stream(
     - 支持状态更新、文本增量、完成事件
     - Content-Type: text/event-stream
     - 记录查询历史（关联user_id）
+    - 客户端断开时取消查询（停止后续Bedrock调用）
+    - 按截止时间分配检索、Stage 1、Stage 2的预算，时间不足时减少文档数、缩短生成长度
+    - 传入conversation_id时作为追问：已有阅读结果足够时只生成答案，只阅读新检索到的文档
     """
     logger.info(
         "api_query_stream",
@@ -42,18 +115,28 @@ async def query_stream(
     )
 
     # 检查读权限
-    check_kb_permission(kb_id, current_user, PermissionType.READ, db)
+    await run_db(ensure_kb_permission, kb_id, current_user, PermissionType.READ, db)
+
+    # 对话必须属于当前用户和该知识库
+    if conversation_id:
+        conversation = await run_db(conversation_service.get_conversation, db, conversation_id, current_user.id)
+        if conversation.kb_id != kb_id:
+            raise ConversationNotFoundError(conversation_id)
 
     async def event_generator():
         """SSE事件生成器"""
+        events = query_service.execute_query_two_stage(
+            db=db,
+            kb_id=kb_id,
+            query_text=query,
+            user_id=current_user.id,
+            deadline_seconds=deadline_seconds,
+            conversation_id=conversation_id
+        )
+
         try:
-            # 使用新的Two-Stage执行器（传入user_id）
-            async for event in query_service.execute_query_two_stage(
-                db=db,
-                kb_id=kb_id,
-                query_text=query,
-                user_id=current_user.id
-            ):
+            # 使用新的Two-Stage执行器（传入user_id），客户端断开时取消执行
+            async for event in _until_disconnected(request, events):
                 # 构建SSE事件
                 event_type = event.get("type", "unknown")
 
@@ -64,6 +147,14 @@ async def query_stream(
                 yield f"event: {event_type}\n"
                 yield f"data: {event_data}\n\n"
 
+            # 发送一个完成事件，确保前端结束等待
+            yield f"event: done\n"
+            yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+
+        except ClientDisconnected:
+            logger.info("query_stream_client_disconnected", kb_id=kb_id, user_id=current_user.id)
+            return
+
         except Exception as e:
             logger.error(
                 "query_stream_error",
@@ -72,28 +163,15 @@ async def query_stream(
                 exc_info=True
             )
 
-            # 发送错误事件
-            try:
-                error_event = {
-                    "type": "error",
-                    "message": f"查询失败: {str(e)}"
-                }
-                yield f"event: error\n"
-                yield f"data: {json.dumps(error_event, ensure_ascii=False)}\n\n"
-            except Exception as inner_e:
-                logger.error("failed_to_send_error_event", error=str(inner_e))
-
-        finally:
-            # 确保流正确关闭
-            try:
-                # 发送一个完成事件
-                done_event = {
-                    "type": "done"
-                }
-                yield f"event: done\n"
-                yield f"data: {json.dumps(done_event, ensure_ascii=False)}\n\n"
-            except Exception:
-                pass  # 忽略关闭时的错误
+            # 发送错误事件和完成事件
+            error_event = {
+                "type": "error",
+                "message": f"查询失败: {str(e)}"
+            }
+            yield f"event: error\n"
+            yield f"data: {json.dumps(error_event, ensure_ascii=False)}\n\n"
+            yield f"event: done\n"
+            yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
 
     return StreamingResponse(
         event_generator(),
@@ -104,3 +182,66 @@ async def query_stream(
             "X-Accel-Buffering": "no"  # 禁用nginx缓冲
         }
     )
+
+
+@router.post("/batch")
+async def query_batch(
+    request: Request,
+    body: BatchQueryRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    批量问答接口（NDJSON流，需要读权限）
+
+    - 一次提交多个问题（如回归测试集），并发检索
+    - 按文档合并问题：同一文档的多个问题在一次Stage 1调用中回答，每个文档只读取约一次
+    - 问题涉及的文档都读完后立即生成该问题的答案，按完成顺序返回
+    - 每行一个JSON事件：plan / progress / answer / error / heartbeat / done
+    - 按后台优先级调度，不影响交互式查询
+    - Content-Type: application/x-ndjson
+    """
+    logger.info(
+        "api_query_batch",
+        kb_id=body.kb_id,
+        questions=len(body.questions),
+        user_id=current_user.id
+    )
+
+    # 检查读权限
+    await run_db(ensure_kb_permission, body.kb_id, current_user, PermissionType.READ, db)
+
+    async def event_generator():
+        """NDJSON事件生成器"""
+        events = query_service.execute_batch_query(
+            db=db,
+            kb_id=body.kb_id,
+            questions=body.questions,
+            user_id=current_user.id
+        )
+
+        try:
+            async for event in _until_disconnected(request, events):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+
+        except ClientDisconnected:
+            logger.info("query_batch_client_disconnected", kb_id=body.kb_id, user_id=current_user.id)
+            return
+
+        except Exception as e:
+            logger.error(
+                "query_batch_error",
+                kb_id=body.kb_id,
+                error=str(e),
+                exc_info=True
+            )
+            yield json.dumps({"type": "error", "message": f"批量查询失败: {str(e)}"}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 禁用nginx缓冲
+        }
+    )
@@ -1,11 +1,10 @@
 """
 同步任务API路由
 """
-import asyncio
-from fastapi import APIRouter, Depends, Query, BackgroundTasks
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.core.logging import get_logger
 from app.models.schemas import (
     SyncTaskCreate,
@@ -14,26 +13,26 @@ from app.models.schemas import (
     PaginationMeta
 )
 from app.services.task_service import task_service
-from app.workers.sync_worker import sync_worker
+from app.workers.queue_worker import notify_new_task
 
 logger = get_logger(__name__)
 router = APIRouter()
 
 
 @router.post("", response_model=SyncTaskResponse, status_code=201)
-async def create_sync_task(
+def create_sync_task(
     task_data: SyncTaskCreate,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
     创建同步任务
 
-    - 创建任务记录
-    - 在后台异步执行处理流程
+    - 创建任务记录（写入持久化任务队列）
+    - 由同步Worker租用并执行处理流程
     - 任务类型：
       - full_sync: 同步知识库中所有uploaded状态的文档
-      - incremental: 同步指定的文档
+      - incremental: 同步指定的文档（合并到该知识库尚未开始的增量任务）
+    - 同一知识库的任务由Worker依次执行
     """
     logger.info(
         "api_create_sync_task",
@@ -49,11 +48,8 @@ async def create_sync_task(
         document_ids=task_data.document_ids
     )
 
-    # 添加后台任务
-    background_tasks.add_task(
-        sync_worker.process_sync_task_sync,
-        task.id
-    )
+    # 唤醒内嵌Worker（独立Worker进程会通过轮询发现任务）
+    notify_new_task()
 
     # 计算进度
     progress = 0
@@ -78,11 +74,11 @@ async def create_sync_task(
 
 
 @router.get("", response_model=SyncTaskListResponse)
-async def list_sync_tasks(
+def list_sync_tasks(
     kb_id: str = Query(..., description="知识库ID"),
     status: str = Query(None, description="过滤状态"),
     limit: int = Query(10, ge=1, le=50, description="返回数量"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     列出同步任务
@@ -139,9 +135,9 @@ async def list_sync_tasks(
 
 
 @router.get("/{task_id}", response_model=SyncTaskResponse)
-async def get_sync_task(
+def get_sync_task(
     task_id: str,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     获取同步任务详情
@@ -183,7 +179,7 @@ async def get_sync_task(
 
 
 @router.delete("/{task_id}", status_code=204)
-async def cancel_sync_task(
+def cancel_sync_task(
     task_id: str,
     db: Session = Depends(get_db)
 ):
@@ -4,9 +4,10 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.core.security import get_password_hash
-from app.core.dependencies import require_admin
+from app.core.dependencies import require_admin, invalidate_cached_user
+from app.core.permissions import invalidate_user_permissions
 from app.models.database import User
 from app.models.schemas import UserCreate, UserResponse, UserListResponse
 
@@ -14,8 +15,8 @@ router = APIRouter()
 
 
 @router.get("", response_model=UserListResponse, summary="获取用户列表")
-async def list_users(
-    db: Session = Depends(get_db),
+def list_users(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(require_admin)
 ):
     """
@@ -32,7 +33,7 @@ async def list_users(
 
 
 @router.post("", response_model=UserResponse, summary="创建普通用户", status_code=status.HTTP_201_CREATED)
-async def create_user(
+def create_user(
     request: UserCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin)
@@ -72,9 +73,9 @@ async def create_user(
 
 
 @router.get("/{user_id}", response_model=UserResponse, summary="获取用户详情")
-async def get_user(
+def get_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(require_admin)
 ):
     """
@@ -99,7 +100,7 @@ async def get_user(
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT, summary="删除用户")
-async def delete_user(
+def delete_user(
     user_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin)
@@ -137,4 +138,8 @@ async def delete_user(
     db.delete(user)
     db.commit()
 
+    # 清除该用户的认证缓存
+    invalidate_cached_user(user_id)
+    invalidate_user_permissions(user_id)
+
     return None
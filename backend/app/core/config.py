@@ -3,7 +3,7 @@
 使用pydantic-settings管理配置
 """
 import os
-from typing import Optional
+from typing import Dict, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -41,9 +41,13 @@ class Settings(BaseSettings):
 
     # 本地存储配置
     data_dir: str = "./data"
+    upload_batch_max_files: int = 500  # 批量上传单次请求的最大文件数
 
     # 数据库配置
     database_path: str = "./data/ask-prd.db"
+    db_executor_workers: int = 8  # async代码中数据库访问专用线程池大小
+    db_read_pool_size: int = 8  # 只读连接数（写连接固定为1个）
+    db_pool_timeout_seconds: float = 30.0  # 等待连接的超时时间
 
     # 缓存配置
     cache_dir: str = "./data/cache"
@@ -54,11 +58,96 @@ class Settings(BaseSettings):
     api_port: int = 8000
     debug: bool = False
     log_level: str = "INFO"
+    log_max_string_length: int = 2000  # 日志字符串值的最大长度（0表示不截断）
+    log_max_collection_items: int = 20  # 日志列表/字典值的最大条目数（0表示不截断）
+    log_sample_rates: Dict[str, float] = {}  # 按事件名采样，如{"stage1_response_full": 0.1}
+
+    # 图片服务配置
+    image_cache_size: int = 4096  # 文档/chunk路径解析的缓存条目数
+    image_cache_ttl_seconds: int = 300  # 路径解析缓存时间
+    image_cache_max_age_seconds: int = 86400  # 浏览器缓存时间（Cache-Control max-age）
+    image_variants_enabled: bool = True  # 转换时是否预生成缩略图/WebP变体
+    image_variant_quality: int = 80  # WebP变体质量
 
     # 查询配置
     max_retrieval_docs: int = 20  # 检索的最大文档数
     stage1_concurrency: int = 5  # Stage 1文档处理的最大并发数
 
+    # 查询截止时间与分阶段预算（请求参数 > 知识库设置 > 全局默认）
+    query_deadline_seconds: float = 600.0  # 默认整体截止时间
+    query_retrieval_budget_ratio: float = 0.1  # 检索阶段最多占用的比例
+    query_stage2_budget_ratio: float = 0.3  # 为Stage 2预留的比例（Stage 1使用其余时间）
+    query_stage2_min_seconds: float = 20.0  # Stage 2的最短时间（Stage 1超时后也保证能生成答案）
+    query_stage1_expected_seconds: float = 90.0  # 没有耗时样本时单个Stage 1调用的预估耗时
+    query_output_tokens_per_second: float = 40.0  # 估算的生成速度，用于按剩余时间削减max_tokens
+
+    # Stage 1对冲请求配置（单个文档耗时超过近期分位数时再发一个相同请求，取先完成的结果）
+    stage1_hedge_enabled: bool = False  # 是否启用对冲请求
+    stage1_hedge_percentile: float = 0.9  # 触发对冲的耗时分位
+    stage1_hedge_min_samples: int = 20  # 样本不足时不对冲
+    stage1_hedge_max_rate: float = 0.1  # 对冲请求占Stage 1调用的最大比例
+    stage1_hedge_model_id: Optional[str] = None  # 对冲请求使用的模型/推理配置文件（默认与主请求相同）
+    stage1_hedge_region: Optional[str] = None  # 对冲请求使用的区域（默认与主请求相同）
+
+    # 文档摘要配置（同步时生成，查询时Stage 1不再重复生成文档总结）
+    document_summary_enabled: bool = True  # 同步时是否生成文档摘要
+    document_summary_max_input_chars: int = 150000  # 生成摘要时输入的最大字符数
+    document_summary_max_tokens: int = 2000  # 摘要的最大生成token数
+
+    # 文档级路由配置（先在文档级索引中粗筛候选文档，再在候选文档内检索chunks）
+    document_routing_enabled: bool = True  # 是否启用两级路由
+    document_routing_candidates: int = 15  # 文档级kNN返回的候选文档数
+
+    # 相关性预筛配置（用小模型根据标题大纲和命中片段判断文档是否相关，只有相关文档进入Stage 1全文阅读）
+    relevance_gate_enabled: bool = False  # 知识库未单独设置时的默认值
+    relevance_gate_model_id: str = "global.anthropic.claude-haiku-4-5-20251001-v1:0"
+    relevance_gate_max_chunks: int = 5  # 每个文档提供给预筛模型的命中片段数
+    relevance_gate_max_chars: int = 8000  # 每个文档预筛输入（大纲+片段）的最大字符数
+    relevance_gate_timeout_seconds: float = 30.0  # 单个文档预筛超时，超时视为相关
+
+    # 多轮对话配置（追问时复用已有的Stage 1结果，只阅读新文档）
+    conversation_check_model_id: str = "global.anthropic.claude-haiku-4-5-20251001-v1:0"  # 判断已有结果是否足以回答追问
+    conversation_check_max_chars: int = 16000  # 提供给判断模型的已有结果最大字符数
+    conversation_check_timeout_seconds: float = 30.0  # 判断超时，超时时重新阅读文档
+    conversation_history_turns: int = 3  # 检索和Stage 2提示词中附带的最近轮数
+    conversation_history_answer_chars: int = 2000  # 每轮历史答案的最大字符数
+
+    # 批量查询配置（回归测试等多问题场景：按文档合并问题，一次Stage 1调用回答同一文档的多个问题）
+    batch_questions_per_call: int = 4  # 每次Stage 1调用合并的最大问题数
+    batch_retrieval_concurrency: int = 8  # 并发检索的问题数
+    batch_stage1_max_tokens: int = 16000  # 合并调用的最大输出token数（多个问题共享）
+    batch_stage1_timeout_seconds: float = 600.0  # 合并调用的超时
+
+    # 重试与熔断配置（查询链路上的Bedrock / OpenSearch调用）
+    retry_max_attempts: int = 3  # 可重试错误的最大尝试次数（不可重试错误不重试）
+    retry_base_delay_seconds: float = 1.0  # 退避基准时间（指数增长，带随机抖动）
+    retry_max_delay_seconds: float = 10.0  # 单次退避的最长等待（限流响应的Retry-After除外）
+    circuit_failure_threshold: int = 5  # 连续失败次数达到该值时熔断
+    circuit_recovery_seconds: float = 30.0  # 熔断后多久放行一个试探请求
+
+    # 调度配置（交互式查询优先于后台同步）
+    scheduler_bedrock_slots: int = 8  # Bedrock并发调用槽位总数（查询与同步共享）
+    scheduler_thread_slots: int = 32  # 调度线程池容量
+    scheduler_cpu_slots: int = 1  # CPU密集型任务（Marker转换）的并发数
+    scheduler_interactive_reserved_slots: int = 2  # 为交互式请求预留的槽位，后台任务不可占用
+    query_p95_budget_seconds: float = 120.0  # 查询p95延迟预算，超出时后台同步在文档间让出
+    scheduler_max_yield_seconds: float = 60.0  # 后台任务单次让出的最长等待时间
+    bulk_sync_threshold: int = 20  # 文档数达到该值的同步任务按bulk类别调度
+
+    # 同步任务队列配置
+    sync_embedded_worker: bool = True  # API进程内是否运行内嵌Worker（生产环境建议关闭并单独运行 python -m app.workers.queue_worker）
+    sync_lease_seconds: int = 300  # 任务租约时长，超时未续约的任务可被其他Worker接管
+    sync_heartbeat_interval_seconds: int = 30  # Worker心跳（续约）间隔
+    sync_poll_interval_seconds: float = 5.0  # 队列为空时的轮询间隔
+    sync_max_attempts: int = 3  # 租约过期后的最大接管次数，超出则标记任务失败
+
+    # 索引/文件清理配置
+    index_gc_batch_size: int = 100  # 单次delete_by_query删除的文档数
+    gc_concurrency: int = 8  # 删除任务并行删除本地文件的线程数
+    index_gc_retry_seconds: int = 60  # 删除未确认的墓碑重试间隔
+    index_gc_interval_seconds: float = 30.0  # 向量清理线程的运行间隔（独立于同步任务，长时间同步期间也会清理）
+    index_gc_confirmed_retention_seconds: int = 86400  # 已确认墓碑的保留时间，超出后删除记录
+
     # Marker配置
     marker_use_gpu: bool = True
 
@@ -67,6 +156,13 @@ class Settings(BaseSettings):
     jwt_algorithm: str = "HS256"
     jwt_access_token_expire_days: int = 7
 
+    # 认证缓存配置
+    auth_cache_size: int = 10000  # 用户快照/权限决策缓存条目数
+    user_cache_ttl_seconds: int = 30  # 用户快照（启用状态、角色）缓存时间
+    permission_cache_ttl_seconds: int = 30  # 知识库权限决策缓存时间
+    token_cache_size: int = 10000  # 已验证JWT的缓存条目数（条目在令牌过期时失效）
+    password_hash_workers: int = 2  # bcrypt专用线程池大小（限制登录风暴占用的CPU）
+
     @property
     def JWT_SECRET_KEY(self) -> str:
         """JWT密钥（大写属性，兼容security.py）"""
@@ -1,44 +1,111 @@
 """
 数据库连接和会话管理
 """
+import asyncio
+import functools
 import os
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import QueuePool
 from app.core.config import settings
 from app.models.database import Base
 
 
 # 创建数据库引擎
-# 使用SQLite的WAL模式提升并发性能
+# SQLite同一时刻只允许一个写事务：写引擎只有一个连接，所有写入在此串行；
+# 读引擎有多个只读连接，WAL模式下读不阻塞写，也不被写阻塞
+# 注意：写Session第一次执行SQL时占用写连接，直到commit/rollback/close才归还。
+# 不要在持有写连接时等待网络、文件或模型调用；写入前的读取（权限检查、存在性检查）使用只读Session，
+# 或在长时间I/O之前先rollback归还连接
 engine = create_engine(
     settings.database_url,
     connect_args={
         "check_same_thread": False,  # 允许多线程
         "timeout": 30.0,  # 锁超时30秒
     },
-    poolclass=StaticPool,  # SQLite使用StaticPool
+    poolclass=QueuePool,
+    pool_size=1,  # 单个写连接
+    max_overflow=0,
+    pool_timeout=settings.db_pool_timeout_seconds,
     echo=settings.debug,  # debug模式下打印SQL
 )
 
+read_engine = create_engine(
+    settings.database_url,
+    connect_args={
+        "check_same_thread": False,
+        "timeout": 30.0,
+    },
+    poolclass=QueuePool,
+    pool_size=settings.db_read_pool_size,
+    max_overflow=0,
+    pool_timeout=settings.db_pool_timeout_seconds,
+    echo=settings.debug,
+)
 
-# 启用WAL模式和其他性能优化
-@event.listens_for(engine, "connect")
-def set_sqlite_pragma(dbapi_conn, connection_record):
-    """设置SQLite性能优化参数"""
-    cursor = dbapi_conn.cursor()
-    cursor.execute("PRAGMA journal_mode=WAL")  # 启用WAL
+
+def _apply_common_pragmas(cursor):
+    """读写连接共用的性能参数"""
     cursor.execute("PRAGMA synchronous=NORMAL")  # 平衡性能和安全
     cursor.execute("PRAGMA cache_size=-64000")  # 64MB缓存
     cursor.execute("PRAGMA temp_store=MEMORY")  # 临时表在内存
     cursor.execute("PRAGMA mmap_size=268435456")  # 256MB内存映射
     cursor.execute("PRAGMA foreign_keys=ON")  # 启用外键约束
+
+
+# 启用WAL模式和其他性能优化
+@event.listens_for(engine, "connect")
+def set_sqlite_pragma(dbapi_conn, connection_record):
+    """设置SQLite性能优化参数（写连接）"""
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")  # 启用WAL
+    _apply_common_pragmas(cursor)
+    cursor.close()
+
+
+@event.listens_for(read_engine, "connect")
+def set_sqlite_read_pragma(dbapi_conn, connection_record):
+    """设置SQLite性能优化参数（只读连接）"""
+    cursor = dbapi_conn.cursor()
+    _apply_common_pragmas(cursor)
+    cursor.execute("PRAGMA query_only=ON")  # 防止误写
     cursor.close()
 
 
 # 创建Session工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 只读Session工厂（列表、详情、权限检查、查询流水线）
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+
+# 数据库专用线程池：async代码中的同步数据库访问在此执行，不阻塞事件循环
+_db_executor = ThreadPoolExecutor(
+    max_workers=settings.db_executor_workers,
+    thread_name_prefix="db"
+)
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    在数据库线程池中执行同步数据库操作
+
+    用于async路由和查询流水线，避免同步Session查询阻塞驱动SSE流的事件循环。
+    同一个Session不能被并发使用，调用方需保证对同一Session的run_db调用是串行的
+
+    Args:
+        func: 同步函数（通常接收Session参数）
+
+    Returns:
+        函数返回值
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _db_executor,
+        functools.partial(func, *args, **kwargs)
+    )
+
 
 def init_db():
     """初始化数据库，创建所有表"""
@@ -54,7 +121,7 @@ def init_db():
 
 def get_db() -> Session:
     """
-    获取数据库会话
+    获取数据库会话（写连接）
     用于FastAPI依赖注入
     """
     db = SessionLocal()
@@ -62,3 +129,15 @@ def get_db() -> Session:
         yield db
     finally:
         db.close()
+
+
+def get_read_db() -> Session:
+    """
+    获取只读数据库会话（读连接池）
+    用于只读接口的FastAPI依赖注入，不占用写连接
+    """
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,58 @@
+"""
+查询截止时间
+整体截止时间在查询开始时确定，检索、Stage 1、Stage 2按比例分配预算，
+各阶段的超时和生成长度都从剩余时间推算，而不是各自使用固定的超时
+"""
+import time
+from typing import Optional
+
+
+class Deadline:
+    """截止时间（基于单调时钟）"""
+
+    def __init__(self, seconds: float):
+        """
+        初始化截止时间
+
+        Args:
+            seconds: 从现在起的可用时间（秒）
+        """
+        self.total = seconds
+        self._expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """剩余时间（秒，不小于0）"""
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        """已用时间（秒）"""
+        return self.total - (self._expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """是否已过期"""
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """
+        用于单次调用的超时：剩余时间，不超过cap
+
+        Args:
+            cap: 单次调用的超时上限
+
+        Returns:
+            超时秒数
+        """
+        remaining = self.remaining()
+        return min(remaining, cap) if cap is not None else remaining
+
+    def child(self, seconds: float) -> "Deadline":
+        """
+        子阶段截止时间（不晚于当前截止时间）
+
+        Args:
+            seconds: 子阶段预算
+
+        Returns:
+            新的Deadline
+        """
+        return Deadline(min(seconds, self.remaining()))
@@ -6,24 +6,64 @@ from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import get_read_db, run_db
 from app.core.security import decode_access_token
 from app.models.database import User
+from app.utils.cache import TTLCache
 
 # HTTP Bearer认证
 security = HTTPBearer()
 
+# 用户快照缓存：user_id → 启用用户的列值（不缓存对象本身，每个请求构造独立的User）
+_user_cache = TTLCache(
+    maxsize=settings.auth_cache_size,
+    ttl_seconds=settings.user_cache_ttl_seconds
+)
+_USER_FIELDS = [column.name for column in User.__table__.columns]
+
+
+def _get_active_user(db: Session, user_id: int) -> Optional[User]:
+    """查询启用状态的用户（在数据库线程池中执行）"""
+    return db.query(User).filter(User.id == user_id, User.is_active == True).first()
+
+
+async def _load_active_user(db: Session, user_id: int) -> Optional[User]:
+    """
+    获取启用状态的用户（优先使用快照缓存，命中时不访问数据库）
+
+    返回的User是未绑定会话的对象，只用于读取属性；需要修改时在写会话中重新加载。
+    """
+    snapshot = _user_cache.get(user_id)
+    if snapshot is not None:
+        return User(**snapshot)
+
+    user = await run_db(_get_active_user, db, user_id)
+    if user is not None:
+        _user_cache.set(user_id, {field: getattr(user, field) for field in _USER_FIELDS})
+    return user
+
+
+def invalidate_cached_user(user_id: int):
+    """
+    使用户快照缓存失效（修改密码、删除用户等操作后调用）
+
+    Args:
+        user_id: 用户ID
+    """
+    _user_cache.pop(user_id)
+
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ) -> User:
     """
     获取当前登录用户
 
     Args:
         credentials: HTTP Bearer认证凭据
-        db: 数据库会话
+        db: 只读数据库会话（返回的User不能在写会话中直接修改）
 
     Returns:
         User: 当前用户对象
@@ -61,9 +101,9 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    # 查询用户
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None or not user.is_active:
+    # 查询用户（快照缓存未命中时在数据库线程池中查询）
+    user = await _load_active_user(db, user_id)
+    if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found or inactive",
@@ -96,7 +136,7 @@ async def require_admin(current_user: User = Depends(get_current_user)) -> User:
 
 async def get_current_user_optional(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ) -> Optional[User]:
     """
     获取当前用户（可选）
@@ -126,5 +166,4 @@ async def get_current_user_optional(
     except (ValueError, TypeError):
         return None
 
-    user = db.query(User).filter(User.id == user_id, User.is_active == True).first()
-    return user
+    return await _load_active_user(db, user_id)
@@ -74,6 +74,18 @@ class DocumentNotFoundError(ASKPRDException):
         )
 
 
+class DocumentAlreadyExistsError(ASKPRDException):
+    """文档已存在（同一知识库内内容重复）"""
+
+    def __init__(self, filename: str, existing_doc_id: str):
+        super().__init__(
+            error_code="2002",
+            message=f"知识库中已存在相同内容的文档: {filename}",
+            details={"filename": filename, "existing_document_id": existing_doc_id},
+            status_code=409
+        )
+
+
 class FileUploadError(ASKPRDException):
     """文件上传失败"""
 
@@ -138,6 +150,30 @@ class QueryExecutionError(ASKPRDException):
         )
 
 
+class DeadlineExceededError(ASKPRDException):
+    """查询超出截止时间"""
+
+    def __init__(self, stage: str, deadline_seconds: float):
+        super().__init__(
+            error_code="4002",
+            message=f"查询超时（{stage}阶段，截止时间{int(deadline_seconds)}秒）",
+            details={"stage": stage, "deadline_seconds": deadline_seconds},
+            status_code=504
+        )
+
+
+class ConversationNotFoundError(ASKPRDException):
+    """对话不存在"""
+
+    def __init__(self, conversation_id: str):
+        super().__init__(
+            error_code="4020",
+            message=f"对话不存在: {conversation_id}",
+            details={"conversation_id": conversation_id},
+            status_code=404
+        )
+
+
 class BedrockAPIError(ASKPRDException):
     """Bedrock API调用失败"""
 
@@ -164,6 +200,20 @@ class DatabaseError(ASKPRDException):
         )
 
 
+class CircuitOpenError(ASKPRDException):
+    """依赖服务熔断中（快速失败）"""
+
+    def __init__(self, service: str, retry_after: float):
+        super().__init__(
+            error_code="9020",
+            message=f"{service}服务暂时不可用，请{int(retry_after) + 1}秒后重试",
+            details={"service": service, "retry_after_seconds": round(retry_after, 1)},
+            status_code=503
+        )
+        self.service = service
+        self.retry_after = retry_after
+
+
 class ConfigurationError(ASKPRDException):
     """配置错误"""
 
@@ -0,0 +1,106 @@
+"""
+对冲请求策略
+调用耗时超过近期分位数时再发一个相同请求，取先完成的结果，用于降低扇出调用的尾延迟。
+对冲请求数受全局比例上限约束，避免在整体变慢时成倍放大负载
+"""
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from app.core.config import settings
+from app.core.scheduler import LatencyWindow
+
+
+class HedgePolicy:
+    """对冲策略（线程安全，进程内共享）"""
+
+    def __init__(self, name: str, window_size: int = 200):
+        """
+        初始化对冲策略
+
+        Args:
+            name: 策略名称（用于日志和指标）
+            window_size: 延迟和对冲比例的滑动窗口大小
+        """
+        self.name = name
+        self._latency = LatencyWindow(size=window_size)
+        self._hedged: Deque[bool] = deque(maxlen=window_size)  # 最近的调用是否发出了对冲请求
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """
+        记录主请求耗时（主请求被对冲请求取代时记录取消时的已耗时）
+
+        Args:
+            seconds: 耗时
+        """
+        self._latency.record(seconds)
+
+    def latency(self, p: float) -> Optional[float]:
+        """
+        近期主请求耗时的分位数（用于按截止时间规划Stage 1）
+
+        Args:
+            p: 分位（0-1）
+
+        Returns:
+            分位数值，没有样本时返回None
+        """
+        return self._latency.percentile(p)
+
+    def delay(self) -> Optional[float]:
+        """
+        发出对冲请求前的等待时间
+
+        Returns:
+            近期耗时的分位数；未启用或样本不足时返回None（不对冲）
+        """
+        if not settings.stage1_hedge_enabled:
+            return None
+        if self._latency.count() < settings.stage1_hedge_min_samples:
+            return None
+        return self._latency.percentile(settings.stage1_hedge_percentile)
+
+    def start_call(self):
+        """登记一次调用（用于计算对冲比例）"""
+        with self._lock:
+            self._hedged.append(False)
+
+    def try_hedge(self) -> bool:
+        """
+        申请发出一个对冲请求（窗口内对冲比例不超过上限）
+
+        Returns:
+            是否允许对冲
+        """
+        with self._lock:
+            hedged = sum(self._hedged)
+            if hedged + 1 > settings.stage1_hedge_max_rate * len(self._hedged):
+                return False
+
+            # 标记最近一次未对冲的调用（窗口只用于计数，不关心具体是哪一次）
+            for index in range(len(self._hedged) - 1, -1, -1):
+                if not self._hedged[index]:
+                    self._hedged[index] = True
+                    break
+            return True
+
+    def stats(self) -> Dict:
+        """对冲策略状态（样本数、当前对冲阈值、窗口内对冲比例）"""
+        with self._lock:
+            calls = len(self._hedged)
+            hedged = sum(self._hedged)
+        threshold = self.delay()
+
+        return {
+            "enabled": settings.stage1_hedge_enabled,
+            "samples": self._latency.count(),
+            "threshold_seconds": round(threshold, 3) if threshold is not None else None,
+            "window_calls": calls,
+            "window_hedge_rate": round(hedged / calls, 3) if calls else 0.0,
+            "max_rate": settings.stage1_hedge_max_rate,
+        }
+
+
+# 全局实例（Stage 1文档调用共享）
+stage1_hedge_policy = HedgePolicy("stage1")
@@ -1,12 +1,118 @@
 """
 结构化日志配置
 使用structlog
+
+热点路径的日志开销控制（在filter_by_level之后统一执行）：
+- lazy(): 延迟计算的日志值，事件被级别过滤或采样丢弃时不会计算
+- 采样：事件参数_sample=0.1或配置log_sample_rates按事件名采样
+- 截断：超长字符串和集合按log_max_string_length/log_max_collection_items截断
 """
 import logging
+import random
 import sys
+from typing import Any, Callable
 import structlog
 from app.core.config import settings
 
+# 事件参数：本条日志的采样率（0~1）
+SAMPLE_KEY = "_sample"
+
+
+class lazy:
+    """
+    延迟计算的日志值
+
+    用法：logger.debug("event", images=lazy(lambda: [...]))
+    只有事件通过级别过滤和采样后才会调用func。
+    """
+
+    __slots__ = ("func", "args", "kwargs")
+
+    def __init__(self, func: Callable[..., Any], *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def resolve(self) -> Any:
+        """计算实际值（计算失败时返回错误描述，不影响业务）"""
+        try:
+            return self.func(*self.args, **self.kwargs)
+        except Exception as e:
+            return f"<lazy failed: {e!r}>"
+
+
+def sample_events(logger, method_name: str, event_dict: dict) -> dict:
+    """按事件参数或配置的采样率丢弃事件（warning及以上级别不采样）"""
+    rate = event_dict.pop(SAMPLE_KEY, None)
+    if method_name in ("warning", "error", "critical", "exception"):
+        return event_dict
+
+    if rate is None:
+        rate = settings.log_sample_rates.get(event_dict.get("event"))
+    if rate is not None and rate < 1.0 and random.random() >= rate:
+        raise structlog.DropEvent
+
+    if rate is not None and rate < 1.0:
+        event_dict["sample_rate"] = rate
+    return event_dict
+
+
+def resolve_lazy_values(logger, method_name: str, event_dict: dict) -> dict:
+    """计算lazy()包装的日志值"""
+    for key, value in event_dict.items():
+        if isinstance(value, lazy):
+            event_dict[key] = value.resolve()
+    return event_dict
+
+
+def _truncate(value: Any, max_length: int, max_items: int, depth: int = 0) -> Any:
+    """递归截断字符串和集合（超过3层的嵌套只保留类型描述）"""
+    if isinstance(value, str):
+        if max_length and len(value) > max_length:
+            return f"{value[:max_length]}...(+{len(value) - max_length} chars)"
+        return value
+
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+
+    if isinstance(value, (list, tuple, set, frozenset, dict)):
+        if depth >= 3:
+            return f"<{type(value).__name__} of {len(value)}>"
+
+        if isinstance(value, dict):
+            items = list(value.items())
+            kept = items[:max_items] if max_items else items
+            result = {
+                key: _truncate(item, max_length, max_items, depth + 1)
+                for key, item in kept
+            }
+            if len(items) > len(kept):
+                result["..."] = f"+{len(items) - len(kept)} items"
+            return result
+
+        items = list(value)
+        kept = items[:max_items] if max_items else items
+        result = [_truncate(item, max_length, max_items, depth + 1) for item in kept]
+        if len(items) > len(kept):
+            result.append(f"...(+{len(items) - len(kept)} items)")
+        return result
+
+    return value
+
+
+def truncate_values(logger, method_name: str, event_dict: dict) -> dict:
+    """截断超长的日志值，避免JSON渲染多MB的字符串"""
+    max_length = settings.log_max_string_length
+    max_items = settings.log_max_collection_items
+    if not max_length and not max_items:
+        return event_dict
+
+    for key, value in event_dict.items():
+        if key == "event":
+            continue
+        event_dict[key] = _truncate(value, max_length, max_items)
+    return event_dict
+
 
 def setup_logging():
     """配置结构化日志"""
@@ -21,6 +127,9 @@ def setup_logging():
     structlog.configure(
         processors=[
             structlog.stdlib.filter_by_level,
+            sample_events,
+            resolve_lazy_values,
+            truncate_values,
             structlog.stdlib.add_logger_name,
             structlog.stdlib.add_log_level,
             structlog.stdlib.PositionalArgumentsFormatter(),
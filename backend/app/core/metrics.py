@@ -0,0 +1,42 @@
+"""
+进程内运行指标
+简单的线程安全计数器，通过/api/v1/metrics查询（进程重启后清零）
+"""
+import threading
+from collections import defaultdict
+from typing import Dict
+
+
+class Metrics:
+    """计数器集合"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+
+    def increment(self, name: str, value: float = 1):
+        """
+        计数器累加
+
+        Args:
+            name: 指标名（snake_case）
+            value: 增量
+        """
+        if not value:
+            return
+        with self._lock:
+            self._counters[name] += value
+
+    def get(self, name: str) -> float:
+        """读取单个计数器"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, float]:
+        """所有计数器的当前值"""
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+
+# 全局实例
+metrics = Metrics()
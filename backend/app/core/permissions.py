@@ -3,9 +3,19 @@
 包括知识库可见性和权限验证
 """
 from enum import Enum
+from typing import Optional
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
+from app.core.config import settings
 from app.models.database import KnowledgeBase, KBPermission, User
+from app.utils.cache import TTLCache
+
+# 权限决策缓存：(user_id, kb_id, permission) → _ALLOW 或 (status_code, detail)
+_decision_cache = TTLCache(
+    maxsize=settings.auth_cache_size,
+    ttl_seconds=settings.permission_cache_ttl_seconds
+)
+_ALLOW = True
 
 
 class KBVisibility(str, Enum):
@@ -39,6 +49,9 @@ def check_kb_permission(
     5. public：所有人只读，除非明确授予write权限
     6. shared：根据权限表检查
 
+    每次都查询数据库，并把结果写入决策缓存；只需要判断是否有权限、
+    不需要知识库对象时使用ensure_kb_permission（优先读缓存）。
+
     Args:
         kb_id: 知识库ID
         user: 当前用户
@@ -51,21 +64,99 @@ def check_kb_permission(
     Raises:
         HTTPException: 403/404（无权限或不存在）
     """
-    # 查询知识库
-    kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
-    if not kb:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Knowledge base not found"
-        )
+    key = (user.id, kb_id, PermissionType(required_permission).value)
+
+    try:
+        # 查询知识库
+        kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
+        if not kb:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Knowledge base not found"
+            )
+
+        _check_kb_access(kb, user, required_permission, db)
+
+    except HTTPException as e:
+        _decision_cache.set(key, (e.status_code, e.detail))
+        raise
+
+    _decision_cache.set(key, _ALLOW)
+    return kb
+
+
+def ensure_kb_permission(
+    kb_id: str,
+    user: User,
+    required_permission: PermissionType,
+    db: Session
+):
+    """
+    检查用户对知识库的权限（优先使用决策缓存，命中时不访问数据库）
+
+    决策缓存是进程内的，权限变更时由修改接口主动失效；多进程部署时
+    其他进程最多在permission_cache_ttl_seconds秒后生效。
+
+    Args:
+        kb_id: 知识库ID
+        user: 当前用户
+        required_permission: 需要的权限（read/write/delete）
+        db: 数据库会话
+
+    Raises:
+        HTTPException: 403/404（无权限或不存在）
+    """
+    decision = _decision_cache.get((user.id, kb_id, PermissionType(required_permission).value))
+    if decision is None:
+        check_kb_permission(kb_id, user, required_permission, db)
+        return
+
+    if decision is not _ALLOW:
+        status_code, detail = decision
+        raise HTTPException(status_code=status_code, detail=detail)
+
+
+def invalidate_kb_permissions(kb_id: str, user_id: Optional[int] = None):
+    """
+    使知识库的权限决策缓存失效
+
+    Args:
+        kb_id: 知识库ID
+        user_id: 仅失效该用户的决策（可选，默认失效所有用户）
+    """
+    _decision_cache.invalidate(
+        lambda key, value: key[1] == kb_id and (user_id is None or key[0] == user_id)
+    )
+
+
+def invalidate_user_permissions(user_id: int):
+    """
+    使用户的权限决策缓存失效（删除用户时调用）
+
+    用户拥有的知识库随用户级联删除，其他用户对这些知识库的决策也一并清空。
+
+    Args:
+        user_id: 用户ID
+    """
+    _decision_cache.clear()
+
+
+def _check_kb_access(
+    kb: KnowledgeBase,
+    user: User,
+    required_permission: PermissionType,
+    db: Session
+):
+    """按权限规则检查已加载的知识库，无权限时抛出HTTPException"""
+    kb_id = kb.id
 
     # 1. 管理员拥有所有权限
     if user.role == "admin":
-        return kb
+        return
 
     # 2. 所有者拥有所有权限
     if kb.owner_id == user.id:
-        return kb
+        return
 
     # 3. 删除权限：仅所有者（管理员已在步骤1返回）
     if required_permission == PermissionType.DELETE:
@@ -85,7 +176,7 @@ def check_kb_permission(
     elif kb.visibility == KBVisibility.PUBLIC:
         # 公开知识库：所有人只读
         if required_permission == PermissionType.READ:
-            return kb
+            return
         else:  # WRITE权限
             # 检查是否有明确授予的写权限
             perm = db.query(KBPermission).filter(
@@ -93,7 +184,7 @@ def check_kb_permission(
                 KBPermission.user_id == user.id
             ).first()
             if perm and perm.permission_type == "write":
-                return kb
+                return
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Write permission required"
@@ -113,10 +204,10 @@ def check_kb_permission(
 
         # 检查权限类型
         if required_permission == PermissionType.READ:
-            return kb  # read或write权限都可以读
+            return  # read或write权限都可以读
         elif required_permission == PermissionType.WRITE:
             if perm.permission_type == "write":
-                return kb
+                return
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Write permission required"
@@ -0,0 +1,387 @@
+"""
+重试与熔断
+Bedrock / OpenSearch调用的错误分类（临时错误 / 限流 / 不可重试）、带随机抖动的指数退避，
+以及按依赖服务划分的熔断器：连续失败后直接快速失败，不再让每个查询都去等待已经降级的服务
+"""
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+from enum import Enum
+from typing import Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+import botocore.exceptions
+import urllib3.exceptions
+from opensearchpy import exceptions as opensearch_exceptions
+
+from app.core.config import settings
+from app.core.deadline import Deadline
+from app.core.errors import CircuitOpenError, DeadlineExceededError
+from app.core.logging import get_logger
+from app.core.metrics import metrics
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class ErrorKind(str, Enum):
+    """错误类别"""
+    TRANSIENT = "transient"        # 网络错误、超时、5xx，可以重试
+    THROTTLED = "throttled"        # 限流（429 / ThrottlingException），退避更久后重试
+    FATAL = "fatal"                # 参数错误、文件不存在、请求过大、无法识别的错误等，重试不会成功
+    CIRCUIT_OPEN = "circuit_open"  # 依赖服务熔断中，快速失败
+    DEADLINE_EXCEEDED = "deadline_exceeded"  # 查询超出截止时间
+
+
+# AWS错误码分类（其余4xx视为不可重试）
+_THROTTLE_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceQuotaExceededException",
+    "RequestLimitExceeded",
+    "SlowDown",
+}
+_TRANSIENT_CODES = {
+    "ServiceUnavailableException",
+    "InternalServerException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+    "RequestTimeout",
+    "RequestTimeoutException",
+}
+
+# 限流响应Retry-After的上限（秒），避免一次退避等待过久
+MAX_RETRY_AFTER_SECONDS = 60.0
+
+
+def _error_chain(exc: BaseException) -> Iterator[BaseException]:
+    """
+    沿异常链遍历（BedrockAPIError等包装异常的原始错误在__cause__/__context__中）
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen and len(seen) < 5:
+        seen.add(id(exc))
+        yield exc
+        exc = exc.__cause__ or exc.__context__
+
+
+def _classify_single(exc: BaseException) -> Optional[ErrorKind]:
+    """分类单个异常，无法判断时返回None"""
+    if isinstance(exc, CircuitOpenError):
+        return ErrorKind.CIRCUIT_OPEN
+    if isinstance(exc, DeadlineExceededError):
+        return ErrorKind.DEADLINE_EXCEEDED
+
+    if isinstance(exc, botocore.exceptions.ClientError):
+        code = exc.response.get("Error", {}).get("Code", "")
+        status = exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        if code in _THROTTLE_CODES or status == 429:
+            return ErrorKind.THROTTLED
+        if code in _TRANSIENT_CODES or status >= 500:
+            return ErrorKind.TRANSIENT
+        return ErrorKind.FATAL
+
+    if isinstance(exc, (botocore.exceptions.ConnectionError, botocore.exceptions.HTTPClientError)):
+        return ErrorKind.TRANSIENT
+    if isinstance(exc, botocore.exceptions.ParamValidationError):
+        return ErrorKind.FATAL
+
+    # 读取Bedrock流式响应时，连接中断/读超时以urllib3异常直接抛出
+    if isinstance(exc, urllib3.exceptions.HTTPError):
+        return ErrorKind.TRANSIENT
+
+    # OpenSearch：ConnectionError/ConnectionTimeout没有HTTP状态码
+    if isinstance(exc, opensearch_exceptions.ConnectionError):
+        return ErrorKind.TRANSIENT
+    if isinstance(exc, opensearch_exceptions.TransportError):
+        status = exc.status_code if isinstance(exc.status_code, int) else 0
+        if status == 429:
+            return ErrorKind.THROTTLED
+        if status >= 500:
+            return ErrorKind.TRANSIENT
+        return ErrorKind.FATAL
+
+    if isinstance(exc, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return ErrorKind.TRANSIENT
+    if isinstance(exc, (FileNotFoundError, PermissionError, ValueError, KeyError, TypeError, IndexError)):
+        return ErrorKind.FATAL
+
+    return None
+
+
+def classify_error(exc: BaseException) -> ErrorKind:
+    """
+    错误分类
+
+    Args:
+        exc: 异常
+
+    Returns:
+        错误类别。只有已知的网络/服务端错误是临时错误；无法识别的错误（通常是代码缺陷）
+        按不可重试处理，既不重试也不计入熔断，避免一个代码错误让所有用户的请求都被熔断
+    """
+    for error in _error_chain(exc):
+        kind = _classify_single(error)
+        if kind is not None:
+            return kind
+    return ErrorKind.FATAL
+
+
+def retry_after_hint(exc: BaseException) -> Optional[float]:
+    """
+    读取限流响应中的Retry-After（秒）
+
+    Args:
+        exc: 异常
+
+    Returns:
+        建议等待时间，没有时返回None
+    """
+    for error in _error_chain(exc):
+        if isinstance(error, CircuitOpenError):
+            return error.retry_after
+        if isinstance(error, botocore.exceptions.ClientError):
+            headers = error.response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+            value = headers.get("retry-after") or headers.get("x-amzn-retry-after")
+            try:
+                return min(float(value), MAX_RETRY_AFTER_SECONDS) if value else None
+            except ValueError:
+                return None
+    return None
+
+
+def backoff_delay(attempt: int, kind: ErrorKind, retry_after: Optional[float] = None) -> float:
+    """
+    退避时间：指数增长 + 完全随机抖动，限流时加倍并至少等待Retry-After
+
+    Args:
+        attempt: 已失败的次数（从1开始）
+        kind: 错误类别
+        retry_after: 服务端建议的等待时间
+
+    Returns:
+        等待秒数
+    """
+    ceiling = settings.retry_base_delay_seconds * (2 ** (attempt - 1))
+    if kind == ErrorKind.THROTTLED:
+        ceiling *= 2
+    delay = random.uniform(0, min(ceiling, settings.retry_max_delay_seconds))
+
+    if retry_after:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def describe_failure(exc: BaseException) -> Dict:
+    """
+    失败原因（用于SSE错误事件，告诉前端是快速失败还是重试后失败）
+
+    Args:
+        exc: 异常
+
+    Returns:
+        {"reason": 错误类别, "retry_after_seconds": 建议等待时间（可选）}
+    """
+    result = {"reason": classify_error(exc).value}
+    retry_after = retry_after_hint(exc)
+    if retry_after is not None:
+        result["retry_after_seconds"] = round(retry_after, 1)
+    return result
+
+
+class CircuitBreaker:
+    """
+    熔断器（线程安全，API进程内按依赖服务共享）
+
+    - closed: 正常放行，连续临时错误/限流达到阈值后熔断
+    - open: 直接抛出CircuitOpenError，recovery时间后转为half_open
+    - half_open: 只放行一个试探请求，成功则恢复，失败则重新熔断
+
+    不可重试错误（参数错误等）说明服务本身有响应，不计入失败；无法识别的错误多为代码缺陷，同样不计入。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, service: str):
+        """
+        初始化熔断器
+
+        Args:
+            name: 名称（用于日志和指标）
+            service: 服务显示名（用于错误信息）
+        """
+        self.name = name
+        self.service = service
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_call(self):
+        """
+        调用前检查
+
+        Raises:
+            CircuitOpenError: 熔断中
+        """
+        with self._lock:
+            if self._state == self.OPEN:
+                remaining = settings.circuit_recovery_seconds - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    metrics.increment(f"circuit_{self.name}_rejected")
+                    raise CircuitOpenError(self.service, remaining)
+                self._state = self.HALF_OPEN
+                logger.info("circuit_half_open", circuit=self.name)
+
+            if self._state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    metrics.increment(f"circuit_{self.name}_rejected")
+                    raise CircuitOpenError(self.service, 1.0)
+                self._probe_in_flight = True
+
+    def record_success(self):
+        """记录成功调用"""
+        with self._lock:
+            self._probe_in_flight = False
+            self._failures = 0
+            if self._state != self.CLOSED:
+                self._state = self.CLOSED
+                logger.info("circuit_closed", circuit=self.name)
+
+    def record_failure(self, exc: BaseException):
+        """
+        记录失败调用
+
+        Args:
+            exc: 异常
+        """
+        kind = classify_error(exc)
+        if kind not in (ErrorKind.TRANSIENT, ErrorKind.THROTTLED):
+            # 服务有响应（或请求根本没有发出），不影响熔断状态
+            with self._lock:
+                self._probe_in_flight = False
+            return
+
+        with self._lock:
+            self._probe_in_flight = False
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._failures >= settings.circuit_failure_threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                metrics.increment(f"circuit_{self.name}_opened")
+                logger.warning(
+                    "circuit_opened",
+                    circuit=self.name,
+                    consecutive_failures=self._failures,
+                    error_kind=kind.value,
+                    error=str(exc)
+                )
+
+    def release(self):
+        """调用被取消（没有结果），释放试探名额"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    @contextmanager
+    def protect(self):
+        """
+        包装一次调用（同步和异步代码中都可以使用）
+
+        Raises:
+            CircuitOpenError: 熔断中
+        """
+        self.before_call()
+        try:
+            yield
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        else:
+            self.record_success()
+
+    def stats(self) -> Dict:
+        """熔断器状态"""
+        with self._lock:
+            state = self._state
+            remaining = 0.0
+            if state == self.OPEN:
+                remaining = max(0.0, settings.circuit_recovery_seconds - (time.monotonic() - self._opened_at))
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "retry_after_seconds": round(remaining, 1),
+            }
+
+
+async def retry_async(
+    func: Callable[[], Awaitable[T]],
+    operation: str,
+    breaker: Optional[CircuitBreaker] = None,
+    max_attempts: Optional[int] = None,
+    deadline: Optional[Deadline] = None
+) -> T:
+    """
+    按错误类别重试异步调用
+
+    不可重试错误和熔断立即抛出；临时错误和限流按退避时间重试，
+    退避后已经超过截止时间时不再重试。
+
+    Args:
+        func: 无参数的异步函数（每次尝试调用一次）
+        operation: 操作名称（日志用）
+        breaker: 熔断器（为空时不经过熔断器）
+        max_attempts: 最大尝试次数，默认retry_max_attempts
+        deadline: 截止时间
+
+    Returns:
+        函数返回值
+    """
+    attempts = max_attempts or settings.retry_max_attempts
+
+    for attempt in range(1, attempts + 1):
+        try:
+            if breaker is None:
+                return await func()
+            with breaker.protect():
+                return await func()
+
+        except Exception as e:
+            kind = classify_error(e)
+            delay = backoff_delay(attempt, kind, retry_after_hint(e))
+
+            out_of_time = deadline is not None and delay >= deadline.remaining()
+            if kind not in (ErrorKind.TRANSIENT, ErrorKind.THROTTLED) or attempt >= attempts or out_of_time:
+                logger.warning(
+                    "retry_giving_up",
+                    operation=operation,
+                    attempt=attempt,
+                    error_kind=kind.value,
+                    out_of_time=out_of_time,
+                    error=str(e)
+                )
+                raise
+            metrics.increment("retries")
+            logger.warning(
+                "retrying_after_error",
+                operation=operation,
+                attempt=attempt,
+                error_kind=kind.value,
+                delay_seconds=round(delay, 2),
+                error=str(e)
+            )
+            await asyncio.sleep(delay)
+
+
+# 全局熔断器（按依赖服务）
+bedrock_breaker = CircuitBreaker("bedrock", "Bedrock")
+opensearch_breaker = CircuitBreaker("opensearch", "OpenSearch")
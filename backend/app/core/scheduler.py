@@ -0,0 +1,356 @@
+"""
+优先级调度器
+区分交互式查询与后台同步负载，Bedrock槽位、线程池和CPU密集型转换优先分配给交互式请求
+"""
+import asyncio
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from enum import Enum
+from typing import Deque, Dict, Optional
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class WorkClass(str, Enum):
+    """工作负载类别（按优先级从高到低）"""
+    INTERACTIVE = "interactive"  # 交互式查询
+    BACKGROUND = "background"    # 后台增量同步
+    BULK = "bulk"                # 大批量全量同步
+
+
+# 优先级顺序
+PRIORITY_ORDER = [WorkClass.INTERACTIVE, WorkClass.BACKGROUND, WorkClass.BULK]
+
+
+class LatencyWindow:
+    """滑动窗口延迟统计（线程安全）"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """记录一次耗时"""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count(self) -> int:
+        """样本数量"""
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        计算分位数
+
+        Args:
+            p: 分位（0-1）
+
+        Returns:
+            分位数值，没有样本时返回None
+        """
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class _Waiter:
+    """等待槽位的请求（支持asyncio和线程两种等待方式）"""
+
+    def __init__(self, work_class: WorkClass, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.work_class = work_class
+        self.loop = loop
+        self.granted = False
+        self.future = loop.create_future() if loop else None
+        self.event = None if loop else threading.Event()
+
+    def grant(self):
+        """授予槽位（调用方持有锁）"""
+        self.granted = True
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(self._resolve)
+        else:
+            self.event.set()
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class PrioritySlots:
+    """
+    带优先级的计数信号量
+    跨线程、跨事件循环共享；交互式请求可使用全部槽位，后台请求不能占用预留槽位
+    """
+
+    def __init__(self, name: str, capacity: int, reserved: int = 0):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.reserved = min(max(0, reserved), self.capacity - 1)
+        self._lock = threading.Lock()
+        self._in_use: Dict[WorkClass, int] = {wc: 0 for wc in WorkClass}
+        self._waiters: Dict[WorkClass, Deque[_Waiter]] = {wc: deque() for wc in WorkClass}
+
+    def _limit(self, work_class: WorkClass) -> int:
+        if work_class == WorkClass.INTERACTIVE:
+            return self.capacity
+        return self.capacity - self.reserved
+
+    def _total_in_use(self) -> int:
+        return sum(self._in_use.values())
+
+    def _has_priority_waiters(self, work_class: WorkClass) -> bool:
+        """是否有同级或更高优先级的请求在排队"""
+        for wc in PRIORITY_ORDER:
+            if self._waiters[wc]:
+                return True
+            if wc == work_class:
+                return False
+        return False
+
+    def _try_acquire(self, work_class: WorkClass) -> bool:
+        if self._has_priority_waiters(work_class):
+            return False
+        if self._total_in_use() >= self._limit(work_class):
+            return False
+        self._in_use[work_class] += 1
+        return True
+
+    def _dispatch(self):
+        """按优先级把空闲槽位分配给等待者（调用方持有锁）"""
+        for wc in PRIORITY_ORDER:
+            queue = self._waiters[wc]
+            while queue and self._total_in_use() < self._limit(wc):
+                waiter = queue.popleft()
+                self._in_use[wc] += 1
+                waiter.grant()
+            if queue:
+                # 高优先级仍在排队时，不把槽位让给低优先级
+                break
+
+    async def acquire(self, work_class: WorkClass):
+        """异步获取槽位"""
+        with self._lock:
+            if self._try_acquire(work_class):
+                return
+            waiter = _Waiter(work_class, asyncio.get_running_loop())
+            self._waiters[work_class].append(waiter)
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters[work_class].remove(waiter)
+            if granted:
+                self.release(work_class)
+            raise
+
+    def acquire_sync(self, work_class: WorkClass):
+        """同步（阻塞当前线程）获取槽位"""
+        with self._lock:
+            if self._try_acquire(work_class):
+                return
+            waiter = _Waiter(work_class)
+            self._waiters[work_class].append(waiter)
+
+        waiter.event.wait()
+
+    def release(self, work_class: WorkClass):
+        """释放槽位"""
+        with self._lock:
+            self._in_use[work_class] = max(0, self._in_use[work_class] - 1)
+            self._dispatch()
+
+    def waiting(self, work_class: WorkClass) -> int:
+        """指定类别的排队数量"""
+        with self._lock:
+            return len(self._waiters[work_class])
+
+    def stats(self) -> Dict:
+        """槽位使用情况"""
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "reserved_for_interactive": self.reserved,
+                "in_use": {wc.value: n for wc, n in self._in_use.items()},
+                "queue_depth": {wc.value: len(q) for wc, q in self._waiters.items()},
+            }
+
+
+class PriorityScheduler:
+    """
+    进程内调度层
+
+    - bedrock: Bedrock调用并发槽位
+    - threads: 调度线程池容量
+    - cpu: CPU密集型任务（Marker转换）
+    """
+
+    # 后台任务让出时的轮询间隔（秒）
+    YIELD_POLL_INTERVAL = 0.5
+
+    def __init__(self):
+        reserved = settings.scheduler_interactive_reserved_slots
+        self._resources: Dict[str, PrioritySlots] = {
+            "bedrock": PrioritySlots("bedrock", settings.scheduler_bedrock_slots, reserved),
+            "threads": PrioritySlots("threads", settings.scheduler_thread_slots, reserved),
+            "cpu": PrioritySlots("cpu", settings.scheduler_cpu_slots, 0),
+        }
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.scheduler_thread_slots,
+            thread_name_prefix="scheduler"
+        )
+        self._interactive_latency = LatencyWindow()
+        self._active_interactive = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def classify_sync_task(task_type: str, document_count: int) -> WorkClass:
+        """
+        根据任务类型和规模划分同步任务类别
+
+        Args:
+            task_type: 任务类型
+            document_count: 文档数量
+
+        Returns:
+            WorkClass
+        """
+        if task_type == "full_sync" or document_count >= settings.bulk_sync_threshold:
+            return WorkClass.BULK
+        return WorkClass.BACKGROUND
+
+    @asynccontextmanager
+    async def slot(self, resource: str, work_class: WorkClass):
+        """异步占用资源槽位"""
+        slots = self._resources[resource]
+        await slots.acquire(work_class)
+        try:
+            yield
+        finally:
+            slots.release(work_class)
+
+    @contextmanager
+    def slot_sync(self, resource: str, work_class: WorkClass):
+        """同步占用资源槽位（用于Worker线程中的阻塞调用）"""
+        slots = self._resources[resource]
+        slots.acquire_sync(work_class)
+        try:
+            yield
+        finally:
+            slots.release(work_class)
+
+    async def run_in_thread(self, work_class: WorkClass, func, *args, **kwargs):
+        """
+        在调度线程池中执行阻塞函数，线程容量按优先级分配
+
+        Args:
+            work_class: 工作负载类别
+            func: 阻塞函数
+
+        Returns:
+            函数返回值
+        """
+        async with self.slot("threads", work_class):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor,
+                functools.partial(func, *args, **kwargs)
+            )
+
+    @asynccontextmanager
+    async def interactive_request(self):
+        """标记一次交互式请求，记录端到端耗时用于p95预算"""
+        with self._lock:
+            self._active_interactive += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._interactive_latency.record(time.monotonic() - start)
+            with self._lock:
+                self._active_interactive -= 1
+
+    def interactive_p95(self) -> Optional[float]:
+        """最近交互式请求的p95耗时"""
+        return self._interactive_latency.percentile(0.95)
+
+    def _should_yield(self, work_class: WorkClass) -> bool:
+        with self._lock:
+            active = self._active_interactive
+        if active == 0:
+            return False
+
+        # bulk任务：有交互式请求在进行就让出
+        if work_class == WorkClass.BULK:
+            return True
+
+        # background任务：交互式请求在排队，或p95超出预算时让出
+        if any(r.waiting(WorkClass.INTERACTIVE) for r in self._resources.values()):
+            return True
+        p95 = self.interactive_p95()
+        return p95 is not None and p95 > settings.query_p95_budget_seconds
+
+    async def yield_point(self, work_class: WorkClass):
+        """
+        后台任务的让出点（在文档之间调用，不抢占正在处理的文档）
+        最长等待scheduler_max_yield_seconds，避免后台任务饿死
+
+        Args:
+            work_class: 工作负载类别
+        """
+        if work_class == WorkClass.INTERACTIVE:
+            return
+
+        start = time.monotonic()
+        while self._should_yield(work_class):
+            if time.monotonic() - start >= settings.scheduler_max_yield_seconds:
+                logger.info("scheduler_yield_timeout", work_class=work_class.value)
+                break
+            await asyncio.sleep(self.YIELD_POLL_INTERVAL)
+
+        waited = time.monotonic() - start
+        if waited >= self.YIELD_POLL_INTERVAL:
+            logger.info(
+                "scheduler_yielded",
+                work_class=work_class.value,
+                waited_seconds=round(waited, 2)
+            )
+
+    def stats(self) -> Dict:
+        """调度器状态（各类别队列深度、槽位占用、交互式延迟）"""
+        resources = {name: slots.stats() for name, slots in self._resources.items()}
+        queue_depth = {
+            wc.value: sum(r["queue_depth"][wc.value] for r in resources.values())
+            for wc in WorkClass
+        }
+        with self._lock:
+            active = self._active_interactive
+        p95 = self.interactive_p95()
+
+        return {
+            "queue_depth": queue_depth,
+            "resources": resources,
+            "interactive": {
+                "active": active,
+                "samples": self._interactive_latency.count(),
+                "p95_seconds": round(p95, 3) if p95 is not None else None,
+                "p95_budget_seconds": settings.query_p95_budget_seconds,
+            },
+        }
+
+
+# 全局调度器实例
+scheduler = PriorityScheduler()
@@ -2,15 +2,29 @@
 安全相关工具
 包括JWT认证和密码哈希
 """
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from app.core.config import settings
+from app.utils.cache import TTLCache
 
 # 密码哈希上下文（使用bcrypt）
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt专用线程池：单次计算约250ms，线程数即并发上限，
+# 登录风暴只会在此排队，不占用事件循环和默认线程池
+_password_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers,
+    thread_name_prefix="bcrypt"
+)
+
+# 已验证令牌缓存：token → claims，条目存活到令牌的exp为止
+_token_cache = TTLCache(maxsize=settings.token_cache_size)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
@@ -39,6 +53,37 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    验证密码（在bcrypt线程池中执行，不阻塞事件循环）
+
+    Args:
+        plain_password: 明文密码
+        hashed_password: 哈希后的密码
+
+    Returns:
+        bool: 密码是否匹配
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _password_executor, verify_password, plain_password, hashed_password
+    )
+
+
+async def get_password_hash_async(password: str) -> str:
+    """
+    生成密码哈希（在bcrypt线程池中执行，不阻塞事件循环）
+
+    Args:
+        password: 明文密码
+
+    Returns:
+        str: 哈希后的密码
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, get_password_hash, password)
+
+
 def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
     """
     创建JWT访问令牌
@@ -70,14 +115,32 @@ def decode_access_token(token: str) -> Optional[Dict[str, Any]]:
     """
     解码JWT访问令牌
 
+    验证通过的令牌缓存到exp为止，同一令牌的后续请求不再重复验签；
+    验证失败的令牌不缓存。
+
     Args:
         token: JWT令牌
 
     Returns:
         Optional[Dict]: 解码后的数据，如果失败返回None
     """
+    cached = _token_cache.get(token)
+    if cached is not None:
+        # 双重检查exp（缓存TTL基于单调时钟，这里以墙钟为准）
+        if cached.get("exp", 0) > time.time():
+            return dict(cached)
+        _token_cache.pop(token)
+
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
-        return payload
     except JWTError:
         return None
+
+    # 没有exp的令牌不缓存（无法确定失效时间）
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        remaining = exp - time.time()
+        if remaining > 0:
+            _token_cache.set(token, dict(payload), ttl_seconds=remaining)
+
+    return payload
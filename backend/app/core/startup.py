@@ -0,0 +1,142 @@
+"""
+启动耗时报告
+记录API启动期间每个模块的导入耗时，启动时输出日志并通过/api/v1/debug/startup查询
+"""
+import importlib.machinery
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+# 不应出现在API进程中的重型模块（只在同步Worker转换PDF时需要）
+HEAVY_MODULES = ("torch", "marker", "transformers")
+
+# 每个模块一个实例的文件加载器（可以安全地修改实例的exec_module）
+_FILE_LOADERS = (
+    importlib.machinery.SourceFileLoader,
+    importlib.machinery.SourcelessFileLoader,
+    importlib.machinery.ExtensionFileLoader,
+)
+
+
+class _ImportTimingFinder:
+    """
+    meta_path查找器：不负责查找，只为文件加载器的exec_module计时
+
+    只修改本次导入创建的加载器实例，停止计时后恢复。
+    """
+
+    def __init__(self, profiler: "ImportProfiler"):
+        self.profiler = profiler
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            loader = spec.loader
+            if isinstance(loader, _FILE_LOADERS):
+                self.profiler._wrap_loader(name, loader)
+            return spec
+        return None
+
+
+class ImportProfiler:
+    """模块导入计时器"""
+
+    def __init__(self):
+        self._finder = _ImportTimingFinder(self)
+        self._lock = threading.Lock()
+        self._stack: List[List[float]] = []  # [开始时间, 子模块耗时]
+        self._modules: Dict[str, Dict[str, float]] = {}
+        self._wrapped = []
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._modules_before = 0
+        self._modules_after: Optional[int] = None
+
+    def start(self):
+        """开始记录导入耗时（在main模块最开始调用）"""
+        if self._started_at is not None:
+            return
+        self._started_at = time.perf_counter()
+        self._modules_before = len(sys.modules)
+        sys.meta_path.insert(0, self._finder)
+
+    def stop(self):
+        """停止记录并恢复加载器"""
+        if self._started_at is None or self._finished_at is not None:
+            return
+        self._finished_at = time.perf_counter()
+        self._modules_after = len(sys.modules)
+        try:
+            sys.meta_path.remove(self._finder)
+        except ValueError:
+            pass
+        for loader in self._wrapped:
+            loader.__dict__.pop("exec_module", None)
+        self._wrapped.clear()
+
+    def _wrap_loader(self, name: str, loader):
+        """为加载器实例的exec_module计时（包含耗时和不含子模块的自身耗时）"""
+        original = loader.exec_module
+        profiler = self
+
+        def exec_module(module):
+            # 只记录主线程的导入，避免并发导入打乱计时栈
+            if threading.current_thread() is not threading.main_thread():
+                return original(module)
+
+            frame = [time.perf_counter(), 0.0]
+            profiler._stack.append(frame)
+            try:
+                return original(module)
+            finally:
+                profiler._stack.pop()
+                total = time.perf_counter() - frame[0]
+                if profiler._stack:
+                    profiler._stack[-1][1] += total
+                with profiler._lock:
+                    profiler._modules[name] = {
+                        "total_ms": round(total * 1000, 2),
+                        "self_ms": round((total - frame[1]) * 1000, 2),
+                    }
+
+        loader.exec_module = exec_module
+        self._wrapped.append(loader)
+
+    def report(self, limit: int = 20) -> dict:
+        """
+        启动耗时报告
+
+        Args:
+            limit: 返回自身耗时最高的模块数
+
+        Returns:
+            包含总耗时、导入模块数、最慢模块和已加载重型模块的字典
+        """
+        if self._started_at is None:
+            return {"enabled": False}
+
+        end = self._finished_at or time.perf_counter()
+        modules_after = self._modules_after or len(sys.modules)
+        with self._lock:
+            modules = sorted(
+                ({"module": name, **timing} for name, timing in self._modules.items()),
+                key=lambda item: item["self_ms"],
+                reverse=True
+            )
+
+        return {
+            "enabled": True,
+            "import_seconds": round(end - self._started_at, 3),
+            "modules_imported": modules_after - self._modules_before,
+            "slowest_modules": modules[:limit],
+            "heavy_modules_loaded": [name for name in HEAVY_MODULES if name in sys.modules],
+        }
+
+
+# 全局实例
+import_profiler = ImportProfiler()
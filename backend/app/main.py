@@ -2,6 +2,11 @@
 FastAPI主应用
 ASK-PRD API服务
 """
+from app.core.startup import import_profiler
+
+# 记录启动期间的模块导入耗时（需在导入其他模块之前开始）
+import_profiler.start()
+
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse
@@ -10,6 +15,7 @@ from app.core.config import settings
 from app.core.logging import setup_logging, get_logger
 from app.core.database import init_db
 from app.core.errors import ASKPRDException
+from app.workers.queue_worker import start_embedded_worker, stop_embedded_worker
 from app.api.v1 import api_router
 
 # 设置日志
@@ -23,6 +29,12 @@ async def lifespan(app: FastAPI):
     # 启动时执行
     logger.info("app_starting", version="1.0.0", debug=settings.debug)
 
+    # 输出启动耗时报告（模块导入耗时、是否误加载了重型模块）
+    startup_report = import_profiler.report(limit=10)
+    logger.info("startup_report", **startup_report)
+    if startup_report.get("heavy_modules_loaded"):
+        logger.warning("heavy_modules_loaded_in_api", modules=startup_report["heavy_modules_loaded"])
+
     # 初始化数据库
     try:
         init_db()
@@ -31,9 +43,16 @@ async def lifespan(app: FastAPI):
         logger.error("database_init_failed", error=str(e))
         raise
 
+    # 启动内嵌同步Worker（生产环境可关闭，改为独立运行Worker进程）
+    if settings.sync_embedded_worker:
+        start_embedded_worker()
+        logger.info("embedded_sync_worker_started")
+
     yield
 
     # 关闭时执行
+    if settings.sync_embedded_worker:
+        stop_embedded_worker()
     logger.info("app_shutdown")
 
 
@@ -128,6 +147,9 @@ async def root():
 # 挂载API路由
 app.include_router(api_router, prefix="/api/v1")
 
+# 应用模块导入完成
+import_profiler.stop()
+
 
 if __name__ == "__main__":
     import uvicorn
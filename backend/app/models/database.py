@@ -5,7 +5,7 @@ SQLAlchemy数据库模型
 from datetime import datetime
 from typing import Optional
 from sqlalchemy import (
-    Column, String, Integer, Text, DateTime, ForeignKey, Index, Boolean
+    Column, String, Integer, Text, DateTime, ForeignKey, Index, Boolean, LargeBinary
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
@@ -30,6 +30,7 @@ class User(Base):
     owned_kbs = relationship("KnowledgeBase", back_populates="owner", cascade="all, delete-orphan")
     kb_permissions = relationship("KBPermission", back_populates="user", foreign_keys="KBPermission.user_id", cascade="all, delete-orphan")
     query_history = relationship("QueryHistory", back_populates="user", cascade="all, delete-orphan")
+    conversations = relationship("Conversation", back_populates="user", cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<User(id={self.id}, username={self.username}, role={self.role})>"
@@ -52,6 +53,8 @@ class KnowledgeBase(Base):
     status = Column(String, nullable=False, default="active")  # active | deleted
     owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)  # 所有者
     visibility = Column(String(20), nullable=False, default="private")  # private | public | shared
+    relevance_gate_enabled = Column(Boolean)  # 是否启用相关性预筛，为空时使用全局配置
+    query_deadline_seconds = Column(Integer)  # 查询默认截止时间（秒），为空时使用全局配置
     created_at = Column(DateTime, nullable=False, server_default=func.now())
     updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
 
@@ -83,8 +86,12 @@ class Document(Base):
     local_markdown_path = Column(String)  # 本地原始Markdown路径: data/documents/markdowns/{document_id}/content.md
     local_text_markdown_path = Column(String)  # 本地纯文本Markdown路径: data/documents/text_markdowns/{document_id}.md
     file_size = Column(Integer)  # 文件大小（字节）
+    content_hash = Column(String(64))  # 文件内容SHA-256，用于知识库内去重
     page_count = Column(Integer)  # PDF页数
+    summary = Column(Text)  # 与问题无关的结构化文档摘要（同步时生成，Markdown格式）
+    outline = Column(Text)  # 标题大纲（同步时提取，与摘要一起用于文档级路由索引）
     status = Column(String, nullable=False, default="uploaded")  # uploaded | processing | completed | failed
+    ingest_stage = Column(String)  # 最近完成的处理阶段（断点续跑）: converted | described | summarized | chunked | embedded | indexed
     error_message = Column(Text)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
     updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
@@ -101,6 +108,7 @@ class Document(Base):
 Index("idx_documents_kb_id", Document.kb_id)
 Index("idx_documents_status", Document.status)
 Index("idx_documents_filename", Document.filename)
+Index("idx_documents_kb_hash", Document.kb_id, Document.content_hash)
 
 
 class Chunk(Base):
@@ -129,6 +137,7 @@ class Chunk(Base):
     image_height = Column(Integer)  # 图片高度（像素）
 
     token_count = Column(Integer)  # content_with_context的token数量
+    embedding = Column(LargeBinary)  # 已生成的向量（float32打包），索引失败后重试无需重新向量化
     created_at = Column(DateTime, nullable=False, server_default=func.now())
 
     # 关系
@@ -165,6 +174,12 @@ class SyncTask(Base):
     completed_at = Column(DateTime)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
 
+    # 持久化任务队列（租约）字段
+    lease_owner = Column(String)  # 持有租约的Worker标识
+    lease_expires_at = Column(DateTime)  # 租约过期时间，过期后可被其他Worker接管
+    heartbeat_at = Column(DateTime)  # 最近一次心跳时间
+    attempts = Column(Integer, default=0)  # 被Worker租用执行的次数
+
     # 关系
     knowledge_base = relationship("KnowledgeBase", back_populates="sync_tasks")
 
@@ -176,6 +191,30 @@ class SyncTask(Base):
 Index("idx_sync_tasks_kb_id", SyncTask.kb_id)
 Index("idx_sync_tasks_status", SyncTask.status)
 Index("idx_sync_tasks_created", SyncTask.created_at.desc())
+Index("idx_sync_tasks_status_lease", SyncTask.status, SyncTask.lease_expires_at)
+
+
+class IndexTombstone(Base):
+    """向量删除墓碑表（记录待从OpenSearch删除的文档，删除确认后标记confirmed）"""
+    __tablename__ = "index_tombstones"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kb_id = Column(String, nullable=False)  # 不设外键：知识库删除后仍需清理
+    index_name = Column(String, nullable=False)
+    document_id = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending | confirmed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    last_attempt_at = Column(DateTime)
+    confirmed_at = Column(DateTime)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return f"<IndexTombstone(document_id={self.document_id}, status={self.status})>"
+
+
+# 索引
+Index("idx_index_tombstones_status", IndexTombstone.status, IndexTombstone.last_attempt_at)
 
 
 class KBPermission(Base):
@@ -230,3 +269,90 @@ class QueryHistory(Base):
 Index("idx_query_history_user_id", QueryHistory.user_id)
 Index("idx_query_history_kb_id", QueryHistory.kb_id)
 Index("idx_query_history_created", QueryHistory.created_at.desc())
+
+
+class Conversation(Base):
+    """对话表（多轮追问，保存检索到的文档和Stage 1结果供后续提问复用）"""
+    __tablename__ = "conversations"
+
+    id = Column(String, primary_key=True)  # UUID格式
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    kb_id = Column(String, ForeignKey("knowledge_bases.id", ondelete="CASCADE"), nullable=False)
+    title = Column(String)  # 首个问题（截断），用于对话列表展示
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
+
+    # 关系
+    user = relationship("User", back_populates="conversations")
+    turns = relationship(
+        "ConversationTurn",
+        back_populates="conversation",
+        cascade="all, delete-orphan",
+        order_by="ConversationTurn.turn_index"
+    )
+    stage1_results = relationship("ConversationStage1Result", back_populates="conversation", cascade="all, delete-orphan")
+
+    def __repr__(self):
+        return f"<Conversation(id={self.id}, user_id={self.user_id}, kb_id={self.kb_id})>"
+
+
+# 索引
+Index("idx_conversations_user_kb", Conversation.user_id, Conversation.kb_id)
+Index("idx_conversations_updated", Conversation.updated_at.desc())
+
+
+class ConversationTurn(Base):
+    """对话轮次表"""
+    __tablename__ = "conversation_turns"
+
+    id = Column(String, primary_key=True)  # UUID格式
+    conversation_id = Column(String, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
+    turn_index = Column(Integer, nullable=False)  # 从1开始
+    query_text = Column(Text, nullable=False)
+    answer_text = Column(Text)
+    document_ids = Column(Text)  # 本轮用于生成答案的文档ID（JSON数组）
+    reused_documents = Column(Integer, default=0)  # 复用已有Stage 1结果的文档数
+    read_documents = Column(Integer, default=0)  # 本轮重新执行Stage 1的文档数
+    response_time_ms = Column(Integer, default=0)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    # 关系
+    conversation = relationship("Conversation", back_populates="turns")
+
+    def __repr__(self):
+        return f"<ConversationTurn(conversation_id={self.conversation_id}, turn_index={self.turn_index})>"
+
+
+# 索引
+Index("idx_conversation_turns_unique", ConversationTurn.conversation_id, ConversationTurn.turn_index, unique=True)
+
+
+class ConversationStage1Result(Base):
+    """对话中每个文档最近一次的Stage 1结果（文档内容变化后失效）"""
+    __tablename__ = "conversation_stage1_results"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    conversation_id = Column(String, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
+    document_id = Column(String, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    query_text = Column(Text, nullable=False)  # 阅读文档时的问题
+    doc_name = Column(String, nullable=False)
+    response_text = Column(Text, nullable=False)
+    references_map = Column(Text)  # {ref_id: 内容}（JSON）
+    content_hash = Column(String(64))  # 阅读时的文档内容哈希
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
+
+    # 关系
+    conversation = relationship("Conversation", back_populates="stage1_results")
+
+    def __repr__(self):
+        return f"<ConversationStage1Result(conversation_id={self.conversation_id}, document_id={self.document_id})>"
+
+
+# 索引
+Index(
+    "idx_conversation_stage1_unique",
+    ConversationStage1Result.conversation_id,
+    ConversationStage1Result.document_id,
+    unique=True
+)
@@ -3,7 +3,7 @@ Pydantic数据模型
 用于API请求和响应的数据验证
 """
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Annotated, Optional, List, Dict, Any
 from pydantic import BaseModel, Field, ConfigDict
 
 
@@ -35,6 +35,8 @@ class KnowledgeBaseCreate(BaseModel):
     """创建知识库请求"""
     name: str = Field(..., min_length=1, max_length=100, description="知识库名称")
     description: Optional[str] = Field(None, max_length=500, description="描述信息")
+    relevance_gate_enabled: Optional[bool] = Field(None, description="是否启用相关性预筛（为空时使用全局配置）")
+    query_deadline_seconds: Optional[int] = Field(None, ge=30, le=3600, description="查询默认截止时间（秒，为空时使用全局配置）")
 
     model_config = ConfigDict(
         json_schema_extra={
@@ -50,6 +52,8 @@ class KnowledgeBaseUpdate(BaseModel):
     """更新知识库请求"""
     name: Optional[str] = Field(None, min_length=1, max_length=100)
     description: Optional[str] = Field(None, max_length=500)
+    relevance_gate_enabled: Optional[bool] = None
+    query_deadline_seconds: Optional[int] = Field(None, ge=30, le=3600)
 
 
 class KnowledgeBaseResponse(BaseResponse):
@@ -62,6 +66,8 @@ class KnowledgeBaseResponse(BaseResponse):
     status: str
     owner_id: int  # 所有者用户ID
     visibility: str  # private | public | shared
+    relevance_gate_enabled: Optional[bool] = None  # 为空时使用全局配置
+    query_deadline_seconds: Optional[int] = None  # 为空时使用全局配置
     created_at: datetime
     updated_at: datetime
 
@@ -95,7 +101,10 @@ class DocumentResponse(BaseResponse):
     local_markdown_path: Optional[str]
     local_text_markdown_path: Optional[str]
     file_size: Optional[int]
+    content_hash: Optional[str] = None
     page_count: Optional[int]
+    summary: Optional[str] = None
+    outline: Optional[str] = None
     status: str  # uploaded | processing | completed | failed
     error_message: Optional[str]
     created_at: datetime
@@ -108,6 +117,20 @@ class DocumentListResponse(BaseModel):
     meta: PaginationMeta
 
 
+class DocumentBatchSkippedItem(BaseModel):
+    """批量上传中被跳过的文件"""
+    filename: str
+    reason: str  # duplicate
+    existing_document_id: Optional[str] = None
+
+
+class DocumentBatchUploadResponse(BaseModel):
+    """批量上传响应"""
+    items: List[DocumentResponse]
+    skipped: List[DocumentBatchSkippedItem]
+    sync_task_id: Optional[str] = None  # auto_sync时创建（或合并到）的同步任务
+
+
 class DocumentDetailResponse(DocumentResponse):
     """文档详情响应（包含统计信息）"""
     stats: Dict[str, int]
@@ -160,7 +183,7 @@ class ChunkResponse(BaseResponse):
 class SyncTaskCreate(BaseModel):
     """创建同步任务请求"""
     kb_id: str = Field(..., description="知识库ID")
-    task_type: str = Field(..., description="任务类型: full_sync | incremental | delete")
+    task_type: str = Field(..., description="任务类型: full_sync | incremental")
     document_ids: Optional[List[str]] = Field(None, description="文档ID列表（增量同步时使用）")
 
     model_config = ConfigDict(
@@ -214,6 +237,23 @@ class QueryRequest(BaseModel):
     )
 
 
+class BatchQueryRequest(BaseModel):
+    """批量查询请求"""
+    kb_id: str = Field(..., description="知识库ID")
+    questions: List[Annotated[str, Field(min_length=1, max_length=1000)]] = Field(
+        ..., min_length=1, max_length=200, description="问题列表"
+    )
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "kb_id": "kb-550e8400-e29b-41d4-a716-446655440000",
+                "questions": ["登录注册模块的演进历史是怎样的？", "退款流程需要几个审批节点？"]
+            }
+        }
+    )
+
+
 class CitationItem(BaseModel):
     """引用项"""
     chunk_id: str
@@ -225,6 +265,47 @@ class CitationItem(BaseModel):
     image_url: Optional[str]  # 图片URL（如果是图片chunk）
 
 
+# ============ 对话相关模型 ============
+
+class ConversationCreate(BaseModel):
+    """创建对话请求"""
+    kb_id: str = Field(..., description="知识库ID")
+    title: Optional[str] = Field(None, max_length=200, description="标题（为空时使用首个问题）")
+
+
+class ConversationResponse(BaseResponse):
+    """对话响应"""
+    id: str
+    kb_id: str
+    title: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+
+
+class ConversationListResponse(BaseModel):
+    """对话列表响应"""
+    items: List[ConversationResponse]
+    meta: PaginationMeta
+
+
+class ConversationTurnResponse(BaseModel):
+    """对话轮次响应"""
+    id: str
+    turn_index: int
+    query_text: str
+    answer_text: Optional[str]
+    document_ids: List[str]
+    reused_documents: int  # 复用已有Stage 1结果的文档数
+    read_documents: int  # 本轮重新执行Stage 1的文档数
+    response_time_ms: int
+    created_at: datetime
+
+
+class ConversationDetailResponse(ConversationResponse):
+    """对话详情响应（包含所有轮次）"""
+    turns: List[ConversationTurnResponse]
+
+
 # ============ 流式输出事件模型 ============
 
 class StreamEvent(BaseModel):
@@ -3,5 +3,6 @@ Agentic Robot模块
 智能问答的Two-Stage执行器
 """
 from app.services.agentic_robot.two_stage_executor import TwoStageExecutor
+from app.services.agentic_robot.batch_executor import BatchExecutor
 
-__all__ = ['TwoStageExecutor']
+__all__ = ['TwoStageExecutor', 'BatchExecutor']
@@ -0,0 +1,423 @@
+"""
+批量查询执行器
+回归测试等场景一次提交几十到上百个问题，同一文档往往会被多个问题检索到。
+按文档合并问题：每个文档的一次Stage 1调用回答最多batch_questions_per_call个问题，
+文档读取次数从 问题数×文档数 降到约等于文档数；某个问题涉及的文档都读完后立即为它执行Stage 2，
+结果按完成顺序流式返回。批量查询按background类别调度，不与交互式查询争抢Bedrock槽位
+"""
+import asyncio
+import re
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.resilience import classify_error, describe_failure, retry_async
+from app.core.scheduler import WorkClass
+from app.models.database import Document
+from app.services.agentic_robot.two_stage_executor import TwoStageExecutor
+from app.services.reference_extractor import Stage1Result
+from app.utils.bedrock_client import BedrockClient
+
+logger = get_logger(__name__)
+
+
+# 多问题Stage 1：与STAGE1_FOCUSED_PROMPT_TEMPLATE相同的输出要求，按问题编号分段输出
+STAGE1_BATCH_PROMPT_TEMPLATE = """以下是一份产品文档的完整内容，包含文字和图片。
+
+文档中的图片会以 [图片: filename.ext] 的格式标注文件名，紧接着是图片的视觉内容。
+
+请仔细阅读文档（包括图片中的信息），然后**分别**回答下面的{question_count}个问题。
+
+**输出要求**
+1. 按问题编号依次输出，每个问题以单独一行的『=== 问题N ===』开头（N为问题编号），不要遗漏任何问题
+2. 每个问题的输出分两部分：
+    - 第一部分：跟该问题有关的原文段落，可以在章节中只截取相关语句和段落，一定要保持原文
+    - 第二部分：针对该问题的回答
+3. 不要输出文档总结或章节概要
+
+**输出格式**
+```
+=== 问题1 ===
+## 第一部分：相关原文引用
+
+### 引用1
+```
+[原文内容，保持原样]
+```
+
+### 引用2（如有图片）
+[图片: _page_0_Figure_0.jpeg]
+**图片内容**：![匹配流程图](_page_0_Figure_0.jpeg)
+
+## 第二部分：问题解答
+
+**答案**：
+[分点或分段详细回答，结构清晰]
+
+=== 问题2 ===
+...
+```
+
+**注意**：
+    - 如果文档中没有找到某个问题的相关信息，请在该问题的第二部分明确说明"文档中未找到直接相关信息"。
+    - 不同问题的引用和回答互相独立，不要写"同上"或引用其他问题的回答。
+
+**回答要求**：
+1. **引用原文**：在回答时，直接引用文档中的相关原文片段
+
+2. **引用图片**：如果需要引用图片，必须使用文档中标注的准确文件名，格式为markdown。例如：
+   - 如果看到 [图片: _page_0_Figure_0.jpeg]，则引用为：`![匹配流程图](_page_0_Figure_0.jpeg)`
+   - 不要使用 image1.png, image2.png 等自己编造的文件名
+
+3. **准确性**：只基于文档内容回答，不要编造信息。如果文档中没有相关信息，明确说明
+
+4. **Markdown格式**：使用Markdown格式输出
+
+
+问题列表：
+{questions}
+
+请开始回答：
+"""
+
+_SECTION_PATTERN = re.compile(r'^\s*=== 问题(\d+) ===\s*$', re.MULTILINE)
+
+# 等待事件时的心跳间隔（秒），避免代理在长时间无输出时断开连接
+HEARTBEAT_INTERVAL_SECONDS = 10.0
+
+
+@dataclass
+class BatchQuestion:
+    """批量查询中的一个问题"""
+    index: int  # 在请求中的位置（从0开始）
+    text: str
+    document_ids: List[str]  # 检索到的文档（按相关度排序）
+    results: Dict[str, Stage1Result] = field(default_factory=dict)
+    pending_calls: int = 0  # 尚未完成的Stage 1调用数
+
+
+def split_batch_response(text: str, question_count: int) -> Dict[int, str]:
+    """
+    按『=== 问题N ===』拆分多问题Stage 1的输出
+
+    Args:
+        text: 模型输出
+        question_count: 本次调用的问题数
+
+    Returns:
+        {问题序号(从0开始): 该问题的输出}，缺失的问题不在结果中
+    """
+    matches = list(_SECTION_PATTERN.finditer(text))
+    sections: Dict[int, str] = {}
+    for position, match in enumerate(matches):
+        number = int(match.group(1))
+        if not 1 <= number <= question_count or (number - 1) in sections:
+            continue
+        end = matches[position + 1].start() if position + 1 < len(matches) else len(text)
+        sections[number - 1] = text[match.end():end].strip()
+    return sections
+
+
+class BatchExecutor:
+    """批量查询执行器"""
+
+    def __init__(self, db_session: Session, bedrock_client: BedrockClient):
+        """
+        初始化BatchExecutor
+
+        Args:
+            db_session: 数据库会话
+            bedrock_client: Bedrock客户端
+        """
+        self.db = db_session
+        self.bedrock_client = bedrock_client
+
+        # Stage 1复用TwoStageExecutor的文档加载和Bedrock调用（多个问题共享输出长度）
+        self.reader = TwoStageExecutor(
+            db_session,
+            bedrock_client,
+            work_class=WorkClass.BACKGROUND,
+            stage1_max_tokens=settings.batch_stage1_max_tokens
+        )
+        self.documents: Dict[str, Document] = {}
+
+    @staticmethod
+    def plan_calls(questions: List[BatchQuestion]) -> List[Tuple[str, List[int]]]:
+        """
+        按文档合并问题，每次调用不超过batch_questions_per_call个问题
+
+        Args:
+            questions: 问题列表
+
+        Returns:
+            [(文档ID, [问题index, ...]), ...]
+        """
+        by_document: Dict[str, List[int]] = {}
+        for question in questions:
+            for doc_id in question.document_ids:
+                by_document.setdefault(doc_id, []).append(question.index)
+
+        size = max(1, settings.batch_questions_per_call)
+        return [
+            (doc_id, indices[start:start + size])
+            for doc_id, indices in by_document.items()
+            for start in range(0, len(indices), size)
+        ]
+
+    async def execute_streaming(self, questions: List[BatchQuestion]) -> AsyncGenerator[Dict, None]:
+        """
+        执行批量查询，按完成顺序流式返回每个问题的答案
+
+        Args:
+            questions: 问题列表（已完成检索）
+
+        Yields:
+            事件字典：
+            - {"type": "plan", "data": {...}}
+            - {"type": "progress", "data": {...}}
+            - {"type": "answer", "data": {"question_index": ..., "answer": ...}}
+            - {"type": "error", "data": {"question_index": ..., "message": ...}}
+            - {"type": "heartbeat", "message": "..."}
+            - {"type": "done", "data": {...}}
+        """
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        event_queue: asyncio.Queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(settings.stage1_concurrency)
+        tasks = set()
+        by_index = {question.index: question for question in questions}
+        counts = {"answered": 0, "failed": 0, "stage1_completed": 0, "stage1_failed": 0}
+
+        # 预处理：一次查询所有文档元数据，去掉不存在或已删除的文档
+        all_ids = list(dict.fromkeys(doc_id for q in questions for doc_id in q.document_ids))
+        self.documents = await self.reader.load_documents(all_ids)
+        for question in questions:
+            question.document_ids = [
+                doc_id for doc_id in question.document_ids
+                if doc_id in self.documents and self.documents[doc_id].status != "deleted"
+            ]
+
+        calls = self.plan_calls(questions)
+        for _, indices in calls:
+            for index in indices:
+                by_index[index].pending_calls += 1
+
+        plan = {
+            "questions": len(questions),
+            "documents": len({doc_id for doc_id, _ in calls}),
+            "stage1_calls": len(calls),
+            "unbatched_stage1_calls": sum(len(q.document_ids) for q in questions),
+        }
+        logger.info("batch_query_plan", **plan)
+        yield {"type": "plan", "data": plan}
+
+        def spawn(coro):
+            task = asyncio.ensure_future(coro)
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        async def answer(question: BatchQuestion):
+            """Stage 2：问题涉及的文档都读完后综合答案"""
+            question_start = loop.time()
+            try:
+                if not question.results:
+                    message = (
+                        "所有文档处理失败" if question.document_ids
+                        else "抱歉，在知识库中未找到与您问题相关的内容。"
+                    )
+                    if question.document_ids:
+                        counts["failed"] += 1
+                        await event_queue.put({
+                            "type": "error",
+                            "data": {"question_index": question.index, "question": question.text, "message": message}
+                        })
+                    else:
+                        counts["answered"] += 1
+                        await event_queue.put({
+                            "type": "answer",
+                            "data": {
+                                "question_index": question.index,
+                                "question": question.text,
+                                "answer": message,
+                                "documents": []
+                            }
+                        })
+                    return
+
+                stage1_results = [
+                    question.results[doc_id] for doc_id in question.document_ids
+                    if doc_id in question.results
+                ]
+
+                # 每个问题使用独立的执行器：某个流失败时不影响其他问题的流
+                synthesizer = TwoStageExecutor(self.db, self.bedrock_client, work_class=WorkClass.BACKGROUND)
+                markdown = await synthesizer.synthesize_answer(question.text, stage1_results)
+
+                counts["answered"] += 1
+                await event_queue.put({
+                    "type": "answer",
+                    "data": {
+                        "question_index": question.index,
+                        "question": question.text,
+                        "answer": markdown,
+                        "documents": [result.doc_name for result in stage1_results],
+                        "elapsed_seconds": round(loop.time() - question_start, 2)
+                    }
+                })
+
+            except Exception as e:
+                logger.error("batch_stage2_failed", question_index=question.index, error=str(e), exc_info=True)
+                counts["failed"] += 1
+                await event_queue.put({
+                    "type": "error",
+                    "data": {
+                        "question_index": question.index,
+                        "question": question.text,
+                        "message": str(e),
+                        **describe_failure(e)
+                    }
+                })
+
+        async def read_document(doc_id: str, indices: List[int]):
+            """Stage 1：一次调用回答同一文档的多个问题"""
+            doc_name = self.documents[doc_id].filename
+            error: Optional[Exception] = None
+
+            async with semaphore:
+                try:
+                    results = await retry_async(
+                        lambda: self._read_document(doc_id, [by_index[index] for index in indices]),
+                        operation="batch_stage1_document"
+                    )
+                    for index, result in zip(indices, results):
+                        by_index[index].results[doc_id] = result
+                    counts["stage1_completed"] += 1
+
+                except Exception as e:
+                    logger.error("batch_stage1_failed", doc_id=doc_id, questions=len(indices), error=str(e))
+                    counts["stage1_failed"] += 1
+                    error = e
+
+            progress = {
+                "stage": "stage1",
+                "completed": counts["stage1_completed"] + counts["stage1_failed"],
+                "total": len(calls),
+                "doc_name": doc_name,
+                "question_indices": indices,
+                "status": "failed" if error else "completed"
+            }
+            if error:
+                progress.update(error=str(error), reason=classify_error(error).value)
+            await event_queue.put({"type": "progress", "data": progress})
+
+            for index in indices:
+                question = by_index[index]
+                question.pending_calls -= 1
+                if question.pending_calls == 0:
+                    spawn(answer(question))
+
+        try:
+            # 没有检索到文档的问题直接返回
+            for question in questions:
+                if question.pending_calls == 0:
+                    spawn(answer(question))
+            for doc_id, indices in calls:
+                spawn(read_document(doc_id, indices))
+
+            heartbeat_count = 0
+            while counts["answered"] + counts["failed"] < len(questions) or not event_queue.empty():
+                try:
+                    event = await asyncio.wait_for(event_queue.get(), timeout=HEARTBEAT_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    heartbeat_count += 1
+                    yield {
+                        "type": "heartbeat",
+                        "message": f"批量查询处理中，已完成 {counts['answered'] + counts['failed']}/{len(questions)} ({heartbeat_count})"
+                    }
+                    continue
+                yield event
+
+            elapsed = loop.time() - start_time
+            logger.info(
+                "batch_query_completed",
+                questions=len(questions),
+                answered=counts["answered"],
+                failed=counts["failed"],
+                stage1_calls=len(calls),
+                stage1_failed=counts["stage1_failed"],
+                elapsed_seconds=round(elapsed, 2)
+            )
+
+            yield {
+                "type": "done",
+                "data": {
+                    "questions": len(questions),
+                    "answered": counts["answered"],
+                    "failed": counts["failed"],
+                    "stage1_calls": len(calls),
+                    "elapsed_seconds": round(elapsed, 2)
+                }
+            }
+
+        finally:
+            # 客户端断开或异常退出时，停止所有未完成的调用
+            if tasks:
+                self.reader.cancel()
+                for task in list(tasks):
+                    task.cancel()
+                await asyncio.wait(list(tasks))
+
+    async def _read_document(self, doc_id: str, questions: List[BatchQuestion]) -> List[Stage1Result]:
+        """
+        读取一个文档并一次回答多个问题
+
+        Args:
+            doc_id: 文档ID
+            questions: 本次调用的问题（不超过batch_questions_per_call个）
+
+        Returns:
+            与questions一一对应的Stage1Result列表
+        """
+        prompt_text = STAGE1_BATCH_PROMPT_TEMPLATE.format(
+            question_count=len(questions),
+            questions="\n".join(f"{number}. {q.text}" for number, q in enumerate(questions, start=1))
+        )
+        processed_doc, response = await self.reader.read_document(
+            doc_id,
+            prompt_text,
+            timeout=settings.batch_stage1_timeout_seconds
+        )
+
+        logger.info(
+            "batch_stage1_response_received",
+            doc_short_id=processed_doc.doc_short_id,
+            questions=len(questions),
+            prompt_length=len(prompt_text),
+            response_length=len(response)
+        )
+
+        sections = split_batch_response(response, len(questions))
+        if len(sections) < len(questions):
+            # 分段缺失时把完整输出交给缺失的问题，由Stage 2从中提取
+            logger.warning(
+                "batch_stage1_sections_missing",
+                doc_short_id=processed_doc.doc_short_id,
+                expected=len(questions),
+                found=len(sections)
+            )
+
+        doc = self.documents.get(doc_id)
+        return [
+            Stage1Result(
+                doc_id=processed_doc.doc_id,
+                doc_name=processed_doc.doc_name,
+                doc_short_id=processed_doc.doc_short_id,
+                response_text=sections.get(position, response),
+                references_map=processed_doc.references_map,
+                summary=doc.summary if doc is not None else None
+            )
+            for position in range(len(questions))
+        ]
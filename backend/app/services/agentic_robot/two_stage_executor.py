@@ -3,13 +3,24 @@ TwoStageExecutor - Two-Stage查询执行器
 负责协调整个查询流程：Stage 1(文档级理解) + Stage 2(综合答案)
 """
 import asyncio
-from typing import List, Dict, AsyncGenerator
+import math
+import threading
+from dataclasses import dataclass
+from typing import List, Dict, AsyncGenerator, Optional, Tuple
 from sqlalchemy.orm import Session
 
-from app.core.logging import get_logger
+from app.core.database import run_db
+from app.core.deadline import Deadline
+from app.core.errors import DeadlineExceededError
+from app.core.hedging import stage1_hedge_policy
+from app.core.logging import get_logger, lazy
+from app.core.metrics import metrics
+from app.core.resilience import bedrock_breaker, classify_error, describe_failure, retry_async
+from app.core.scheduler import scheduler, WorkClass
 from app.models.database import Document
 from app.services.document_loader import DocumentLoader
-from app.services.document_processor import DocumentProcessor
+from app.services.conversation_service import ConversationContext
+from app.services.document_processor import DocumentProcessor, ProcessedDocument
 from app.services.reference_extractor import ReferenceExtractor, Stage1Result
 from app.utils.bedrock_client import BedrockClient
 
@@ -96,6 +107,69 @@ STAGE1_PROMPT_TEMPLATE = """以下是一份产品文档的完整内容，包含
 5. **Markdown格式**：使用Markdown格式输出，可以使用标题、列表、引用块等格式
 
 
+用户问题：{query}
+
+请开始回答：
+"""
+
+# 文档已有预生成摘要时使用：只输出与问题相关的原文引用和回答（摘要在Stage 2中直接附加）
+STAGE1_FOCUSED_PROMPT_TEMPLATE = """以下是一份产品文档的完整内容，包含文字和图片。
+
+文档中的图片会以 [图片: filename.ext] 的格式标注文件名，紧接着是图片的视觉内容。
+
+请仔细阅读文档（包括图片中的信息），然后按照要求输出内容：
+
+**输出要求**
+1. 输出分两部分：
+    - 第一部分：跟『用户问题』有关的原文段落，可以在章节中只截取相关语句和段落，一定要保持原文
+    - 第二部分：针对『用户问题』的回答
+2. 不要输出文档总结或章节概要
+
+**输出格式**
+```
+## 第一部分：相关原文引用
+
+### 引用1
+```
+[原文内容，保持原样]
+```
+
+### 引用2（如有图片）
+[图片: _page_0_Figure_0.jpeg]
+**图片内容**：![匹配流程图](_page_0_Figure_0.jpeg)
+
+---
+
+## 第二部分：问题解答
+
+**用户问题**：[重述问题]
+
+**答案**：
+[分点或分段详细回答，结构清晰]
+
+---
+
+**注意**：
+    - 如果文档中没有找到相关信息来回答用户问题，请在第二部分明确说明"文档中未找到直接相关信息"。
+    - 在做『问题解答』时要遵守**回答要求**
+```
+
+**回答要求**：
+1. **引用原文**：在回答时，直接引用文档中的相关原文片段。例如：
+   - "根据文档描述：'用户可以通过手机号或邮箱登录'，系统支持多种登录方式。"
+
+2. **引用图片**：如果需要引用图片，必须使用文档中标注的准确文件名，格式为markdown。例如：
+   - 如果看到 [图片: _page_0_Figure_0.jpeg]，则引用为：`![匹配流程图](_page_0_Figure_0.jpeg)`
+   - **重要**：文件名必须与 [图片: xxx] 标注中的文件名完全一致，包括扩展名和下划线
+   - 不要使用 image1.png, image2.png 等自己编造的文件名
+
+3. **自然融入**：引用的原文和图片应该自然地融入你的回答中，保持语句通顺
+
+4. **准确性**：只基于文档内容回答，不要编造信息。如果文档中没有相关信息，明确说明
+
+5. **Markdown格式**：使用Markdown格式输出，可以使用标题、列表、引用块等格式
+
+
 用户问题：{query}
 
 请开始回答：
@@ -165,11 +239,51 @@ STAGE2_PROMPT_TEMPLATE = """我已经让{doc_count}个助手分别阅读了相
 6. **去重**：如果多个文档引用了相同或相似的内容，可以合并引用，标注所有来源文档
 
 
-用户问题：{query}
+{history}用户问题：{query}
 
 请开始综合回答：
 """
 
+# 多轮对话的追问：在Stage 2提示词中附加之前的问答
+STAGE2_HISTORY_TEMPLATE = """**对话历史**（当前问题是对以下对话的追问，结合上文理解问题，但只回答当前问题）：
+
+{turns}
+
+"""
+
+
+# 截止时间到达后，等待Stage 1任务自行结束的宽限时间（秒），超过后直接取消
+STAGE1_DEADLINE_GRACE_SECONDS = 5.0
+
+# 按剩余时间估算生成长度时的安全系数，以及max_tokens的上下限
+OUTPUT_BUDGET_FACTOR = 0.8
+MIN_OUTPUT_TOKENS = 1000
+MAX_OUTPUT_TOKENS = 8000
+
+
+@dataclass
+class Stage1Plan:
+    """按Stage 1预算确定的执行计划"""
+    document_limit: int  # 最多阅读的文档数（按相关度排序截取）
+    focused: bool = False  # 使用精简提示词（不输出文档总结）
+    max_tokens: int = MAX_OUTPUT_TOKENS
+
+
+def output_token_budget(seconds: float) -> int:
+    """
+    按剩余时间估算可生成的token数
+
+    Args:
+        seconds: 剩余时间
+
+    Returns:
+        max_tokens（限制在MIN_OUTPUT_TOKENS和MAX_OUTPUT_TOKENS之间）
+    """
+    from app.core.config import settings
+
+    tokens = int(seconds * settings.query_output_tokens_per_second * OUTPUT_BUDGET_FACTOR)
+    return max(MIN_OUTPUT_TOKENS, min(MAX_OUTPUT_TOKENS, tokens))
+
 
 class TwoStageExecutor:
     """Two-Stage查询执行器"""
@@ -177,7 +291,9 @@ class TwoStageExecutor:
     def __init__(
         self,
         db_session: Session,
-        bedrock_client: BedrockClient
+        bedrock_client: BedrockClient,
+        work_class: WorkClass = WorkClass.INTERACTIVE,
+        stage1_max_tokens: int = MAX_OUTPUT_TOKENS
     ):
         """
         初始化TwoStageExecutor
@@ -185,28 +301,66 @@ class TwoStageExecutor:
         Args:
             db_session: 数据库会话
             bedrock_client: Bedrock客户端
+            work_class: 调度类别（占用Bedrock槽位和线程的优先级，批量查询使用background）
+            stage1_max_tokens: 直接调用read_document时Stage 1的输出长度上限
+                （execute_streaming按预算重新确定）
         """
         self.db = db_session
         self.bedrock_client = bedrock_client
+        self.work_class = work_class
 
         # 初始化子模块
         self.doc_loader = DocumentLoader(db_session)
         self.doc_processor = DocumentProcessor()
         self.ref_extractor = ReferenceExtractor()
 
+        # 预先批量查询的文档元数据（Stage 1加载文档时不再访问数据库）
+        self._documents: Dict[str, Document] = {}
+
+        # 取消信号：客户端断开时设置，线程中读取Bedrock流的循环据此提前关闭流
+        self._cancelled = threading.Event()
+        self._stage1_called = set()  # 已发起Stage 1调用的文档ID
+        self._stage2_started = False
+        self._inflight_calls = 0
+        self._aborted_streams = 0  # 因取消而提前关闭的Stage 2流
+
+        # 截止时间（execute_streaming开始时确定）
+        self._deadline: Optional[Deadline] = None
+        self._stage1_deadline: Optional[Deadline] = None
+        self._stage1_plan = Stage1Plan(document_limit=0, max_tokens=stage1_max_tokens)
+
+        # 多轮对话：之前的问答（Stage 2提示词使用）
+        self._history: List[Tuple[str, str]] = []
+
+        # 执行结果（多轮对话保存本轮问答和Stage 1结果）
+        self.stage1_results: List[Stage1Result] = []
+        self.answer_text = ""
+
         logger.info("two_stage_executor_initialized")
 
     async def execute_streaming(
         self,
         query: str,
-        document_ids: List[str]
+        document_ids: List[str],
+        deadline: Optional[Deadline] = None,
+        conversation: Optional[ConversationContext] = None,
+        cached_results: Optional[Dict[str, Stage1Result]] = None
     ) -> AsyncGenerator[Dict, None]:
         """
         执行Two-Stage查询，流式返回结果
 
+        剩余时间按比例分给Stage 1和Stage 2：Stage 1预算不足以读完所有文档时只读最相关的文档，
+        到达Stage 1截止时间后使用已完成的结果；Stage 2按剩余时间削减生成长度。
+
+        多轮对话的追问：cached_results中的文档直接使用已有结果，不再执行Stage 1；
+        Stage 1使用带上文的问题，Stage 2提示词附加之前的问答。
+
         Args:
             query: 用户问题
-            document_ids: 要处理的文档ID列表
+            document_ids: 要处理的文档ID列表（按相关度排序）
+            deadline: 整体截止时间，默认query_deadline_seconds
+            conversation: 对话上下文（多轮对话时传入）
+            cached_results: 复用的Stage 1结果 {document_id: Stage1Result}
 
         Yields:
             SSE事件字典：
@@ -222,10 +376,26 @@ class TwoStageExecutor:
             document_count=len(document_ids)
         )
 
+        total_count = 0
+        execution_handle = None
+        heartbeat_handle = None
+
         try:
             # Stage 1: 并行处理所有文档（使用Semaphore限流）
             from app.core.config import settings
 
+            self._deadline = deadline or Deadline(settings.query_deadline_seconds)
+
+            cached_results = cached_results or {}
+            stage1_query = conversation.contextual_query(query) if conversation else query
+            self._history = conversation.history if conversation else []
+
+            if cached_results:
+                yield {
+                    "type": "status",
+                    "message": f"复用已有的{len(cached_results)}个文档阅读结果"
+                }
+
             # 记录Stage 1开始时间
             stage1_start_time = asyncio.get_event_loop().time()
 
@@ -237,12 +407,16 @@ class TwoStageExecutor:
             # 统计变量
             completed_count = 0
             failed_count = 0
-            total_count = len(document_ids)
+            failures: List[Exception] = []
+
+            # 预处理：一次查询文档元数据（在数据库线程池中执行），过滤无效文档
+            await self.load_documents(document_ids)
 
-            # 预处理：过滤无效文档
             valid_documents = []
             for doc_id in document_ids:
-                doc = self.db.query(Document).filter(Document.id == doc_id).first()
+                if doc_id in cached_results:
+                    continue
+                doc = self._documents.get(doc_id)
                 if not doc:
                     logger.warning("document_not_found", doc_id=doc_id)
                     continue
@@ -251,21 +425,43 @@ class TwoStageExecutor:
                     continue
                 valid_documents.append((doc_id, doc.filename))
 
+            # 为Stage 2预留时间，其余时间分给Stage 1
+            remaining = self._deadline.remaining()
+            stage2_reserve = max(remaining * settings.query_stage2_budget_ratio, settings.query_stage2_min_seconds)
+            self._stage1_deadline = self._deadline.child(remaining - stage2_reserve)
+            self._stage1_plan = self._plan_stage1(len(valid_documents), self._stage1_deadline.remaining())
+
+            if self._stage1_plan.document_limit < len(valid_documents):
+                yield {
+                    "type": "status",
+                    "message": f"剩余时间有限，仅阅读最相关的{self._stage1_plan.document_limit}个文档"
+                }
+                valid_documents = valid_documents[:self._stage1_plan.document_limit]
+
             total_count = len(valid_documents)
 
             logger.info(
                 "stage1_parallel_start",
                 total_documents=total_count,
                 concurrency=settings.stage1_concurrency,
-                filtered_out=len(document_ids) - total_count
+                filtered_out=len(document_ids) - total_count,
+                stage1_budget_seconds=round(self._stage1_deadline.total, 1),
+                focused=self._stage1_plan.focused,
+                max_tokens=self._stage1_plan.max_tokens
             )
 
-            async def process_with_limit_and_progress(doc_id: str, doc_name: str):
+            # 按完成顺序收集结果（截止时间到达时取消剩余任务，仍可使用已完成的结果）
+            collected: Dict[int, Stage1Result] = {}
+
+            async def process_with_limit_and_progress(index: int, doc_id: str, doc_name: str):
                 """带限流和进度反馈的文档处理"""
                 nonlocal completed_count, failed_count
 
                 async with semaphore:
                     try:
+                        if self._stage1_deadline.expired():
+                            raise DeadlineExceededError("Stage 1", self._deadline.total)
+
                         # 记录单个文档开始时间
                         doc_start_time = asyncio.get_event_loop().time()
 
@@ -277,13 +473,14 @@ class TwoStageExecutor:
 
                         # 带重试的处理
                         result = await self._process_single_document_with_retry(
-                            query, doc_id
+                            stage1_query, doc_id
                         )
 
                         # 计算单个文档耗时
                         doc_elapsed = asyncio.get_event_loop().time() - doc_start_time
 
                         # 成功后更新进度
+                        collected[index] = result
                         completed_count += 1
                         await event_queue.put({
                             "type": "progress",
@@ -303,25 +500,27 @@ class TwoStageExecutor:
                             response_length=len(result.response_text),
                             references_count=len(result.references_map),
                             elapsed_seconds=round(doc_elapsed, 2),
-                            response_preview=result.response_text[:1000]
+                            response_preview=result.response_text[:200]
                         )
 
-                        # 详细打印Stage 1的返回内容（用于debug）
+                        # 详细打印Stage 1的返回内容（用于debug，超长内容由日志处理器截断）
                         logger.debug(
                             "stage1_response_full",
                             doc_id=doc_id,
                             doc_name=result.doc_name,
                             doc_short_id=result.doc_short_id,
                             response_text=result.response_text,
-                            references_map=result.references_map
+                            references_map=result.references_map,
+                            _sample=0.1
                         )
 
                         return result
 
                     except Exception as e:
-                        # 重试3次后仍失败
+                        # 不可重试错误、熔断或重试次数用尽
                         failed_count += 1
                         completed_count += 1
+                        failures.append(e)
                         await event_queue.put({
                             "type": "progress",
                             "data": {
@@ -329,7 +528,8 @@ class TwoStageExecutor:
                                 "total": total_count,
                                 "doc_name": doc_name,
                                 "status": "failed",
-                                "error": str(e)
+                                "error": str(e),
+                                "reason": classify_error(e).value
                             }
                         })
 
@@ -342,10 +542,10 @@ class TwoStageExecutor:
                         )
                         return None  # 返回None标记失败
 
-            # 创建所有任务
+            # 创建所有任务（文档协程在gather中包装为Task，取消execution_handle时一并取消）
             tasks = [
-                process_with_limit_and_progress(doc_id, doc_name)
-                for doc_id, doc_name in valid_documents
+                process_with_limit_and_progress(index, doc_id, doc_name)
+                for index, (doc_id, doc_name) in enumerate(valid_documents)
             ]
 
             # 启动全局心跳任务
@@ -361,15 +561,31 @@ class TwoStageExecutor:
 
             execution_handle = asyncio.create_task(execute_all_tasks())
 
-            # 实时消费进度事件并yield
+            # 实时消费进度事件并yield（超过Stage 1截止时间和宽限时间后不再等待）
             while True:
-                event = await event_queue.get()
+                try:
+                    event = await asyncio.wait_for(
+                        event_queue.get(),
+                        timeout=self._stage1_deadline.remaining() + STAGE1_DEADLINE_GRACE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning(
+                        "stage1_deadline_reached",
+                        completed=len(collected),
+                        total=total_count
+                    )
+                    execution_handle.cancel()
+                    yield {
+                        "type": "status",
+                        "message": f"已到达阅读时间上限，使用已完成的{len(collected)}个文档生成答案"
+                    }
+                    break
                 if event is None:
                     break
                 yield event
 
-            # 等待所有任务完成
-            results = await execution_handle
+            # 等待所有任务完成（截止时间到达时等待取消完成）
+            await asyncio.wait({execution_handle})
 
             # 停止心跳
             stop_heartbeat.set()
@@ -378,11 +594,10 @@ class TwoStageExecutor:
             except asyncio.TimeoutError:
                 heartbeat_handle.cancel()
 
-            # 过滤失败的结果
-            stage1_results = [
-                r for r in results
-                if r is not None and not isinstance(r, Exception)
-            ]
+            # 成功的结果和复用的结果（保持相关度顺序）
+            results_by_id = {result.doc_id: result for result in cached_results.values()}
+            results_by_id.update((result.doc_id, result) for result in collected.values())
+            stage1_results = [results_by_id[doc_id] for doc_id in document_ids if doc_id in results_by_id]
 
             # 计算Stage 1总耗时
             stage1_elapsed = asyncio.get_event_loop().time() - stage1_start_time
@@ -390,9 +605,10 @@ class TwoStageExecutor:
             logger.info(
                 "stage1_parallel_completed",
                 total_documents=total_count,
-                successful_documents=len(stage1_results),
+                successful_documents=len(collected),
+                reused_documents=len(cached_results),
                 failed_documents=failed_count,
-                success_rate=f"{len(stage1_results)}/{total_count}",
+                success_rate=f"{len(collected)}/{total_count}",
                 total_elapsed_seconds=round(stage1_elapsed, 2),
                 avg_elapsed_per_doc=round(stage1_elapsed / total_count, 2) if total_count > 0 else 0,
                 concurrency=settings.stage1_concurrency
@@ -400,9 +616,14 @@ class TwoStageExecutor:
 
             # 检查是否有成功处理的文档
             if not stage1_results:
+                # 熔断时直接告诉前端服务暂不可用和建议的重试时间
+                failure = failures[0] if failures else None
                 yield {
                     "type": "error",
-                    "data": {"message": "所有文档处理失败"}
+                    "data": {
+                        "message": f"所有文档处理失败: {failure}" if failure else "所有文档处理失败",
+                        **(describe_failure(failure) if failure else {})
+                    }
                 }
                 return
 
@@ -418,7 +639,7 @@ class TwoStageExecutor:
                 query=query[:100],
                 stage1_results_count=len(stage1_results),
                 total_response_length=sum(len(r.response_text) for r in stage1_results),
-                doc_names=[r.doc_name for r in stage1_results]
+                doc_names=lazy(lambda: [r.doc_name for r in stage1_results])
             )
 
             yield {
@@ -436,19 +657,25 @@ class TwoStageExecutor:
             heartbeat_interval = 10.0  # 10秒心跳间隔
             heartbeat_count = 0
 
-            # 使用流式API逐块收集响应
-            async for text_chunk in self._stage2_synthesize_stream(query, stage1_results):
-                markdown_response += text_chunk
-
-                # 检查是否需要发送心跳（每10秒）
-                current_time = asyncio.get_event_loop().time()
-                if current_time - last_heartbeat_time >= heartbeat_interval:
-                    heartbeat_count += 1
-                    yield {
-                        "type": "heartbeat",
-                        "message": f"正在生成答案中，已接收 {len(markdown_response)} 字符... ({heartbeat_count})"
-                    }
-                    last_heartbeat_time = current_time
+            # 使用流式API逐块收集响应（生成长度按剩余时间削减，到达截止时间时保留已生成的部分）
+            try:
+                async for text_chunk in self._stage2_synthesize_stream(query, stage1_results):
+                    markdown_response += text_chunk
+
+                    # 检查是否需要发送心跳（每10秒）
+                    current_time = asyncio.get_event_loop().time()
+                    if current_time - last_heartbeat_time >= heartbeat_interval:
+                        heartbeat_count += 1
+                        yield {
+                            "type": "heartbeat",
+                            "message": f"正在生成答案中，已接收 {len(markdown_response)} 字符... ({heartbeat_count})"
+                        }
+                        last_heartbeat_time = current_time
+            except DeadlineExceededError:
+                if not markdown_response:
+                    raise
+                logger.warning("stage2_deadline_reached", response_length=len(markdown_response))
+                markdown_response += "\n\n> 已到达查询时间上限，以上答案可能不完整。"
 
             logger.info(
                 "stage2_markdown_collected",
@@ -463,11 +690,7 @@ class TwoStageExecutor:
             }
 
             # 进行后处理
-            # 1. 修复表格格式（确保表格每行单独占一行）
-            processed_markdown = self._fix_table_format(markdown_response)
-
-            # 2. 转换图片路径为完整的API路径
-            processed_markdown = self._convert_image_paths(processed_markdown, stage1_results)
+            processed_markdown = self.postprocess_answer(markdown_response, stage1_results)
 
             logger.info(
                 "markdown_post_processing_completed",
@@ -475,6 +698,9 @@ class TwoStageExecutor:
                 processed_length=len(processed_markdown)
             )
 
+            self.stage1_results = stage1_results
+            self.answer_text = processed_markdown
+
             # 一次性返回完���的处理后答案
             yield {
                 "type": "answer_delta",
@@ -501,6 +727,11 @@ class TwoStageExecutor:
                 documents_processed=len(stage1_results)
             )
 
+        except (asyncio.CancelledError, GeneratorExit):
+            # 客户端断开：停止后续调用，正在读取的Bedrock流在下一个事件时关闭
+            self._record_cancellation(total_count)
+            raise
+
         except Exception as e:
             logger.error(
                 "two_stage_execution_failed",
@@ -510,8 +741,136 @@ class TwoStageExecutor:
             )
             yield {
                 "type": "error",
-                "data": {"message": str(e)}
+                "data": {"message": str(e), **describe_failure(e)}
+            }
+
+        finally:
+            # 取消或异常退出时，停止仍在运行的Stage 1任务和心跳
+            for handle in (execution_handle, heartbeat_handle):
+                if handle is not None and not handle.done():
+                    self._cancelled.set()
+                    handle.cancel()
+
+    async def load_documents(self, document_ids: List[str]) -> Dict[str, Document]:
+        """
+        批量查询文档元数据（在数据库线程池中执行），之后读取文档时不再访问数据库
+
+        Args:
+            document_ids: 文档ID列表
+
+        Returns:
+            {文档ID: Document}，不存在的文档不在结果中
+        """
+        self._documents = await run_db(self.doc_loader.get_documents, document_ids)
+        return self._documents
+
+    async def read_document(
+        self,
+        document_id: str,
+        prompt_text: str,
+        timeout: float
+    ) -> Tuple[ProcessedDocument, str]:
+        """
+        加载文档并使用给定提示词发出一次Stage 1调用（不重试、不对冲，由调用方决定重试策略）
+
+        Args:
+            document_id: 文档ID（需先通过load_documents加载元数据）
+            prompt_text: 放在文档内容之前的提示词
+            timeout: 调用超时时间（秒）
+
+        Returns:
+            (ProcessedDocument, 回复文本)
+
+        Raises:
+            TimeoutError: 调用超时
+        """
+        processed_doc = await scheduler.run_in_thread(
+            self.work_class,
+            self._load_and_process_document,
+            document_id
+        )
+
+        messages = [
+            {
+                "role": "user",
+                "content": [{"text": prompt_text}] + processed_doc.content
             }
+        ]
+
+        cancel_event = threading.Event()
+        try:
+            response = await asyncio.wait_for(
+                self._invoke_stage1_attempt(messages, cancel_event),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Bedrock API调用超时（{int(timeout)}秒）")
+        finally:
+            cancel_event.set()
+
+        return processed_doc, response
+
+    async def synthesize_answer(self, query: str, stage1_results: List[Stage1Result]) -> str:
+        """
+        Stage 2：综合Stage 1结果生成完整答案（收集流式输出并完成后处理）
+
+        Args:
+            query: 用户问题
+            stage1_results: Stage 1结果列表
+
+        Returns:
+            后处理后的Markdown答案
+        """
+        parts = []
+        async for text_chunk in self._stage2_synthesize_stream(query, stage1_results):
+            parts.append(text_chunk)
+
+        return self.postprocess_answer("".join(parts), stage1_results)
+
+    def postprocess_answer(self, markdown_text: str, stage1_results: List[Stage1Result]) -> str:
+        """
+        答案后处理：修复表格格式（确保表格每行单独占一行），并转换图片路径为完整的API路径
+
+        Args:
+            markdown_text: Stage 2输出的Markdown
+            stage1_results: Stage 1结果列表
+
+        Returns:
+            处理后的Markdown
+        """
+        processed = self._fix_table_format(markdown_text)
+        return self._convert_image_paths(processed, stage1_results)
+
+    def cancel(self):
+        """取消执行：进行中的Bedrock调用和流在线程中检测到后提前关闭"""
+        self._cancelled.set()
+
+    def _record_cancellation(self, total_count: int):
+        """
+        记录取消的查询和因此省下的Bedrock调用
+
+        Args:
+            total_count: Stage 1的有效文档数
+        """
+        self._cancelled.set()
+
+        skipped = total_count - len(self._stage1_called)
+        if not self._stage2_started:
+            skipped += 1
+        aborted = self._inflight_calls + self._aborted_streams
+
+        metrics.increment("queries_cancelled")
+        metrics.increment("bedrock_calls_skipped", skipped)
+        metrics.increment("bedrock_calls_aborted", aborted)
+
+        logger.info(
+            "two_stage_execution_cancelled",
+            stage="stage2" if self._stage2_started else "stage1",
+            stage1_documents=total_count,
+            stage1_called=len(self._stage1_called),
+            skipped_calls=skipped,
+            aborted_calls=aborted
+        )
 
     async def _process_single_document_with_retry(
         self,
@@ -519,7 +878,10 @@ class TwoStageExecutor:
         document_id: str
     ) -> Stage1Result:
         """
-        带重试机制的文档处理（重试3次）
+        带重试机制的文档处理
+
+        只重试临时错误和限流（带抖动退避，遵循Retry-After）；文件不存在、参数错误等
+        不可重试错误和Bedrock熔断立即失败。
 
         Args:
             query: 用户问题
@@ -529,35 +891,60 @@ class TwoStageExecutor:
             Stage1Result对象
 
         Raises:
-            Exception: 重试3次后仍失败
+            Exception: 不可重试错误，或重试次数用尽
         """
-        from tenacity import (
-            retry,
-            stop_after_attempt,
-            wait_exponential,
-            retry_if_exception_type,
-            before_sleep_log
-        )
-        import botocore.exceptions
-
-        @retry(
-            stop=stop_after_attempt(3),
-            wait=wait_exponential(multiplier=2, min=4, max=60),
-            retry=retry_if_exception_type((
-                botocore.exceptions.ClientError,
-                Exception
-            )),
-            before_sleep=before_sleep_log(logger, "WARNING"),
-            reraise=True
-        )
-        async def _process_with_retry():
+        async def process():
             logger.info(
                 "processing_document_attempt",
                 document_id=document_id
             )
             return await self._process_single_document(query, document_id)
 
-        return await _process_with_retry()
+        return await retry_async(process, operation="stage1_document", deadline=self._stage1_deadline)
+
+    def _plan_stage1(self, document_count: int, budget_seconds: float) -> Stage1Plan:
+        """
+        按Stage 1预算确定阅读的文档数和生成长度
+
+        按近期Stage 1耗时中位数（没有样本时用query_stage1_expected_seconds）估算能完成的并发轮数，
+        不够读完所有文档时只保留前几轮的文档并改用精简提示词；一轮都不够时再削减max_tokens。
+
+        Args:
+            document_count: 候选文档数
+            budget_seconds: Stage 1预算
+
+        Returns:
+            Stage1Plan对象
+        """
+        from app.core.config import settings
+
+        expected = stage1_hedge_policy.latency(0.5) or settings.query_stage1_expected_seconds
+        concurrency = settings.stage1_concurrency
+        waves = math.ceil(document_count / concurrency)
+        affordable = int(budget_seconds // expected)
+
+        if affordable >= waves:
+            plan = Stage1Plan(document_limit=document_count)
+        else:
+            plan = Stage1Plan(
+                document_limit=min(document_count, max(1, affordable) * concurrency),
+                focused=True,
+                max_tokens=output_token_budget(budget_seconds) if affordable == 0 else MAX_OUTPUT_TOKENS
+            )
+            metrics.increment("stage1_plans_reduced")
+
+        logger.info(
+            "stage1_plan",
+            document_count=document_count,
+            budget_seconds=round(budget_seconds, 1),
+            expected_call_seconds=round(expected, 1),
+            waves=waves,
+            affordable_waves=affordable,
+            document_limit=plan.document_limit,
+            focused=plan.focused,
+            max_tokens=plan.max_tokens
+        )
+        return plan
 
     async def _global_heartbeat_task(
         self,
@@ -603,13 +990,12 @@ class TwoStageExecutor:
         """
         logger.info("loading_document", document_id=document_id)
 
-        # 1. 加载文档
-        doc_content = self.doc_loader.load_document(document_id)
-
-        logger.info("processing_document", document_id=document_id)
-
-        # 2. 处理文档（分段、标记）
-        processed_doc = self.doc_processor.process(doc_content)
+        # 1-2. 加载文档并处理（分段、标记），文件读取在线程池中执行，不阻塞事件循环
+        processed_doc = await scheduler.run_in_thread(
+            self.work_class,
+            self._load_and_process_document,
+            document_id
+        )
 
         logger.info(
             "calling_bedrock_stage1",
@@ -635,10 +1021,14 @@ class TwoStageExecutor:
             content_info=content_info[:10]  # 只显示前10个
         )
 
-        # 3. 构建Stage 1 Prompt并调用Bedrock
+        # 3. 构建Stage 1 Prompt并调用Bedrock（有预生成摘要时不再让模型输出文档总结）
+        doc = self._documents.get(document_id)
+        summary = doc.summary if doc is not None else None
+
         response_text = await self._call_bedrock_stage1(
             query=query,
-            processed_doc=processed_doc
+            processed_doc=processed_doc,
+            summary=summary
         )
 
         # 4. 返回结果
@@ -647,13 +1037,34 @@ class TwoStageExecutor:
             doc_name=processed_doc.doc_name,
             doc_short_id=processed_doc.doc_short_id,
             response_text=response_text,
-            references_map=processed_doc.references_map
+            references_map=processed_doc.references_map,
+            summary=summary
+        )
+
+    def _load_and_process_document(self, document_id: str) -> ProcessedDocument:
+        """
+        读取文档文件并处理（同步，在线程池中执行）
+
+        Args:
+            document_id: 文档ID
+
+        Returns:
+            ProcessedDocument对象
+        """
+        doc_content = self.doc_loader.load_document(
+            document_id,
+            doc=self._documents.get(document_id)
         )
 
+        logger.info("processing_document", document_id=document_id)
+
+        return self.doc_processor.process(doc_content)
+
     async def _call_bedrock_stage1(
         self,
         query: str,
-        processed_doc
+        processed_doc,
+        summary: Optional[str] = None
     ) -> str:
         """
         调用Bedrock API（Stage 1）
@@ -661,14 +1072,17 @@ class TwoStageExecutor:
         Args:
             query: 用户问题
             processed_doc: ProcessedDocument对象
+            summary: 预生成的文档摘要（有摘要时只输出原文引用和回答）
 
         Returns:
             大模型的回复文本
         """
         from app.core.config import settings
 
-        # 构建prompt文本
-        prompt_text = STAGE1_PROMPT_TEMPLATE.format(query=query)
+        # 构建prompt文本（旧文档没有摘要时仍由模型输出文档总结，时间不足时一律不输出）
+        focused = bool(summary) or self._stage1_plan.focused
+        template = STAGE1_FOCUSED_PROMPT_TEMPLATE if focused else STAGE1_PROMPT_TEMPLATE
+        prompt_text = template.format(query=query)
 
         # 构建完整的messages（包含prompt和图文混排content）
         messages = [
@@ -682,19 +1096,20 @@ class TwoStageExecutor:
             "bedrock_stage1_request_prepared",
             doc_short_id=processed_doc.doc_short_id,
             prompt_length=len(prompt_text),
+            has_summary=bool(summary),
             total_content_blocks=len([{"text": prompt_text}] + processed_doc.content)
         )
 
+        # 单次调用最多300秒，且不超过Stage 1截止时间
+        stage1_deadline = self._stage1_deadline or Deadline(300.0)
+        timeout = stage1_deadline.timeout(cap=300.0)
+
         try:
-            # 调用Bedrock converse API（设置300秒超时）
+            # 调用Bedrock converse API（超过近期耗时分位数时发出对冲请求）
+            self._stage1_called.add(processed_doc.doc_id)
             response = await asyncio.wait_for(
-                asyncio.to_thread(
-                    self._invoke_bedrock_sync,
-                    messages,
-                    temperature=0.3,
-                    max_tokens=8000
-                ),
-                timeout=300.0  # 300秒超时
+                self._invoke_stage1_hedged(messages, processed_doc.doc_short_id),
+                timeout=timeout
             )
 
             logger.info(
@@ -710,9 +1125,11 @@ class TwoStageExecutor:
             logger.error(
                 "bedrock_stage1_timeout",
                 doc_short_id=processed_doc.doc_short_id,
-                timeout=300
+                timeout=round(timeout, 1)
             )
-            raise Exception("Bedrock API调用超时（300秒）")
+            if stage1_deadline.expired() and self._deadline is not None:
+                raise DeadlineExceededError("Stage 1", self._deadline.total)
+            raise TimeoutError("Bedrock API调用超时（300秒）")
 
         except Exception as e:
             logger.error(
@@ -723,39 +1140,179 @@ class TwoStageExecutor:
             )
             raise
 
+    async def _invoke_stage1_attempt(
+        self,
+        messages,
+        cancel_event: threading.Event,
+        model_id: Optional[str] = None,
+        region: Optional[str] = None
+    ) -> str:
+        """
+        发出一次Stage 1调用（按work_class占用Bedrock槽位）
+
+        Args:
+            messages: 消息列表
+            cancel_event: 本次调用的取消信号（对冲请求胜出后取消另一个）
+            model_id: 模型ID，默认使用generation_model_id
+            region: 区域，默认与boto_session相同
+
+        Returns:
+            回复文本
+        """
+        async with scheduler.slot("bedrock", self.work_class):
+            self._inflight_calls += 1
+            try:
+                with bedrock_breaker.protect():
+                    return await scheduler.run_in_thread(
+                        self.work_class,
+                        self._invoke_bedrock_sync,
+                        messages,
+                        temperature=0.3,
+                        max_tokens=self._stage1_plan.max_tokens,
+                        cancel_event=cancel_event,
+                        model_id=model_id,
+                        region=region
+                    )
+            finally:
+                self._inflight_calls -= 1
+
+    async def _invoke_stage1_hedged(self, messages, doc_short_id: str) -> str:
+        """
+        Stage 1调用（对冲请求）
+
+        主请求耗时超过近期分位数时，再发一个相同请求（可指定其他模型配置文件或区域），
+        取先成功的结果并取消另一个。对冲比例受全局上限约束。
+
+        Args:
+            messages: 消息列表
+            doc_short_id: 文档短ID（日志用）
+
+        Returns:
+            回复文本
+        """
+        from app.core.config import settings
+
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+
+        primary_cancel = threading.Event()
+        primary = asyncio.ensure_future(self._invoke_stage1_attempt(messages, primary_cancel))
+        attempts = {primary: primary_cancel}
+        hedge = None
+
+        stage1_hedge_policy.start_call()
+        delay = stage1_hedge_policy.delay()
+
+        try:
+            if delay is not None:
+                await asyncio.wait({primary}, timeout=delay)
+                if not primary.done():
+                    if stage1_hedge_policy.try_hedge():
+                        hedge_cancel = threading.Event()
+                        hedge = asyncio.ensure_future(self._invoke_stage1_attempt(
+                            messages,
+                            hedge_cancel,
+                            model_id=settings.stage1_hedge_model_id,
+                            region=settings.stage1_hedge_region
+                        ))
+                        attempts[hedge] = hedge_cancel
+                        metrics.increment("stage1_hedges_fired")
+                        logger.info(
+                            "stage1_hedge_fired",
+                            doc_short_id=doc_short_id,
+                            delay_seconds=round(delay, 2)
+                        )
+                    else:
+                        metrics.increment("stage1_hedges_denied")
+
+            # 取先成功的结果；一个失败时等待另一个
+            pending = set(attempts)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+                if winner is not None or not pending:
+                    break
+
+            if winner is None:
+                # 都失败：抛出主请求的异常
+                raise primary.exception()
+
+            # 主请求耗时（被对冲请求取代时为当前已耗时，作为下限）
+            stage1_hedge_policy.record(loop.time() - start_time)
+
+            if winner is hedge:
+                metrics.increment("stage1_hedges_won")
+                logger.info(
+                    "stage1_hedge_won",
+                    doc_short_id=doc_short_id,
+                    elapsed_seconds=round(loop.time() - start_time, 2)
+                )
+
+            return winner.result()
+
+        finally:
+            for task, cancel_event in attempts.items():
+                if not task.done():
+                    cancel_event.set()
+                    task.cancel()
+
     def _invoke_bedrock_sync(
         self,
         messages,
         temperature: float = 0.7,
-        max_tokens: int = 8000
+        max_tokens: int = 8000,
+        cancel_event: Optional[threading.Event] = None,
+        model_id: Optional[str] = None,
+        region: Optional[str] = None
     ) -> str:
         """
         同步调用Bedrock（辅助方法）
 
+        使用converse_stream逐块读取，查询被取消时关闭流并中止生成，
+        避免客户端断开后继续消耗Bedrock配额。
+
         Args:
             messages: 消息列表
             temperature: 温度参数
             max_tokens: 最大token数
+            cancel_event: 本次调用的取消信号（对冲请求中被取代的一方）
+            model_id: 模型ID，默认使用generation_model_id
+            region: 区域，默认与boto_session相同
 
         Returns:
             回复文本
+
+        Raises:
+            RuntimeError: 查询或本次调用已取消
         """
         from app.core.config import settings
 
+        def cancelled() -> bool:
+            return self._cancelled.is_set() or (cancel_event is not None and cancel_event.is_set())
+
+        if cancelled():
+            raise RuntimeError("查询已取消")
+
+        model_id = model_id or settings.generation_model_id
+
         # 直接使用BedrockClient的boto_session创建runtime client
-        bedrock_runtime = self.bedrock_client.boto_session.client('bedrock-runtime')
+        if region:
+            bedrock_runtime = self.bedrock_client.boto_session.client('bedrock-runtime', region_name=region)
+        else:
+            bedrock_runtime = self.bedrock_client.boto_session.client('bedrock-runtime')
 
         logger.info(
             "calling_bedrock_converse_api",
-            model_id=settings.generation_model_id,
+            model_id=model_id,
+            region=region,
             max_tokens=max_tokens,
             temperature=temperature,
             messages_count=len(messages)
         )
 
         try:
-            response = bedrock_runtime.converse(
-                modelId=settings.generation_model_id,
+            response = bedrock_runtime.converse_stream(
+                modelId=model_id,
                 messages=messages,
                 inferenceConfig={
                     "maxTokens": max_tokens,
@@ -763,19 +1320,33 @@ class TwoStageExecutor:
                 }
             )
 
-            logger.info(
-                "bedrock_converse_api_success",
-                input_tokens=response.get('usage', {}).get('inputTokens', 0),
-                output_tokens=response.get('usage', {}).get('outputTokens', 0)
-            )
-
-            # 提取回复文本
-            output_message = response['output']['message']
-            text = output_message['content'][0]['text']
+            stream = response['stream']
+            parts = []
+            try:
+                for event in stream:
+                    if cancelled():
+                        logger.info("bedrock_converse_api_aborted", received_length=sum(len(p) for p in parts))
+                        raise RuntimeError("查询已取消")
+
+                    if 'contentBlockDelta' in event:
+                        delta = event['contentBlockDelta']['delta']
+                        if 'text' in delta:
+                            parts.append(delta['text'])
+                    elif 'metadata' in event:
+                        usage = event['metadata'].get('usage', {})
+                        logger.info(
+                            "bedrock_converse_api_success",
+                            input_tokens=usage.get('inputTokens', 0),
+                            output_tokens=usage.get('outputTokens', 0)
+                        )
+            finally:
+                stream.close()
 
-            return text
+            return "".join(parts)
 
         except Exception as e:
+            if cancelled():
+                raise
             logger.error(
                 "bedrock_converse_api_failed",
                 error=str(e),
@@ -799,10 +1370,8 @@ class TwoStageExecutor:
         Yields:
             生成的文本片段
         """
-        from app.core.config import settings
-
         # 1. 构建Stage 2 Prompt
-        prompt = self._build_stage2_prompt(query, stage1_results)
+        prompt = self._build_stage2_prompt(query, stage1_results, history=self._history)
 
         # 2. 调用Bedrock流式API
         messages = [
@@ -812,6 +1381,54 @@ class TwoStageExecutor:
             }
         ]
 
+        # 按work_class占用Bedrock槽位（整个流式响应期间），熔断中直接失败
+        async with scheduler.slot("bedrock", self.work_class):
+            with bedrock_breaker.protect():
+                self._stage2_started = True
+
+                # 生成长度按（等到槽位后的）剩余时间估算
+                max_tokens = output_token_budget(self._deadline.remaining()) if self._deadline else MAX_OUTPUT_TOKENS
+                async for text_chunk in self._stream_converse(messages, max_tokens=max_tokens, deadline=self._deadline):
+                    yield text_chunk
+
+    async def _stream_converse(
+        self,
+        messages: List[Dict],
+        max_tokens: int = MAX_OUTPUT_TOKENS,
+        deadline: Optional[Deadline] = None
+    ):
+        """
+        调用Bedrock converse_stream API，逐块返回文本
+
+        生成器被取消或提前关闭时关闭Bedrock流，中止模型生成。
+
+        Args:
+            messages: 消息列表
+            max_tokens: 最大token数
+            deadline: 截止时间（每次读取都不超过剩余时间）
+
+        Yields:
+            生成的文本片段
+
+        Raises:
+            DeadlineExceededError: 到达截止时间
+        """
+        from app.core.config import settings
+
+        stream = None
+        finished = False
+        full_text = ""
+
+        async def run_until_deadline(func, *args):
+            """在线程中执行，等待时间不超过截止时间"""
+            call = scheduler.run_in_thread(self.work_class, func, *args)
+            if deadline is None:
+                return await call
+            try:
+                return await asyncio.wait_for(call, timeout=deadline.remaining())
+            except asyncio.TimeoutError:
+                raise DeadlineExceededError("Stage 2", deadline.total)
+
         try:
             # 使用流式API
             bedrock_runtime = self.bedrock_client.boto_session.client('bedrock-runtime')
@@ -819,7 +1436,7 @@ class TwoStageExecutor:
             logger.info(
                 "calling_bedrock_converse_stream_api",
                 model_id=settings.generation_model_id,
-                max_tokens=8000,
+                max_tokens=max_tokens,
                 temperature=0.7,
                 messages_count=len(messages)
             )
@@ -830,18 +1447,22 @@ class TwoStageExecutor:
                     modelId=settings.generation_model_id,
                     messages=messages,
                     inferenceConfig={
-                        "maxTokens": 8000,
+                        "maxTokens": max_tokens,
                         "temperature": 0.7
                     }
                 )
+                # 等待响应期间查询已取消：直接关闭，不再读取
+                if self._cancelled.is_set():
+                    response['stream'].close()
+                    return None
                 return response['stream']
 
             # 异步执行同步调用
-            stream = await asyncio.to_thread(sync_stream)
+            stream = await run_until_deadline(sync_stream)
+            if stream is None:
+                return
 
             # 处理流式响应（在后台线程中迭代）
-            full_text = ""
-
             def read_next_event(stream_iter):
                 """从stream中读取下一个event（同步操作）"""
                 try:
@@ -853,7 +1474,7 @@ class TwoStageExecutor:
 
             while True:
                 # 异步读取下一个event
-                event = await asyncio.to_thread(read_next_event, stream_iter)
+                event = await run_until_deadline(read_next_event, stream_iter)
 
                 if event is None:
                     break  # 流结束
@@ -875,6 +1496,8 @@ class TwoStageExecutor:
                         total_length=len(full_text)
                     )
 
+            finished = True
+
         except Exception as e:
             logger.error(
                 "bedrock_converse_stream_failed",
@@ -884,6 +1507,14 @@ class TwoStageExecutor:
             )
             raise
 
+        finally:
+            if not finished:
+                self._cancelled.set()
+                if stream is not None:
+                    self._aborted_streams += 1
+                    stream.close()
+                    logger.info("bedrock_converse_stream_closed", received_length=len(full_text))
+
     async def _stage2_synthesize_sync(
         self,
         query: str,
@@ -935,7 +1566,7 @@ class TwoStageExecutor:
                 "bedrock_stage2_timeout",
                 timeout=300
             )
-            raise Exception("Bedrock Stage 2调用超时（300秒）")
+            raise TimeoutError("Bedrock Stage 2调用超时（300秒）")
 
         except Exception as e:
             logger.error(
@@ -962,12 +1593,15 @@ class TwoStageExecutor:
         """
         from app.services.reference_extractor import Reference
 
-        # 打印详细debug信息
+        # 打印详细debug信息（原始数据只在debug级别输出）
         logger.info(
             "parsing_llm_references_start",
             llm_references_count=len(llm_references),
-            llm_references=llm_references,  # 打印原始数据
-            available_doc_short_ids=[r.doc_short_id for r in stage1_results]
+            available_doc_short_ids=lazy(lambda: [r.doc_short_id for r in stage1_results])
+        )
+        logger.debug(
+            "parsing_llm_references_raw",
+            llm_references=llm_references
         )
 
         references = []
@@ -1042,7 +1676,7 @@ class TwoStageExecutor:
                         chunk_id=chunk_id,
                         chunk_id_clean=chunk_id_clean,
                         extracted_doc_short_id=doc_short_id,
-                        available_doc_short_ids=[r.doc_short_id for r in stage1_results]
+                        available_doc_short_ids=lazy(lambda: [r.doc_short_id for r in stage1_results])
                     )
                     continue
 
@@ -1059,7 +1693,7 @@ class TwoStageExecutor:
                     logger.warning(
                         "chunk_id_not_in_references_map",
                         chunk_id=chunk_id_clean,
-                        available_refs=list(target_result.references_map.keys())[:5]  # 只打印前5个
+                        available_refs=lazy(lambda: list(target_result.references_map.keys())[:5])  # 只打印前5个
                     )
 
                 # 构建image_url
@@ -1235,7 +1869,7 @@ class TwoStageExecutor:
                 logger.warning(
                     "reference_not_found_in_stage1_results",
                     ref_id=ref_id,
-                    available_docs=[r.doc_short_id for r in stage1_results]
+                    available_docs=lazy(lambda: [r.doc_short_id for r in stage1_results])
                 )
 
         logger.info(
@@ -1323,11 +1957,11 @@ class TwoStageExecutor:
             logger.warning(
                 "image_file_not_found_in_references",
                 filename=filename,
-                available_images=[
+                available_images=lazy(lambda: [
                     ref_content
                     for result in stage1_results
-                    for ref_id, ref_content in result.references_map.items()
-                ]
+                    for ref_content in result.references_map.values()
+                ])
             )
             return match.group(0)
 
@@ -1342,41 +1976,59 @@ class TwoStageExecutor:
 
         return converted_text
 
-    def _build_stage2_prompt(self, query: str, stage1_results: List[Stage1Result]) -> str:
+    def _build_stage2_prompt(
+        self,
+        query: str,
+        stage1_results: List[Stage1Result],
+        history: Optional[List[Tuple[str, str]]] = None
+    ) -> str:
         """
         构建Stage 2 Prompt
 
         Args:
             query: 用户问题
             stage1_results: Stage 1结果列表
+            history: 多轮对话中之前的(问题, 答案)
 
         Returns:
             完整的prompt文本
         """
-        # 格式化所有stage1_results
+        from app.core.config import settings
+
+        # 格式化所有stage1_results（有预生成摘要的文档在回复前附加摘要）
         formatted_responses = []
         for idx, result in enumerate(stage1_results, 1):
+            summary_section = f"## 文档总结\n\n{result.summary}\n\n---\n\n" if result.summary else ""
             formatted_responses.append(f"""
 === 文档 {idx}: {result.doc_name} ===
 
-{result.response_text}
+{summary_section}{result.response_text}
 """)
 
         all_responses_text = "\n\n".join(formatted_responses)
 
+        # 之前的问答（答案按conversation_history_answer_chars截断）
+        history_text = ""
+        if history:
+            turns = "\n\n".join(
+                f"第{index}轮\n问题：{question}\n回答：{answer[:settings.conversation_history_answer_chars]}"
+                for index, (question, answer) in enumerate(history, start=1)
+            )
+            history_text = STAGE2_HISTORY_TEMPLATE.format(turns=turns)
+
         # 填充模板
         prompt = STAGE2_PROMPT_TEMPLATE.format(
             doc_count=len(stage1_results),
             all_stage1_responses=all_responses_text,
+            history=history_text,
             query=query
         )
 
-        # 打印Stage 2的完整prompt（用于debug）
+        # 打印Stage 2的prompt（用于debug，按log_max_string_length截断，设为0可输出完整prompt）
         logger.debug(
             "stage2_prompt_built",
             prompt_length=len(prompt),
-            prompt_preview=prompt[:2000],  # 前2000字符
-            full_prompt=prompt  # 完整prompt
+            full_prompt=prompt
         )
 
         return prompt
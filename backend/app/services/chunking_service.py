@@ -1,15 +1,16 @@
 """
 文本分块服务
-使用LangChain对Markdown文本进行智能分块
+对Markdown文本进行递归分块（按偏移切分，单遍、流式）
 """
 import uuid
 import re
+from bisect import bisect_left
+from collections import deque
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-
 from app.core.config import settings
 from app.core.logging import get_logger
 from app.core.errors import DocumentNotFoundError
@@ -17,6 +18,9 @@ from app.models.database import Document, Chunk
 
 logger = get_logger(__name__)
 
+# Markdown图片语法: ![alt](image.png) 或 ![alt](images/image.png)
+IMAGE_REF_PATTERN = re.compile(r'!\[[^\]]*\]\(([^)]*?\.(?:png|jpg|jpeg|gif|svg|webp))\)', re.IGNORECASE)
+
 
 class ChunkingService:
     """文本分块服务"""
@@ -24,6 +28,7 @@ class ChunkingService:
     # 分块参数
     CHUNK_SIZE = 1000  # 每个chunk的字符数
     CHUNK_OVERLAP = 200  # chunk之间的重叠字符数
+    STREAM_BATCH_SIZE = 100  # 流式保存时每批的chunk数量
 
     # 中文优化的分隔符
     SEPARATORS = [
@@ -74,17 +79,18 @@ class ChunkingService:
         if not doc:
             raise DocumentNotFoundError(document_id)
 
+        # 一次扫描定位所有图片引用
+        image_refs = ChunkingService._scan_image_references(markdown_content)
+
         # 1. 处理文本分块
-        text_chunks = ChunkingService._chunk_text(
-            markdown_content=markdown_content,
-            document_id=document_id
-        )
+        text_chunks = list(ChunkingService.iter_text_chunks(markdown_content, image_refs))
 
         # 2. 处理图片分块
         image_chunks = ChunkingService._create_image_chunks(
             images_info=images_info,
             document_id=document_id,
-            markdown_content=markdown_content
+            markdown_content=markdown_content,
+            image_refs=image_refs
         )
 
         logger.info(
@@ -97,76 +103,232 @@ class ChunkingService:
         return text_chunks, image_chunks
 
     @staticmethod
-    def _chunk_text(
+    def stream_chunks_to_db(
+        db: Session,
+        document_id: str,
         markdown_content: str,
-        document_id: str
-    ) -> List[Dict]:
+        images_info: List[Dict],
+        batch_size: Optional[int] = None
+    ) -> Iterator[List[Dict]]:
         """
-        使用LangChain对文本进行分块
+        边分块边保存，按批产出已保存的chunk行数据
+
+        调用方可在分块完成前就开始对先产出的批次做向量化
 
         Args:
-            markdown_content: Markdown文本
+            db: 数据库会话
             document_id: 文档ID
+            markdown_content: Markdown文本内容
+            images_info: 图片信息列表
+            batch_size: 每批chunk数量
 
-        Returns:
-            文本chunk列表
+        Yields:
+            已写入数据库的chunk行数据列表
         """
-        logger.info("start_text_chunking", document_id=document_id)
-
-        # 创建分块器
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=ChunkingService.CHUNK_SIZE,
-            chunk_overlap=ChunkingService.CHUNK_OVERLAP,
-            separators=ChunkingService.SEPARATORS,
-            length_function=len,
-            is_separator_regex=False
+        batch_size = batch_size or ChunkingService.STREAM_BATCH_SIZE
+        image_refs = ChunkingService._scan_image_references(markdown_content)
+
+        text_count = 0
+        batch: List[Dict] = []
+        for chunk_data in ChunkingService.iter_text_chunks(markdown_content, image_refs):
+            batch.append(chunk_data)
+            if len(batch) >= batch_size:
+                yield ChunkingService.save_chunks_to_db(db, document_id, batch, [])
+                text_count += len(batch)
+                batch = []
+
+        if batch:
+            yield ChunkingService.save_chunks_to_db(db, document_id, batch, [])
+            text_count += len(batch)
+
+        image_chunks = ChunkingService._create_image_chunks(
+            images_info=images_info,
+            document_id=document_id,
+            markdown_content=markdown_content,
+            image_refs=image_refs
+        )
+        for start in range(0, len(image_chunks), batch_size):
+            yield ChunkingService.save_chunks_to_db(
+                db, document_id, [], image_chunks[start:start + batch_size]
+            )
+
+        logger.info(
+            "chunking_completed",
+            document_id=document_id,
+            text_chunks_count=text_count,
+            image_chunks_count=len(image_chunks)
         )
 
-        # 分块
-        chunks = text_splitter.split_text(markdown_content)
+    @staticmethod
+    def iter_text_chunks(
+        markdown_content: str,
+        image_refs: Optional[List[Tuple[int, int, str]]] = None
+    ) -> Iterator[Dict]:
+        """
+        单遍递归分块（生成器）
+
+        直接在原文上按(offset, length)切分，分块位置和上下文都按偏移计算，
+        不做子串查找，也不复制整篇文档
+
+        Args:
+            markdown_content: Markdown文本
+            image_refs: 图片引用位置列表（_scan_image_references的结果）
 
-        # 构建chunk数据
-        text_chunks = []
-        char_position = 0
+        Yields:
+            文本chunk数据
+        """
+        if image_refs is None:
+            image_refs = ChunkingService._scan_image_references(markdown_content)
+        ref_starts = [ref[0] for ref in image_refs]
+        text_length = len(markdown_content)
 
-        for idx, chunk_text in enumerate(chunks):
-            # 查找chunk在原文中的位置
-            char_start = markdown_content.find(chunk_text, char_position)
-            if char_start == -1:
-                # 如果找不到（可能因为分隔符处理），使用估算位置
-                char_start = char_position
-            char_end = char_start + len(chunk_text)
+        spans = ChunkingService._split_spans(
+            markdown_content, 0, text_length, ChunkingService.SEPARATORS
+        )
 
+        for idx, (char_start, char_end) in enumerate(spans):
             # 提取chunk上下文（包含前后内容，用于更好的向量化）
             context_start = max(0, char_start - 100)
-            context_end = min(len(markdown_content), char_end + 100)
-            content_with_context = markdown_content[context_start:context_end]
+            context_end = min(text_length, char_end + 100)
 
-            # 检查是否包含图片引用
-            image_references = ChunkingService._extract_image_references(chunk_text)
+            # 二分查找落在chunk范围内的图片引用
+            lo = bisect_left(ref_starts, char_start)
+            hi = bisect_left(ref_starts, char_end)
+            image_references = [
+                filename for start, end, filename in image_refs[lo:hi] if end <= char_end
+            ]
 
-            chunk_data = {
+            yield {
                 "chunk_index": idx,
-                "content": chunk_text.strip(),
-                "content_with_context": content_with_context.strip(),
+                "content": markdown_content[char_start:char_end],
+                "content_with_context": markdown_content[context_start:context_end].strip(),
                 "char_start": char_start,
                 "char_end": char_end,
                 "has_image_refs": len(image_references) > 0,
                 "image_refs": image_references
             }
 
-            text_chunks.append(chunk_data)
+    @staticmethod
+    def _split_spans(
+        text: str,
+        start: int,
+        end: int,
+        separators: List[str]
+    ) -> Iterator[Tuple[int, int]]:
+        """
+        递归字符分块，产出去除首尾空白后的(char_start, char_end)区间
 
-            # 更新字符位置
-            char_position = char_end
+        与RecursiveCharacterTextSplitter(keep_separator=True)行为一致：
+        按第一个出现的分隔符切分，分隔符保留在下一段开头；
+        小片段合并到CHUNK_SIZE并保留CHUNK_OVERLAP重叠，超长片段用后续分隔符递归切分
+        """
+        # 选择范围内出现的第一个分隔符
+        separator = separators[-1]
+        remaining: List[str] = []
+        for i, candidate in enumerate(separators):
+            if candidate == "":
+                separator = candidate
+                break
+            if text.find(candidate, start, end) != -1:
+                separator = candidate
+                remaining = separators[i + 1:]
+                break
+
+        chunk_size = ChunkingService.CHUNK_SIZE
+        chunk_overlap = ChunkingService.CHUNK_OVERLAP
+
+        # 当前合并窗口（连续片段），片段首尾相接，区间即(current[0][0], current[-1][1])
+        current: Deque[Tuple[int, int]] = deque()
+        total = 0
+
+        def flush() -> Optional[Tuple[int, int]]:
+            if not current:
+                return None
+            return ChunkingService._strip_span(text, current[0][0], current[-1][1])
+
+        for piece_start, piece_end in ChunkingService._separator_pieces(text, start, end, separator):
+            piece_length = piece_end - piece_start
+
+            if piece_length >= chunk_size:
+                # 超长片段：先输出已合并的窗口，再递归切分
+                span = flush()
+                if span:
+                    yield span
+                current.clear()
+                total = 0
+
+                if remaining:
+                    yield from ChunkingService._split_spans(text, piece_start, piece_end, remaining)
+                else:
+                    span = ChunkingService._strip_span(text, piece_start, piece_end)
+                    if span:
+                        yield span
+                continue
+
+            if total + piece_length > chunk_size and current:
+                span = flush()
+                if span:
+                    yield span
+                # 保留末尾不超过overlap的片段作为下一个chunk的开头
+                while current and (total > chunk_overlap or total + piece_length > chunk_size):
+                    head_start, head_end = current.popleft()
+                    total -= head_end - head_start
+
+            current.append((piece_start, piece_end))
+            total += piece_length
+
+        span = flush()
+        if span:
+            yield span
 
-        logger.info(
-            "text_chunking_completed",
-            document_id=document_id,
-            chunks_count=len(text_chunks)
-        )
+    @staticmethod
+    def _separator_pieces(
+        text: str,
+        start: int,
+        end: int,
+        separator: str
+    ) -> Iterator[Tuple[int, int]]:
+        """按分隔符切分区间（分隔符保留在下一段开头），跳过空片段"""
+        if separator == "":
+            for position in range(start, end):
+                yield position, position + 1
+            return
+
+        piece_start = start
+        position = text.find(separator, start + 1, end)
+        while position != -1:
+            if position > piece_start:
+                yield piece_start, position
+            piece_start = position
+            position = text.find(separator, position + len(separator), end)
+
+        if end > piece_start:
+            yield piece_start, end
+
+    @staticmethod
+    def _strip_span(text: str, start: int, end: int) -> Optional[Tuple[int, int]]:
+        """按偏移去除区间首尾空白，空区间返回None"""
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        return (start, end) if end > start else None
+
+    @staticmethod
+    def _scan_image_references(markdown_content: str) -> List[Tuple[int, int, str]]:
+        """
+        一次扫描提取所有图片引用
 
-        return text_chunks
+        Args:
+            markdown_content: Markdown内容
+
+        Returns:
+            [(start, end, filename), ...]，按出现位置排序
+        """
+        return [
+            (match.start(), match.end(), Path(match.group(1)).name)
+            for match in IMAGE_REF_PATTERN.finditer(markdown_content)
+        ]
 
     @staticmethod
     def _extract_image_references(text: str) -> List[str]:
@@ -179,24 +341,14 @@ class ChunkingService:
         Returns:
             图片文件名列表
         """
-        # Markdown图片语法: ![alt](image.png)
-        # 或者: ![alt](images/image.png)
-        pattern = r'!\[.*?\]\((.*?\.(?:png|jpg|jpeg|gif|svg))\)'
-        matches = re.findall(pattern, text, re.IGNORECASE)
-
-        # 提取文件名
-        filenames = []
-        for match in matches:
-            filename = Path(match).name
-            filenames.append(filename)
-
-        return filenames
+        return [ref[2] for ref in ChunkingService._scan_image_references(text)]
 
     @staticmethod
     def _create_image_chunks(
         images_info: List[Dict],
         document_id: str,
-        markdown_content: str
+        markdown_content: str,
+        image_refs: Optional[List[Tuple[int, int, str]]] = None
     ) -> List[Dict]:
         """
         创建图片chunk
@@ -205,6 +357,7 @@ class ChunkingService:
             images_info: 图片信息列表
             document_id: 文档ID
             markdown_content: Markdown内容（用于提取上下文）
+            image_refs: 图片引用位置列表（_scan_image_references的结果）
 
         Returns:
             图片chunk列表
@@ -215,16 +368,25 @@ class ChunkingService:
             images_count=len(images_info)
         )
 
+        if image_refs is None:
+            image_refs = ChunkingService._scan_image_references(markdown_content)
+
+        # 每个图片取第一次出现的位置
+        first_refs: Dict[str, Tuple[int, int]] = {}
+        for start, end, filename in image_refs:
+            first_refs.setdefault(filename, (start, end))
+
         image_chunks = []
 
         for idx, img_info in enumerate(images_info):
             filename = img_info["filename"]
             description = img_info.get("description", "")
 
-            # 尝试从Markdown中提取图片周围的上下文
+            # 按偏移提取图片周围的上下文
             context = ChunkingService._extract_image_context(
                 markdown_content,
-                filename
+                filename,
+                first_refs.get(filename)
             )
 
             # 分析图片类型（基于描述）
@@ -253,33 +415,36 @@ class ChunkingService:
         return image_chunks
 
     @staticmethod
-    def _extract_image_context(markdown_content: str, filename: str) -> str:
+    def _extract_image_context(
+        markdown_content: str,
+        filename: str,
+        ref_span: Optional[Tuple[int, int]]
+    ) -> str:
         """
         提取图片周围的上下文文本
 
         Args:
             markdown_content: Markdown内容
             filename: 图片文件名
+            ref_span: 图片引用在原文中的位置(start, end)
 
         Returns:
             上下文文本
         """
-        # 查找图片引用位置
-        pattern = rf'!\[.*?\]\(.*?{re.escape(filename)}.*?\)'
-        match = re.search(pattern, markdown_content, re.IGNORECASE)
-
-        if not match:
+        if not ref_span:
             return ""
 
         # 提取图片前后的文本（各200字符）
-        img_pos = match.start()
-        context_start = max(0, img_pos - 200)
-        context_end = min(len(markdown_content), match.end() + 200)
+        context_start = max(0, ref_span[0] - 200)
+        context_end = min(len(markdown_content), ref_span[1] + 200)
 
         context = markdown_content[context_start:context_end]
 
         # 移除图片引用本身
-        context = re.sub(pattern, "[图片]", context, flags=re.IGNORECASE)
+        context = IMAGE_REF_PATTERN.sub(
+            lambda m: "[图片]" if Path(m.group(1)).name == filename else m.group(0),
+            context
+        )
 
         return context.strip()
 
@@ -323,9 +488,12 @@ class ChunkingService:
         document_id: str,
         text_chunks: List[Dict],
         image_chunks: List[Dict]
-    ) -> List[str]:
+    ) -> List[Dict]:
         """
-        保存chunks到数据库
+        批量保存chunks到数据库
+
+        使用单条INSERT + executemany在一个事务内写入，返回的行数据可直接用于向量化，
+        无需再按ID回查数据库
 
         Args:
             db: 数据库会话
@@ -334,7 +502,7 @@ class ChunkingService:
             image_chunks: 图片chunk列表
 
         Returns:
-            chunk_ids列表
+            chunk行数据列表（与chunks表字段一致）
 
         Raises:
             DocumentNotFoundError: 文档不存在
@@ -347,62 +515,53 @@ class ChunkingService:
         )
 
         # 验证文档存在
-        doc = db.query(Document).filter(Document.id == document_id).first()
-        if not doc:
+        kb_id = db.query(Document.kb_id).filter(Document.id == document_id).scalar()
+        if not kb_id:
             raise DocumentNotFoundError(document_id)
 
-        chunk_ids = []
+        # executemany要求每行字段一致
+        rows = []
 
-        try:
-            # 保存文本chunks
-            for chunk_data in text_chunks:
-                chunk_id = str(uuid.uuid4())
-
-                chunk = Chunk(
-                    id=chunk_id,
-                    document_id=document_id,
-                    kb_id=doc.kb_id,
-                    chunk_type="text",
-                    chunk_index=chunk_data["chunk_index"],
-                    content=chunk_data["content"],
-                    content_with_context=chunk_data["content_with_context"],
-                    char_start=chunk_data.get("char_start"),
-                    char_end=chunk_data.get("char_end")
-                )
-
-                db.add(chunk)
-                chunk_ids.append(chunk_id)
-
-            # 保存图片chunks
-            for chunk_data in image_chunks:
-                chunk_id = str(uuid.uuid4())
-
-                chunk = Chunk(
-                    id=chunk_id,
-                    document_id=document_id,
-                    kb_id=doc.kb_id,
-                    chunk_type="image",
-                    chunk_index=chunk_data["chunk_index"],
-                    content=chunk_data["content"],  # description
-                    content_with_context=chunk_data["content_with_context"],
-                    image_filename=chunk_data["image_filename"],
-                    image_local_path=chunk_data.get("image_path"),
-                    image_description=chunk_data["image_description"],
-                    image_type=chunk_data["image_type"]
-                )
-
-                db.add(chunk)
-                chunk_ids.append(chunk_id)
+        for chunk_data in text_chunks:
+            rows.append(ChunkingService._build_chunk_row(
+                document_id=document_id,
+                kb_id=kb_id,
+                chunk_type="text",
+                chunk_index=chunk_data["chunk_index"],
+                content=chunk_data["content"],
+                content_with_context=chunk_data["content_with_context"],
+                char_start=chunk_data.get("char_start"),
+                char_end=chunk_data.get("char_end")
+            ))
+
+        for chunk_data in image_chunks:
+            rows.append(ChunkingService._build_chunk_row(
+                document_id=document_id,
+                kb_id=kb_id,
+                chunk_type="image",
+                chunk_index=chunk_data["chunk_index"],
+                content=chunk_data["content"],  # description
+                content_with_context=chunk_data["content_with_context"],
+                image_filename=chunk_data["image_filename"],
+                image_local_path=chunk_data.get("image_path"),
+                image_description=chunk_data["image_description"],
+                image_type=chunk_data["image_type"]
+            ))
+
+        if not rows:
+            return rows
 
+        try:
+            db.execute(insert(Chunk), rows)
             db.commit()
 
             logger.info(
                 "chunks_saved_to_db",
                 document_id=document_id,
-                total_chunks=len(chunk_ids)
+                total_chunks=len(rows)
             )
 
-            return chunk_ids
+            return rows
 
         except Exception as e:
             db.rollback()
@@ -414,6 +573,60 @@ class ChunkingService:
             )
             raise
 
+    @staticmethod
+    def _build_chunk_row(
+        document_id: str,
+        kb_id: str,
+        chunk_type: str,
+        chunk_index: int,
+        content: Optional[str],
+        content_with_context: Optional[str],
+        char_start: Optional[int] = None,
+        char_end: Optional[int] = None,
+        image_filename: Optional[str] = None,
+        image_local_path: Optional[str] = None,
+        image_description: Optional[str] = None,
+        image_type: Optional[str] = None
+    ) -> Dict:
+        """构建一行chunk数据"""
+        return {
+            "id": str(uuid.uuid4()),
+            "document_id": document_id,
+            "kb_id": kb_id,
+            "chunk_type": chunk_type,
+            "chunk_index": chunk_index,
+            "content": content,
+            "content_with_context": content_with_context,
+            "char_start": char_start,
+            "char_end": char_end,
+            "image_filename": image_filename,
+            "image_local_path": image_local_path,
+            "image_description": image_description,
+            "image_type": image_type,
+        }
+
+    @staticmethod
+    def delete_document_chunks(db: Session, document_id: str) -> int:
+        """
+        删除文档已有的chunks（重新分块前清理上次中断遗留的数据）
+
+        Args:
+            db: 数据库会话
+            document_id: 文档ID
+
+        Returns:
+            删除的chunk数量
+        """
+        deleted = db.query(Chunk).filter(
+            Chunk.document_id == document_id
+        ).delete(synchronize_session=False)
+        db.commit()
+
+        if deleted:
+            logger.info("stale_chunks_deleted", document_id=document_id, count=deleted)
+
+        return deleted
+
 
 # 全局实例
 chunking_service = ChunkingService()
@@ -0,0 +1,468 @@
+"""
+多轮对话服务
+保存每轮问答和各文档的Stage 1结果。追问时先用小模型判断已有结果是否足以回答：
+足够时复用已有结果（只执行Stage 2），不够时重新阅读；检索到的新文档只对新文档执行Stage 1
+"""
+import asyncio
+import json
+import re
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.errors import ConversationNotFoundError
+from app.core.logging import get_logger
+from app.core.scheduler import scheduler, WorkClass
+from app.models.database import (
+    Conversation,
+    ConversationStage1Result,
+    ConversationTurn,
+    Document,
+)
+from app.services.reference_extractor import Stage1Result
+from app.utils.bedrock_client import bedrock_client
+
+logger = get_logger(__name__)
+
+
+SUFFICIENCY_PROMPT_TEMPLATE = """用户正在就产品文档进行多轮对话。之前阅读文档时，已经针对之前的问题整理出了下面的原文引用和回答。
+请判断这些已有内容是否足以回答用户的新问题（不需要重新阅读文档全文）。
+
+判断标准：
+- 已有内容包含回答新问题所需的原文信息 → 足够
+- 新问题涉及已有内容没有覆盖的功能、流程或细节 → 不足
+- 无法确定时判断为不足
+
+只输出一行JSON，不要输出其他内容：
+{{"sufficient": true或false, "reason": "不超过30字的理由"}}
+
+之前的问题：
+{previous_queries}
+
+新问题：{query}
+
+已有内容：
+{extracts}
+"""
+
+_JSON_PATTERN = re.compile(r'\{.*\}', re.DOTALL)
+
+
+@dataclass
+class ConversationContext:
+    """追问时使用的对话上下文"""
+    conversation_id: str
+    history: List[Tuple[str, str]] = field(default_factory=list)  # 最近几轮的(问题, 答案)，按时间顺序
+    cached_results: Dict[str, Stage1Result] = field(default_factory=dict)  # 文档内容未变化的已有Stage 1结果
+
+    def contextual_query(self, query: str) -> str:
+        """
+        带上文的问题（用于检索和Stage 1：追问通常省略了主语，如"那退款流程呢？"）
+
+        Args:
+            query: 当前问题
+
+        Returns:
+            第一轮时返回原问题，否则附加之前的问题
+        """
+        if not self.history:
+            return query
+        previous = "；".join(question for question, _ in self.history)
+        return f"{query}（上文问题：{previous}）"
+
+
+class ConversationService:
+    """多轮对话服务"""
+
+    @staticmethod
+    def create_conversation(
+        db: Session,
+        kb_id: str,
+        user_id: int,
+        title: Optional[str] = None
+    ) -> Conversation:
+        """
+        创建对话
+
+        Args:
+            db: 数据库会话
+            kb_id: 知识库ID
+            user_id: 用户ID
+            title: 标题（为空时在第一轮保存时使用问题）
+
+        Returns:
+            创建的对话对象
+        """
+        conversation = Conversation(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            kb_id=kb_id,
+            title=title
+        )
+        db.add(conversation)
+        db.commit()
+        db.refresh(conversation)
+
+        logger.info("conversation_created", conversation_id=conversation.id, kb_id=kb_id, user_id=user_id)
+        return conversation
+
+    @staticmethod
+    def get_conversation(db: Session, conversation_id: str, user_id: int) -> Conversation:
+        """
+        获取对话（只能访问自己的对话）
+
+        Args:
+            db: 数据库会话
+            conversation_id: 对话ID
+            user_id: 当前用户ID
+
+        Returns:
+            对话对象
+
+        Raises:
+            ConversationNotFoundError: 对话不存在或不属于当前用户
+        """
+        conversation = db.query(Conversation).filter(
+            Conversation.id == conversation_id,
+            Conversation.user_id == user_id
+        ).first()
+
+        if not conversation:
+            raise ConversationNotFoundError(conversation_id)
+        return conversation
+
+    @staticmethod
+    def list_conversations(
+        db: Session,
+        user_id: int,
+        kb_id: Optional[str] = None,
+        page: int = 1,
+        page_size: int = 20
+    ) -> Tuple[List[Conversation], int]:
+        """
+        列出当前用户的对话（按最近更新倒序）
+
+        Args:
+            db: 数据库会话
+            user_id: 当前用户ID
+            kb_id: 按知识库过滤（可选）
+            page: 页码（从1开始）
+            page_size: 每页数量
+
+        Returns:
+            (对话列表, 总数)
+        """
+        query = db.query(Conversation).filter(Conversation.user_id == user_id)
+        if kb_id:
+            query = query.filter(Conversation.kb_id == kb_id)
+
+        total = query.count()
+        conversations = query.order_by(Conversation.updated_at.desc()).offset(
+            (page - 1) * page_size
+        ).limit(page_size).all()
+        return conversations, total
+
+    @staticmethod
+    def delete_conversation(db: Session, conversation_id: str, user_id: int):
+        """
+        删除对话（连同轮次和已保存的Stage 1结果）
+
+        Args:
+            db: 数据库会话
+            conversation_id: 对话ID
+            user_id: 当前用户ID
+
+        Raises:
+            ConversationNotFoundError: 对话不存在或不属于当前用户
+        """
+        conversation = ConversationService.get_conversation(db, conversation_id, user_id)
+        db.delete(conversation)
+        db.commit()
+
+        logger.info("conversation_deleted", conversation_id=conversation_id, user_id=user_id)
+
+    @staticmethod
+    def load_context(db: Session, conversation_id: str) -> ConversationContext:
+        """
+        加载追问所需的上下文：最近几轮问答，以及文档内容未变化的Stage 1结果
+
+        Args:
+            db: 数据库会话
+            conversation_id: 对话ID
+
+        Returns:
+            ConversationContext对象
+        """
+        turns = db.query(ConversationTurn).filter(
+            ConversationTurn.conversation_id == conversation_id
+        ).order_by(ConversationTurn.turn_index.desc()).limit(settings.conversation_history_turns).all()
+
+        history = [
+            (turn.query_text, turn.answer_text or "")
+            for turn in reversed(turns)
+        ]
+
+        rows = db.query(
+            ConversationStage1Result, Document.content_hash, Document.status, Document.summary
+        ).join(
+            Document, Document.id == ConversationStage1Result.document_id
+        ).filter(
+            ConversationStage1Result.conversation_id == conversation_id
+        ).all()
+
+        cached_results: Dict[str, Stage1Result] = {}
+        stale = 0
+        for row, content_hash, status, summary in rows:
+            # 文档已删除或重新同步（内容变化）后不再复用
+            if status == "deleted" or content_hash != row.content_hash:
+                stale += 1
+                continue
+            cached_results[row.document_id] = Stage1Result(
+                doc_id=row.document_id,
+                doc_name=row.doc_name,
+                doc_short_id=row.document_id[:8],
+                response_text=row.response_text,
+                references_map=json.loads(row.references_map) if row.references_map else {},
+                summary=summary  # 保存的Stage 1结果不含文档总结，复用时与首轮一样附带同步时生成的摘要
+            )
+
+        logger.info(
+            "conversation_context_loaded",
+            conversation_id=conversation_id,
+            history_turns=len(history),
+            cached_results=len(cached_results),
+            stale_results=stale
+        )
+
+        return ConversationContext(
+            conversation_id=conversation_id,
+            history=history,
+            cached_results=cached_results
+        )
+
+    @staticmethod
+    def build_sufficiency_prompt(query: str, context: ConversationContext, document_ids: List[str]) -> str:
+        """
+        构建判断提示词：之前的问题 + 各文档已有的Stage 1结果
+
+        Args:
+            query: 当前问题
+            context: 对话上下文
+            document_ids: 要判断的文档ID（按相关度排序）
+
+        Returns:
+            提示词
+        """
+        remaining = settings.conversation_check_max_chars
+        extracts = []
+        for doc_id in document_ids:
+            result = context.cached_results[doc_id]
+            if remaining <= 0:
+                break
+            text = result.response_text[:remaining]
+            remaining -= len(text)
+            extracts.append(f"=== {result.doc_name} ===\n{text}")
+
+        previous_queries = "\n".join(
+            f"{index}. {question}" for index, (question, _) in enumerate(context.history, start=1)
+        )
+
+        return SUFFICIENCY_PROMPT_TEMPLATE.format(
+            previous_queries=previous_queries or "（无）",
+            query=query,
+            extracts="\n\n".join(extracts)
+        )
+
+    @staticmethod
+    def parse_sufficiency(text: str) -> Optional[Dict]:
+        """
+        解析模型输出的JSON
+
+        Args:
+            text: 模型输出
+
+        Returns:
+            {"sufficient": bool, "reason": str}，无法解析时返回None
+        """
+        match = _JSON_PATTERN.search(text or "")
+        if not match:
+            return None
+        try:
+            data = json.loads(match.group(0))
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or not isinstance(data.get("sufficient"), bool):
+            return None
+        return {"sufficient": data["sufficient"], "reason": str(data.get("reason") or "")}
+
+    @staticmethod
+    async def check_sufficient(
+        query: str,
+        context: ConversationContext,
+        document_ids: List[str]
+    ) -> Tuple[bool, str]:
+        """
+        判断已有Stage 1结果是否足以回答追问（失败、超时或无法解析时视为不足，重新阅读文档）
+
+        Args:
+            query: 当前问题
+            context: 对话上下文
+            document_ids: 有已有结果的文档ID
+
+        Returns:
+            (是否足够, 理由)
+        """
+        prompt = ConversationService.build_sufficiency_prompt(query, context, document_ids)
+
+        sufficient, reason = False, ""
+        try:
+            async with scheduler.slot("bedrock", WorkClass.INTERACTIVE):
+                output = await asyncio.wait_for(
+                    scheduler.run_in_thread(
+                        WorkClass.INTERACTIVE,
+                        bedrock_client.generate_text,
+                        prompt,
+                        max_tokens=200,
+                        temperature=0.0,
+                        model_id=settings.conversation_check_model_id
+                    ),
+                    timeout=settings.conversation_check_timeout_seconds
+                )
+
+            decision = ConversationService.parse_sufficiency(output)
+            if decision is None:
+                logger.warning("conversation_check_unparseable", conversation_id=context.conversation_id, output=output)
+                reason = "判断结果无法解析"
+            else:
+                sufficient, reason = decision["sufficient"], decision["reason"]
+
+        except asyncio.TimeoutError:
+            logger.warning(
+                "conversation_check_timeout",
+                conversation_id=context.conversation_id,
+                timeout=settings.conversation_check_timeout_seconds
+            )
+            reason = "判断超时"
+
+        except Exception as e:
+            logger.warning("conversation_check_failed", conversation_id=context.conversation_id, error=str(e))
+            reason = "判断失败"
+
+        logger.info(
+            "conversation_check_decision",
+            conversation_id=context.conversation_id,
+            document_count=len(document_ids),
+            sufficient=sufficient,
+            reason=reason
+        )
+        return sufficient, reason
+
+    @staticmethod
+    def save_turn(
+        conversation_id: str,
+        query_text: str,
+        answer_text: str,
+        document_ids: List[str],
+        read_results: List[Stage1Result],
+        read_query: str,
+        reused_documents: int,
+        response_time_ms: int
+    ) -> int:
+        """
+        保存一轮问答，并写入本轮新阅读文档的Stage 1结果（同一文档只保留最近一次）
+
+        查询接口使用只读会话，这里单独打开写会话（在数据库线程池中执行）。
+
+        Args:
+            conversation_id: 对话ID
+            query_text: 用户问题
+            answer_text: 最终答案
+            document_ids: 用于生成答案的文档ID
+            read_results: 本轮执行Stage 1的结果
+            read_query: 本轮Stage 1使用的问题
+            reused_documents: 复用已有结果的文档数
+            response_time_ms: 本轮耗时（毫秒）
+
+        Returns:
+            本轮序号（从1开始）
+        """
+        db = SessionLocal()
+        try:
+            conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+            if conversation is None:
+                # 查询过程中对话被删除
+                logger.warning("conversation_deleted_before_save", conversation_id=conversation_id)
+                return 0
+
+            last_index = db.query(func.max(ConversationTurn.turn_index)).filter(
+                ConversationTurn.conversation_id == conversation_id
+            ).scalar() or 0
+            turn_index = last_index + 1
+
+            db.add(ConversationTurn(
+                id=str(uuid.uuid4()),
+                conversation_id=conversation_id,
+                turn_index=turn_index,
+                query_text=query_text,
+                answer_text=answer_text,
+                document_ids=json.dumps(document_ids),
+                reused_documents=reused_documents,
+                read_documents=len(read_results),
+                response_time_ms=response_time_ms
+            ))
+
+            if read_results:
+                content_hashes = dict(db.query(Document.id, Document.content_hash).filter(
+                    Document.id.in_([result.doc_id for result in read_results])
+                ).all())
+                existing = {
+                    row.document_id: row
+                    for row in db.query(ConversationStage1Result).filter(
+                        ConversationStage1Result.conversation_id == conversation_id,
+                        ConversationStage1Result.document_id.in_(list(content_hashes))
+                    ).all()
+                }
+
+                for result in read_results:
+                    if result.doc_id not in content_hashes:
+                        continue
+                    row = existing.get(result.doc_id)
+                    if row is None:
+                        row = ConversationStage1Result(conversation_id=conversation_id, document_id=result.doc_id)
+                        db.add(row)
+                    row.query_text = read_query
+                    row.doc_name = result.doc_name
+                    row.response_text = result.response_text
+                    row.references_map = json.dumps(result.references_map, ensure_ascii=False)
+                    row.content_hash = content_hashes[result.doc_id]
+
+            if not conversation.title:
+                conversation.title = query_text[:100]
+            conversation.updated_at = func.now()
+
+            db.commit()
+
+            logger.info(
+                "conversation_turn_saved",
+                conversation_id=conversation_id,
+                turn_index=turn_index,
+                reused_documents=reused_documents,
+                read_documents=len(read_results)
+            )
+            return turn_index
+
+        except Exception:
+            db.rollback()
+            raise
+
+        finally:
+            db.close()
+
+
+# 全局实例
+conversation_service = ConversationService()
@@ -7,10 +7,6 @@ from pathlib import Path
 from typing import Dict, List, Tuple, Any, Optional
 from sqlalchemy.orm import Session
 
-from marker.models import create_model_dict
-from marker.converters.pdf import PdfConverter
-from marker.output import text_from_rendered
-
 from app.core.config import settings
 from app.core.logging import get_logger
 from app.core.errors import (
@@ -19,6 +15,7 @@ from app.core.errors import (
 )
 from app.models.database import Document
 from app.utils.bedrock_client import bedrock_client
+from app.services.image_service import image_service
 
 logger = get_logger(__name__)
 
@@ -72,7 +69,11 @@ class ConversionService:
                 output_dir = Path(settings.cache_dir) / "conversions" / document_id
             output_dir.mkdir(parents=True, exist_ok=True)
 
-            # 使用Marker转换PDF
+            # 使用Marker转换PDF（marker会加载torch，只在转换时导入，API进程不加载）
+            from marker.models import create_model_dict
+            from marker.converters.pdf import PdfConverter
+            from marker.output import text_from_rendered
+
             logger.info("initializing_marker_models", document_id=document_id)
 
             # 创建模型字典（包含检测、识别等模型）
@@ -167,6 +168,9 @@ class ConversionService:
                 # 保存PIL Image对象
                 pil_image.save(img_path)
 
+                # 预生成缩略图/WebP变体（供前端按需选择）
+                image_service.save_variants(pil_image, output_dir, img_filename)
+
                 logger.debug(
                     "image_saved",
                     document_id=document_id,
@@ -198,6 +202,40 @@ class ConversionService:
 
         return images_info
 
+    @staticmethod
+    def load_images_info(markdown_content: str, output_dir: Path) -> List[Dict]:
+        """
+        根据已保存的markdown和图片目录重建图片信息（断点续跑时跳过转换）
+
+        Args:
+            markdown_content: 已保存的原始markdown
+            output_dir: markdown与图片所在目录
+
+        Returns:
+            图片信息列表（按在markdown中出现的顺序）
+        """
+        import re
+
+        images_info = []
+        seen = set()
+        pattern = r'!\[\]\(([^)]+\.(?:jpeg|jpg|png|gif|webp))\)'
+
+        for match in re.finditer(pattern, markdown_content):
+            img_filename = Path(match.group(1)).name
+            img_path = output_dir / img_filename
+            if img_filename in seen or not img_path.exists():
+                continue
+            seen.add(img_filename)
+
+            images_info.append({
+                "filename": img_filename,
+                "path": str(img_path),
+                "index": len(images_info),
+                "description": None
+            })
+
+        return images_info
+
     @staticmethod
     def generate_image_descriptions(
         images_info: List[Dict],
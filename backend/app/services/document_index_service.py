@@ -0,0 +1,306 @@
+"""
+文档级路由索引服务
+每个知识库维护一个文档粒度的向量索引（由文档摘要和标题大纲生成），
+查询时先在文档级索引中粗筛候选文档，再在候选文档内做chunk检索
+"""
+import re
+import threading
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.logging import get_logger
+from app.models.database import Document, IndexTombstone, KnowledgeBase
+from app.services.index_gc_service import index_gc_service
+from app.utils.bedrock_client import bedrock_client
+from app.utils.cache import TTLCache
+from app.utils.opensearch_client import opensearch_client
+
+logger = get_logger(__name__)
+
+# Markdown标题行：# ~ ######
+_HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+
+
+class DocumentIndexService:
+    """文档级路由索引服务"""
+
+    INDEX_SUFFIX = "_docs"
+    MAX_OUTLINE_HEADINGS = 200
+    MAX_ROUTING_TEXT_CHARS = 30000  # Titan Embeddings V2输入上限约8k token
+    COVERAGE_BATCH_SIZE = 1000  # 检查覆盖情况时每次查询的文档ID数
+
+    # 已确认存在的文档级索引（避免每个文档都检查一次）
+    _known_indexes = set()
+    _lock = threading.Lock()
+
+    # kb_id → 文档级索引是否覆盖了所有已完成文档（覆盖不全时路由会漏掉文档，需回退）
+    _coverage = TTLCache(maxsize=1024, ttl_seconds=60)
+
+    @staticmethod
+    def index_name_for(kb: KnowledgeBase) -> Optional[str]:
+        """
+        知识库的文档级索引名（在chunk索引名后加后缀）
+
+        Args:
+            kb: 知识库对象
+
+        Returns:
+            索引名，知识库没有chunk索引时返回None
+        """
+        if not kb.opensearch_index_name:
+            return None
+        return f"{kb.opensearch_index_name}{DocumentIndexService.INDEX_SUFFIX}"
+
+    @staticmethod
+    def create_index(index_name: str):
+        """
+        创建文档级索引（已存在时跳过）
+
+        Args:
+            index_name: 索引名称
+
+        Raises:
+            OpenSearchConnectionError: 创建失败
+        """
+        if index_name in DocumentIndexService._known_indexes:
+            return
+
+        with DocumentIndexService._lock:
+            if index_name in DocumentIndexService._known_indexes:
+                return
+            if not opensearch_client.index_exists(index_name):
+                opensearch_client.create_document_index(index_name, embedding_dimension=1024)
+            DocumentIndexService._known_indexes.add(index_name)
+
+    @staticmethod
+    def drop_index(kb: KnowledgeBase) -> bool:
+        """
+        删除知识库的文档级索引（知识库删除时调用）
+
+        Args:
+            kb: 知识库对象
+
+        Returns:
+            是否删除成功
+        """
+        index_name = DocumentIndexService.index_name_for(kb)
+        if not index_name:
+            return True
+
+        with DocumentIndexService._lock:
+            DocumentIndexService._known_indexes.discard(index_name)
+        DocumentIndexService._coverage.pop(kb.id)
+
+        return opensearch_client.delete_index(index_name)
+
+    @staticmethod
+    def extract_outline(markdown_content: str) -> Optional[str]:
+        """
+        提取Markdown的标题大纲（按层级缩进，每行一个标题）
+
+        Args:
+            markdown_content: Markdown文本
+
+        Returns:
+            标题大纲，没有标题时返回None
+        """
+        lines = []
+        in_code_block = False
+
+        for line in markdown_content.splitlines():
+            stripped = line.strip()
+            if stripped.startswith("```"):
+                in_code_block = not in_code_block
+                continue
+            if in_code_block:
+                continue
+
+            match = _HEADING_PATTERN.match(stripped)
+            if not match:
+                continue
+
+            level = len(match.group(1))
+            title = match.group(2).strip("*_ ").strip()
+            if title:
+                lines.append(f"{'  ' * (level - 1)}- {title}")
+                if len(lines) >= DocumentIndexService.MAX_OUTLINE_HEADINGS:
+                    break
+
+        return "\n".join(lines) or None
+
+    @staticmethod
+    def build_routing_text(document: Document) -> str:
+        """
+        构建文档级向量的输入文本：文件名 + 摘要 + 标题大纲
+
+        Args:
+            document: 文档对象
+
+        Returns:
+            用于生成向量的文本
+        """
+        parts = [f"文档：{document.filename}"]
+        if document.summary:
+            parts.append(document.summary)
+        if document.outline:
+            parts.append(f"目录：\n{document.outline}")
+
+        return "\n\n".join(parts)[:DocumentIndexService.MAX_ROUTING_TEXT_CHARS]
+
+    @staticmethod
+    def index_document(db: Session, kb: KnowledgeBase, document: Document) -> bool:
+        """
+        为文档生成文档级向量并写入路由索引（先按document_id删除旧条目）
+
+        读取所需字段后提交当前事务，调用Bedrock和OpenSearch期间不占用写连接。
+
+        Args:
+            db: 数据库会话
+            kb: 知识库对象
+            document: 文档对象
+
+        Returns:
+            是否写入成功（失败只记录日志，不影响chunk检索）
+        """
+        index_name = DocumentIndexService.index_name_for(kb)
+        if not index_name:
+            return False
+
+        document_id = document.id
+        entry = {
+            "document_id": document_id,
+            "kb_id": kb.id,
+            "filename": document.filename,
+            "summary": document.summary,
+            "outline": document.outline,
+        }
+        routing_text = DocumentIndexService.build_routing_text(document)
+        db.commit()
+
+        try:
+            DocumentIndexService.create_index(index_name)
+
+            entry["embedding"] = bedrock_client.generate_embedding(routing_text)
+            entry["created_at"] = datetime.utcnow().isoformat()
+
+            # 重新同步时清理旧条目（OpenSearch Serverless不支持指定_id覆盖写入）
+            index_gc_service.delete_document_vectors(
+                index_name=index_name,
+                document_ids=[document_id]
+            )
+
+            opensearch_client.bulk_index(
+                index_name=index_name,
+                documents=[entry],
+                id_field=None
+            )
+
+            logger.info("document_routing_indexed", document_id=document_id, index_name=index_name)
+            return True
+
+        except Exception as e:
+            logger.warning(
+                "document_routing_index_failed",
+                document_id=document_id,
+                index_name=index_name,
+                error=str(e)
+            )
+            return False
+
+    @staticmethod
+    def check_coverage(db: Session, kb: KnowledgeBase) -> bool:
+        """
+        文档级索引是否覆盖了知识库所有已完成的文档（结果缓存60秒）
+
+        旧知识库没有文档级索引、或部分文档写入路由索引失败时返回False，
+        调用方应回退到不限文档的chunk检索，避免漏掉文档。
+
+        Args:
+            db: 数据库会话
+            kb: 知识库对象
+
+        Returns:
+            是否可以使用两级路由
+        """
+        cached = DocumentIndexService._coverage.get(kb.id)
+        if cached is not None:
+            return cached
+
+        index_name = DocumentIndexService.index_name_for(kb)
+        ready = False
+        completed = indexed = 0
+
+        if index_name and opensearch_client.index_exists(index_name):
+            # 按文档ID比较：已删除未清理的条目和重复条目不能抵消缺失的文档
+            tombstoned = {
+                row.document_id for row in db.query(IndexTombstone.document_id).filter(
+                    IndexTombstone.index_name == index_name,
+                    IndexTombstone.status == "pending"
+                ).all()
+            }
+            completed_ids = [
+                row.id for row in db.query(Document.id).filter(
+                    Document.kb_id == kb.id,
+                    Document.status == "completed"
+                ).all()
+                if row.id not in tombstoned
+            ]
+            completed = len(completed_ids)
+
+            try:
+                # 分批统计：各批文档ID不重叠，不同取值数可以相加
+                batch_size = DocumentIndexService.COVERAGE_BATCH_SIZE
+                for start in range(0, completed, batch_size):
+                    indexed += opensearch_client.count_distinct(
+                        index_name,
+                        "document_id",
+                        {"terms": {"document_id": completed_ids[start:start + batch_size]}}
+                    )
+            except Exception as e:
+                logger.warning("document_routing_count_failed", index_name=index_name, error=str(e))
+                indexed = 0
+            ready = completed > 0 and indexed >= completed
+
+        if not ready:
+            logger.info(
+                "document_routing_incomplete",
+                kb_id=kb.id,
+                completed_documents=completed,
+                indexed_documents=indexed
+            )
+
+        DocumentIndexService._coverage.set(kb.id, ready)
+        return ready
+
+    @staticmethod
+    def route(kb: KnowledgeBase, query_vector: List[float], top_k: int) -> List[str]:
+        """
+        文档级kNN粗筛：返回与问题最相关的候选文档ID（按相关度排序）
+
+        Args:
+            kb: 知识库对象
+            query_vector: 查询向量
+            top_k: 候选文档数
+
+        Returns:
+            文档ID列表；索引为空或检索失败时返回空列表（调用方回退到不限文档的chunk检索）
+        """
+        index_name = DocumentIndexService.index_name_for(kb)
+        if not index_name:
+            return []
+
+        hits = opensearch_client.vector_search(index_name, query_vector, top_k)
+
+        document_ids = []
+        for hit in hits:
+            document_id = hit["source"].get("document_id")
+            if document_id and document_id not in document_ids:
+                document_ids.append(document_id)
+
+        return document_ids
+
+
+# 全局实例
+document_index_service = DocumentIndexService()
@@ -6,7 +6,7 @@ import os
 import glob
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
@@ -44,12 +44,33 @@ class DocumentLoader:
 
         logger.info("document_loader_initialized")
 
-    def load_document(self, document_id: str) -> DocumentContent:
+    def get_documents(self, document_ids: List[str]) -> Dict[str, Document]:
+        """
+        批量查询文档元数据（一次查询）
+
+        Args:
+            document_ids: 文档ID列表
+
+        Returns:
+            {document_id: Document}，不存在的文档不在结果中
+        """
+        if not document_ids:
+            return {}
+
+        docs = self.db.query(Document).filter(Document.id.in_(document_ids)).all()
+        return {doc.id: doc for doc in docs}
+
+    def load_document(
+        self,
+        document_id: str,
+        doc: Optional[Document] = None
+    ) -> DocumentContent:
         """
         加载文档的Markdown和图片
 
         Args:
             document_id: 文档ID
+            doc: 可选，已查询的文档元数据（传入时不访问数据库，只读取本地文件）
 
         Returns:
             DocumentContent对象
@@ -60,7 +81,8 @@ class DocumentLoader:
         logger.info("loading_document", document_id=document_id)
 
         # 1. 查询文档元数据
-        doc = self.db.query(Document).filter(Document.id == document_id).first()
+        if doc is None:
+            doc = self.db.query(Document).filter(Document.id == document_id).first()
         if not doc:
             raise DocumentNotFoundError(document_id)
 
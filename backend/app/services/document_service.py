@@ -2,43 +2,100 @@
 文档管理Service
 业务逻辑层
 """
+import hashlib
+import os
 import uuid
+from dataclasses import dataclass
 from typing import List, Optional, Tuple, BinaryIO
 from datetime import datetime
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from app.models.database import KnowledgeBase, Document
+from app.models.database import KnowledgeBase, Document, SyncTask
 from app.models.schemas import DocumentCreate, DocumentUpdate
+from app.core.config import settings
 from app.core.logging import get_logger
 from app.core.errors import (
     DocumentNotFoundError,
+    DocumentAlreadyExistsError,
     KnowledgeBaseNotFoundError
 )
 
 logger = get_logger(__name__)
 
 
+@dataclass
+class StagedUpload:
+    """已流式写入临时文件的上传"""
+    tmp_path: str       # 临时文件路径（位于pdf_dir）
+    size: int           # 文件大小（字节）
+    content_hash: str   # SHA-256
+
+
 class DocumentService:
     """文档管理服务"""
 
+    # 上传流式写入的分块大小（1MB）
+    UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+    @staticmethod
+    def stage_upload(file: BinaryIO) -> StagedUpload:
+        """
+        将上传文件流式写入临时文件（固定大小分块读取，内存占用有上限）
+        写入同时计算文件大小和SHA-256
+
+        Args:
+            file: 文件对象
+
+        Returns:
+            StagedUpload
+        """
+        os.makedirs(settings.pdf_dir, exist_ok=True)
+        # 临时文件与目标目录在同一文件系统，保证后续rename是原子操作
+        tmp_path = os.path.join(settings.pdf_dir, f".upload-{uuid.uuid4().hex}.part")
+
+        hasher = hashlib.sha256()
+        size = 0
+
+        try:
+            with open(tmp_path, "wb") as out:
+                while True:
+                    block = file.read(DocumentService.UPLOAD_CHUNK_SIZE)
+                    if not block:
+                        break
+                    hasher.update(block)
+                    out.write(block)
+                    size += len(block)
+        except Exception:
+            DocumentService.discard_staged_upload(StagedUpload(tmp_path, size, ""))
+            raise
+
+        return StagedUpload(tmp_path=tmp_path, size=size, content_hash=hasher.hexdigest())
+
+    @staticmethod
+    def discard_staged_upload(staged: StagedUpload):
+        """删除未使用的临时上传文件"""
+        try:
+            if os.path.exists(staged.tmp_path):
+                os.remove(staged.tmp_path)
+        except OSError as e:
+            logger.warning("staged_upload_cleanup_failed", path=staged.tmp_path, error=str(e))
+
     @staticmethod
     def upload_document(
         db: Session,
         kb_id: str,
-        file: BinaryIO,
+        staged: StagedUpload,
         filename: str,
-        file_size: int,
         content_type: str = "application/pdf"
     ) -> Document:
         """
-        上传文档到本地文件系统并创建记录
+        将已暂存的上传文件移动到本地存储并创建记录
 
         Args:
             db: 数据库会话
             kb_id: 知识库ID
-            file: 文件对象
+            staged: stage_upload返回的暂存文件
             filename: 文件名
-            file_size: 文件大小
             content_type: 文件MIME类型
 
         Returns:
@@ -46,10 +103,8 @@ class DocumentService:
 
         Raises:
             KnowledgeBaseNotFoundError: 知识库不存在
+            DocumentAlreadyExistsError: 知识库中已存在相同内容的文档
         """
-        import os
-        from app.core.config import settings
-
         # 1. 检查知识库是否存在
         kb = db.query(KnowledgeBase).filter(
             KnowledgeBase.id == kb_id,
@@ -57,9 +112,27 @@ class DocumentService:
         ).first()
 
         if not kb:
+            DocumentService.discard_staged_upload(staged)
             raise KnowledgeBaseNotFoundError(kb_id)
 
-        # 2. 生成文档ID和本地路径
+        # 2. 按内容哈希去重
+        existing = db.query(Document.id).filter(
+            Document.kb_id == kb_id,
+            Document.content_hash == staged.content_hash,
+            Document.status != "deleted"
+        ).first()
+
+        if existing:
+            DocumentService.discard_staged_upload(staged)
+            logger.info(
+                "duplicate_document_rejected",
+                kb_id=kb_id,
+                filename=filename,
+                existing_doc_id=existing.id
+            )
+            raise DocumentAlreadyExistsError(filename, existing.id)
+
+        # 3. 生成文档ID和本地路径
         doc_id = f"doc-{uuid.uuid4()}"
         local_pdf_path = os.path.join(settings.pdf_dir, f"{doc_id}.pdf")
 
@@ -68,23 +141,21 @@ class DocumentService:
             doc_id=doc_id,
             kb_id=kb_id,
             filename=filename,
-            file_size=file_size,
+            file_size=staged.size,
             local_pdf_path=local_pdf_path
         )
 
         try:
-            # 3. 保存文件到本地
-            os.makedirs(os.path.dirname(local_pdf_path), exist_ok=True)
-
-            with open(local_pdf_path, 'wb') as f:
-                f.write(file.read())
+            # 4. 原子重命名到最终路径
+            os.replace(staged.tmp_path, local_pdf_path)
 
-            # 4. 创建数据库记录
+            # 5. 创建数据库记录
             doc = Document(
                 id=doc_id,
                 kb_id=kb_id,
                 filename=filename,
-                file_size=file_size,
+                file_size=staged.size,
+                content_hash=staged.content_hash,
                 local_pdf_path=local_pdf_path,
                 status="uploaded"  # 初始状态：已上传
             )
@@ -106,6 +177,7 @@ class DocumentService:
             db.rollback()
             logger.error("document_upload_failed", doc_id=doc_id, error=str(e))
             # 尝试清理本地文件
+            DocumentService.discard_staged_upload(staged)
             try:
                 if os.path.exists(local_pdf_path):
                     os.remove(local_pdf_path)
@@ -113,6 +185,131 @@ class DocumentService:
                 pass
             raise Exception(f"Document upload failed: {str(e)}")
 
+    @staticmethod
+    def upload_documents(
+        db: Session,
+        kb_id: str,
+        uploads: List[Tuple[StagedUpload, str]],
+        auto_sync: bool = False
+    ) -> Tuple[List[Document], List[dict], Optional[SyncTask]]:
+        """
+        批量上传文档（所有记录在一个事务中创建）
+
+        内容重复的文件（与知识库已有文档或同批次其他文件重复）会被跳过，不影响其他文件。
+
+        Args:
+            db: 数据库会话
+            kb_id: 知识库ID
+            uploads: (暂存文件, 文件名) 列表
+            auto_sync: 是否同时创建增量同步任务
+
+        Returns:
+            (创建的文档列表, 跳过的文件列表, 同步任务或None)
+
+        Raises:
+            KnowledgeBaseNotFoundError: 知识库不存在
+        """
+        from app.services.task_service import task_service
+
+        # 1. 检查知识库是否存在
+        kb = db.query(KnowledgeBase).filter(
+            KnowledgeBase.id == kb_id,
+            KnowledgeBase.status == "active"
+        ).first()
+
+        if not kb:
+            for staged, _ in uploads:
+                DocumentService.discard_staged_upload(staged)
+            raise KnowledgeBaseNotFoundError(kb_id)
+
+        # 2. 一次查询找出知识库中已存在的内容哈希
+        hashes = list({staged.content_hash for staged, _ in uploads})
+        existing = dict(
+            db.query(Document.content_hash, Document.id).filter(
+                Document.kb_id == kb_id,
+                Document.content_hash.in_(hashes),
+                Document.status != "deleted"
+            ).all()
+        ) if hashes else {}
+
+        docs: List[Document] = []
+        skipped: List[dict] = []
+        moved_paths: List[str] = []
+        task = None
+
+        try:
+            for staged, filename in uploads:
+                if staged.content_hash in existing:
+                    DocumentService.discard_staged_upload(staged)
+                    skipped.append({
+                        "filename": filename,
+                        "reason": "duplicate",
+                        "existing_document_id": existing[staged.content_hash]
+                    })
+                    continue
+
+                # 3. 原子重命名到最终路径
+                doc_id = f"doc-{uuid.uuid4()}"
+                local_pdf_path = os.path.join(settings.pdf_dir, f"{doc_id}.pdf")
+                os.replace(staged.tmp_path, local_pdf_path)
+                moved_paths.append(local_pdf_path)
+
+                doc = Document(
+                    id=doc_id,
+                    kb_id=kb_id,
+                    filename=filename,
+                    file_size=staged.size,
+                    content_hash=staged.content_hash,
+                    local_pdf_path=local_pdf_path,
+                    status="uploaded"
+                )
+                db.add(doc)
+                docs.append(doc)
+                # 同批次内的重复文件也只保留第一个
+                existing[staged.content_hash] = doc_id
+
+            # 4. 在同一事务中创建同步任务
+            if auto_sync and docs:
+                db.flush()
+                task = task_service.create_sync_task(
+                    db=db,
+                    kb_id=kb_id,
+                    task_type="incremental",
+                    document_ids=[doc.id for doc in docs],
+                    commit=False
+                )
+
+            db.commit()
+
+        except Exception as e:
+            db.rollback()
+            logger.error("document_batch_upload_failed", kb_id=kb_id, error=str(e))
+            # 清理已移动和未处理的文件
+            for staged, _ in uploads:
+                DocumentService.discard_staged_upload(staged)
+            for path in moved_paths:
+                try:
+                    if os.path.exists(path):
+                        os.remove(path)
+                except OSError:
+                    pass
+            raise
+
+        for doc in docs:
+            db.refresh(doc)
+        if task is not None:
+            db.refresh(task)
+
+        logger.info(
+            "document_batch_uploaded",
+            kb_id=kb_id,
+            uploaded=len(docs),
+            skipped=len(skipped),
+            sync_task_id=task.id if task else None
+        )
+
+        return docs, skipped, task
+
     @staticmethod
     def get_document(db: Session, doc_id: str) -> Document:
         """
@@ -236,7 +433,7 @@ class DocumentService:
     @staticmethod
     def delete_document(db: Session, doc_id: str) -> bool:
         """
-        删除文档（软删除数据库，真删除本地文件和向量）
+        删除文档（软删除数据库，本地文件、chunks和向量由Worker异步清理）
 
         Args:
             db: 数据库会话
@@ -248,89 +445,53 @@ class DocumentService:
         Raises:
             DocumentNotFoundError: 文档不存在
         """
-        from pathlib import Path
-        import shutil
+        from app.services.document_index_service import document_index_service
+        from app.services.image_service import image_service
+        from app.services.index_gc_service import index_gc_service
+        from app.services.task_service import task_service
 
         doc = DocumentService.get_document(db, doc_id)
 
         try:
-            # 1. 删除OpenSearch中的向量数据
-            from app.models.database import Chunk
-            from app.utils.opensearch_client import opensearch_client
-
+            # 1. 记录向量删除墓碑（由Worker按document_id批量删除并确认）
             kb = db.query(KnowledgeBase).filter(
                 KnowledgeBase.id == doc.kb_id
             ).first()
 
             if kb and kb.opensearch_index_name:
-                # 获取所有chunk IDs
-                chunks = db.query(Chunk).filter(
-                    Chunk.document_id == doc_id
-                ).all()
-
-                chunk_ids = [chunk.id for chunk in chunks]
-                if chunk_ids:
-                    # 批量删除向量
-                    deleted_count = 0
-                    for chunk_id in chunk_ids:
-                        try:
-                            opensearch_client.delete_document(
-                                index_name=kb.opensearch_index_name,
-                                doc_id=chunk_id
-                            )
-                            deleted_count += 1
-                        except Exception as e:
-                            logger.warning(
-                                "opensearch_vector_deletion_failed",
-                                chunk_id=chunk_id,
-                                error=str(e)
-                            )
-
-                    logger.info(
-                        "opensearch_vectors_deleted",
-                        doc_id=doc_id,
-                        count=deleted_count,
-                        total=len(chunk_ids)
-                    )
-
-            # 2. 软删除数据库记录（级联删除chunks）
+                index_gc_service.record_tombstones(
+                    db,
+                    kb_id=kb.id,
+                    index_name=kb.opensearch_index_name,
+                    document_ids=[doc_id]
+                )
+                index_gc_service.record_tombstones(
+                    db,
+                    kb_id=kb.id,
+                    index_name=document_index_service.index_name_for(kb),
+                    document_ids=[doc_id]
+                )
+
+            # 2. 软删除数据库记录
             doc.status = "deleted"
             doc.updated_at = datetime.utcnow()
 
-            # 3. 删除本地文件
-            files_deleted = 0
-
-            # 删除PDF文件
-            if doc.local_pdf_path:
-                pdf_path = Path(doc.local_pdf_path)
-                if pdf_path.exists():
-                    pdf_path.unlink()
-                    files_deleted += 1
-                    logger.debug("pdf_deleted", path=str(pdf_path))
-
-            # 删除Markdown目录（包含content.md和所有图片）
-            if doc.local_markdown_path:
-                markdown_dir = Path(doc.local_markdown_path).parent
-                if markdown_dir.exists():
-                    file_count = len(list(markdown_dir.glob("*")))
-                    shutil.rmtree(markdown_dir)
-                    files_deleted += file_count
-                    logger.debug("markdown_dir_deleted", path=str(markdown_dir), file_count=file_count)
-
-            # 删除Text Markdown文件
-            if doc.local_text_markdown_path:
-                text_md_path = Path(doc.local_text_markdown_path)
-                if text_md_path.exists():
-                    text_md_path.unlink()
-                    files_deleted += 1
-                    logger.debug("text_markdown_deleted", path=str(text_md_path))
+            # 3. 本地文件和chunks由删除任务在后台清理
+            task = task_service.create_delete_task(
+                db,
+                kb_id=doc.kb_id,
+                document_ids=[doc_id],
+                commit=False
+            )
 
             db.commit()
 
+            image_service.invalidate_document(doc_id)
+
             logger.info(
                 "document_deleted",
                 doc_id=doc_id,
-                local_files_deleted=files_deleted
+                delete_task_id=task.id
             )
             return True
 
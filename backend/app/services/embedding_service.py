@@ -2,7 +2,9 @@
 向量化服务
 生成Embeddings并索引到OpenSearch
 """
-from typing import List, Dict, Tuple
+from array import array
+from typing import List, Dict, Optional
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
@@ -15,6 +17,7 @@ from app.core.errors import (
 from app.models.database import Document, Chunk
 from app.utils.bedrock_client import bedrock_client
 from app.utils.opensearch_client import opensearch_client
+from app.services.index_gc_service import index_gc_service
 
 logger = get_logger(__name__)
 
@@ -29,7 +32,7 @@ class EmbeddingService:
     def generate_and_index_embeddings(
         db: Session,
         document_id: str,
-        chunk_ids: List[str]
+        chunk_rows: Optional[List[Dict]] = None
     ) -> int:
         """
         为chunks生成embeddings并索引到OpenSearch
@@ -37,7 +40,7 @@ class EmbeddingService:
         Args:
             db: 数据库会话
             document_id: 文档ID
-            chunk_ids: chunk ID列表
+            chunk_rows: 可选，save_chunks_to_db返回的chunk行数据（不传则从数据库读取）
 
         Returns:
             成功索引的chunk数量
@@ -47,12 +50,138 @@ class EmbeddingService:
             VectorizationError: 向量化失败
             OpenSearchConnectionError: OpenSearch连接失败
         """
+        EmbeddingService.generate_embeddings(db, document_id, chunk_rows)
+        return EmbeddingService.index_document_chunks(db, document_id, chunk_rows)
+
+    @staticmethod
+    def generate_embeddings(
+        db: Session,
+        document_id: str,
+        chunk_rows: Optional[List[Dict]] = None
+    ) -> int:
+        """
+        为文档中尚未向量化的chunks生成embeddings并保存到数据库
+
+        每个批次完成后按主键批量更新并提交，失败重试时只处理缺失向量的chunks。
+        生成的向量同时写回chunk_rows中的"embedding"字段，供索引阶段直接使用
+
+        Args:
+            db: 数据库会话
+            document_id: 文档ID
+            chunk_rows: 可选，内存中的chunk行数据（不传则从数据库读取缺失向量的chunks）
+
+        Returns:
+            本次生成的向量数量
+
+        Raises:
+            DocumentNotFoundError: 文档不存在
+            VectorizationError: 向量化失败
+        """
+        # 验证文档存在
+        doc = db.query(Document).filter(Document.id == document_id).first()
+        if not doc:
+            raise DocumentNotFoundError(document_id)
+
+        if chunk_rows is None:
+            chunk_rows = EmbeddingService._load_chunk_rows(
+                db, document_id, missing_embedding_only=True
+            )
+        pending = [row for row in chunk_rows if row.get("embedding") is None]
+
+        # 结束读事务，调用Bedrock期间不占用写连接
+        db.commit()
+
         logger.info(
             "start_vectorization",
             document_id=document_id,
-            chunk_count=len(chunk_ids)
+            chunk_count=len(pending)
         )
 
+        if not pending:
+            return 0
+
+        try:
+            embedded_count = 0
+            total_batches = (len(pending) + EmbeddingService.BATCH_SIZE - 1) // EmbeddingService.BATCH_SIZE
+
+            for batch_idx in range(total_batches):
+                start_idx = batch_idx * EmbeddingService.BATCH_SIZE
+                end_idx = min(start_idx + EmbeddingService.BATCH_SIZE, len(pending))
+                batch_rows = pending[start_idx:end_idx]
+
+                logger.info(
+                    "processing_batch",
+                    document_id=document_id,
+                    batch=batch_idx + 1,
+                    total_batches=total_batches,
+                    batch_size=len(batch_rows)
+                )
+
+                embeddings = EmbeddingService._embed_batch(batch_rows)
+
+                # 按主键批量保存向量（按批提交，作为断点）
+                packed = []
+                for row, embedding in zip(batch_rows, embeddings):
+                    row["embedding"] = EmbeddingService._pack_embedding(embedding)
+                    packed.append({"id": row["id"], "embedding": row["embedding"]})
+                db.execute(update(Chunk), packed)
+                db.commit()
+
+                embedded_count += len(batch_rows)
+
+            logger.info(
+                "vectorization_completed",
+                document_id=document_id,
+                embedded_count=embedded_count
+            )
+
+            return embedded_count
+
+        except Exception as e:
+            db.rollback()
+            logger.error(
+                "vectorization_failed",
+                document_id=document_id,
+                error=str(e),
+                exc_info=True
+            )
+
+            # 更新文档状态为failed
+            doc.status = "failed"
+            doc.error_message = f"向量化失败: {str(e)}"
+            db.commit()
+
+            raise VectorizationError(
+                details={
+                    "document_id": document_id,
+                    "error": str(e)
+                }
+            )
+
+    @staticmethod
+    def index_document_chunks(
+        db: Session,
+        document_id: str,
+        chunk_rows: Optional[List[Dict]] = None
+    ) -> int:
+        """
+        使用已保存的向量将文档的所有chunks索引到OpenSearch
+
+        索引前先按document_id删除已有条目，重试不会产生重复数据
+
+        Args:
+            db: 数据库会话
+            document_id: 文档ID
+            chunk_rows: 可选，文档全部chunk的行数据（含embedding，不传则从数据库读取）
+
+        Returns:
+            成功索引的chunk数量
+
+        Raises:
+            DocumentNotFoundError: 文档不存在
+            VectorizationError: 存在未向量化的chunk
+            OpenSearchConnectionError: OpenSearch连接失败
+        """
         # 验证文档存在
         doc = db.query(Document).filter(Document.id == document_id).first()
         if not doc:
@@ -71,48 +200,49 @@ class EmbeddingService:
                 }
             )
 
-        try:
-            # 获取所有chunks
-            chunks = db.query(Chunk).filter(
-                Chunk.id.in_(chunk_ids)
-            ).order_by(Chunk.chunk_index).all()
+        if chunk_rows is None:
+            chunk_rows = EmbeddingService._load_chunk_rows(db, document_id)
 
-            if not chunks:
-                logger.warning("no_chunks_found", document_id=document_id)
-                return 0
-
-            # 批量处理
-            indexed_count = 0
-            total_batches = (len(chunks) + EmbeddingService.BATCH_SIZE - 1) // EmbeddingService.BATCH_SIZE
+        missing = [row["id"] for row in chunk_rows if row.get("embedding") is None]
+        if missing:
+            raise VectorizationError(
+                details={
+                    "document_id": document_id,
+                    "reason": f"{len(missing)}个chunk尚未向量化"
+                }
+            )
 
-            for batch_idx in range(total_batches):
-                start_idx = batch_idx * EmbeddingService.BATCH_SIZE
-                end_idx = min(start_idx + EmbeddingService.BATCH_SIZE, len(chunks))
-                batch_chunks = chunks[start_idx:end_idx]
+        # 结束读事务，写OpenSearch期间不占用写连接
+        db.commit()
 
-                logger.info(
-                    "processing_batch",
-                    document_id=document_id,
-                    batch=batch_idx + 1,
-                    total_batches=total_batches,
-                    batch_size=len(batch_chunks)
-                )
+        try:
+            # 清理上次中断时可能已写入的条目
+            index_gc_service.delete_document_vectors(
+                index_name=index_name,
+                document_ids=[document_id]
+            )
 
-                # 处理批次
-                batch_count = EmbeddingService._process_batch(
-                    db=db,
-                    chunks=batch_chunks,
+            indexed_count = 0
+            for start_idx in range(0, len(chunk_rows), EmbeddingService.BATCH_SIZE):
+                batch_rows = chunk_rows[start_idx:start_idx + EmbeddingService.BATCH_SIZE]
+                indexed_count += EmbeddingService._index_batch(
+                    chunks=batch_rows,
+                    embeddings=[
+                        EmbeddingService._unpack_embedding(row["embedding"])
+                        for row in batch_rows
+                    ],
                     index_name=index_name
                 )
 
-                indexed_count += batch_count
-
-            # 更新文档状态为completed
-            doc.status = "completed"
+            # 更新文档状态为completed（索引期间文档被删除时保持deleted，由调用方补记墓碑）
+            db.query(Document).filter(
+                Document.id == document_id,
+                Document.status != "deleted"
+            ).update({"status": "completed"}, synchronize_session=False)
             db.commit()
 
             logger.info(
-                "vectorization_completed",
+                "indexing_completed",
                 document_id=document_id,
                 indexed_count=indexed_count
             )
@@ -121,7 +251,7 @@ class EmbeddingService:
 
         except Exception as e:
             logger.error(
-                "vectorization_failed",
+                "indexing_failed",
                 document_id=document_id,
                 error=str(e),
                 exc_info=True
@@ -129,10 +259,10 @@ class EmbeddingService:
 
             # 更新文档状态为failed
             doc.status = "failed"
-            doc.error_message = f"向量化失败: {str(e)}"
+            doc.error_message = f"索引失败: {str(e)}"
             db.commit()
 
-            raise VectorizationError(
+            raise OpenSearchConnectionError(
                 details={
                     "document_id": document_id,
                     "error": str(e)
@@ -140,30 +270,56 @@ class EmbeddingService:
             )
 
     @staticmethod
-    def _process_batch(
+    def _load_chunk_rows(
         db: Session,
-        chunks: List[Chunk],
-        index_name: str
-    ) -> int:
+        document_id: str,
+        missing_embedding_only: bool = False
+    ) -> List[Dict]:
         """
-        处理一个批次的chunks
+        按文档读取chunk行数据（core查询，不构建ORM对象）
 
         Args:
             db: 数据库会话
-            chunks: chunk列表
-            index_name: OpenSearch索引名
+            document_id: 文档ID
+            missing_embedding_only: 只读取尚未向量化的chunks
 
         Returns:
-            成功索引的数量
+            chunk行数据列表（按chunk_index排序）
         """
-        # 1. 提取文本用于向量化
-        texts = []
-        for chunk in chunks:
-            # 使用content_with_context生成更好的embedding
-            text = chunk.content_with_context or chunk.content or ""
-            texts.append(text)
-
-        # 2. 生成embeddings
+        table = Chunk.__table__
+        stmt = select(table).where(table.c.document_id == document_id)
+        if missing_embedding_only:
+            stmt = stmt.where(table.c.embedding.is_(None))
+        stmt = stmt.order_by(table.c.chunk_index)
+
+        return [dict(row) for row in db.execute(stmt).mappings()]
+
+    @staticmethod
+    def _pack_embedding(embedding: List[float]) -> bytes:
+        """向量打包为float32字节串"""
+        return array("f", embedding).tobytes()
+
+    @staticmethod
+    def _unpack_embedding(data: bytes) -> List[float]:
+        """float32字节串还原为向量"""
+        values = array("f")
+        values.frombytes(data)
+        return values.tolist()
+
+    @staticmethod
+    def _embed_batch(chunks: List[Dict]) -> List[List[float]]:
+        """
+        为一个批次的chunks生成embeddings
+
+        Args:
+            chunks: chunk行数据列表
+
+        Returns:
+            向量列表
+        """
+        # 使用content_with_context生成更好的embedding
+        texts = [chunk.get("content_with_context") or chunk.get("content") or "" for chunk in chunks]
+
         try:
             embeddings = bedrock_client.generate_embeddings_batch(
                 texts=texts,
@@ -177,28 +333,42 @@ class EmbeddingService:
                 dimension=len(embeddings[0]) if embeddings else 0
             )
 
+            return embeddings
+
         except Exception as e:
             logger.error("embedding_generation_failed", error=str(e))
             raise VectorizationError(
                 details={"error": f"Embedding生成失败: {str(e)}"}
             )
 
-        # 3. 构建OpenSearch文档
+    @staticmethod
+    def _index_batch(
+        chunks: List[Dict],
+        embeddings: List[List[float]],
+        index_name: str
+    ) -> int:
+        """
+        将一个批次的chunks索引到OpenSearch
+
+        Args:
+            chunks: chunk行数据列表
+            embeddings: 对应的向量
+            index_name: OpenSearch索引名
+
+        Returns:
+            成功索引的数量
+        """
         documents = []
         for chunk, embedding in zip(chunks, embeddings):
             doc = EmbeddingService._build_opensearch_document(
                 chunk=chunk,
                 embedding=embedding
             )
+            # 注意：OpenSearch Serverless不支持指定_id，chunk_id作为普通字段存储
+            doc["chunk_id"] = doc.pop("id")  # id → chunk_id
             documents.append(doc)
 
-        # 4. 索引到OpenSearch
-        # 注意：OpenSearch Serverless不支持指定_id，chunk_id作为普通字段存储
         try:
-            # 将id字段重命名为chunk_id（保留在_source中）
-            for doc in documents:
-                doc["chunk_id"] = doc.pop("id")  # id → chunk_id
-
             # 使用bulk索引（不指定_id，让OpenSearch自动生成）
             success_count = opensearch_client.bulk_index(
                 index_name=index_name,
@@ -223,14 +393,14 @@ class EmbeddingService:
 
     @staticmethod
     def _build_opensearch_document(
-        chunk: Chunk,
+        chunk: Dict,
         embedding: List[float]
     ) -> Dict:
         """
         构建OpenSearch文档
 
         Args:
-            chunk: Chunk对象
+            chunk: chunk行数据
             embedding: 向量
 
         Returns:
@@ -238,29 +408,29 @@ class EmbeddingService:
         """
         # 基础字段
         doc = {
-            "id": chunk.id,
-            "document_id": chunk.document_id,
-            "kb_id": chunk.kb_id,
-            "chunk_type": chunk.chunk_type,
-            "chunk_index": chunk.chunk_index,
-            "content": chunk.content,
-            "content_with_context": chunk.content_with_context,
+            "id": chunk["id"],
+            "document_id": chunk["document_id"],
+            "kb_id": chunk["kb_id"],
+            "chunk_type": chunk["chunk_type"],
+            "chunk_index": chunk["chunk_index"],
+            "content": chunk.get("content"),
+            "content_with_context": chunk.get("content_with_context"),
             "embedding": embedding
         }
 
         # 文本chunk特有字段
-        if chunk.chunk_type == "text":
+        if chunk["chunk_type"] == "text":
             doc.update({
-                "char_start": chunk.char_start,
-                "char_end": chunk.char_end
+                "char_start": chunk.get("char_start"),
+                "char_end": chunk.get("char_end")
             })
 
         # 图片chunk特有字段
-        elif chunk.chunk_type == "image":
+        elif chunk["chunk_type"] == "image":
             doc.update({
-                "image_filename": chunk.image_filename,
-                "image_description": chunk.image_description,
-                "image_type": chunk.image_type
+                "image_filename": chunk.get("image_filename"),
+                "image_description": chunk.get("image_description"),
+                "image_type": chunk.get("image_type")
             })
 
         return doc
@@ -345,25 +515,10 @@ class EmbeddingService:
             return 0
 
         try:
-            # 获取所有chunk IDs
-            chunk_ids = [
-                chunk.id for chunk in
-                db.query(Chunk.id).filter(Chunk.document_id == document_id).all()
-            ]
-
-            if not chunk_ids:
-                logger.info("no_chunks_to_delete", document_id=document_id)
-                return 0
-
-            # 从OpenSearch删除（使用chunk_id字段查询删除）
-            # 注意：OpenSearch Serverless不支持指定_id，使用chunk_id字段
-            deleted_count = opensearch_client.delete_by_query(
+            # 按document_id字段删除（OpenSearch Serverless使用自动生成的_id）
+            deleted_count = index_gc_service.delete_document_vectors(
                 index_name=index_name,
-                query={
-                    "terms": {
-                        "chunk_id": chunk_ids  # 按chunk_id字段删除
-                    }
-                }
+                document_ids=[document_id]
             )
 
             logger.info(
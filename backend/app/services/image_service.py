@@ -0,0 +1,279 @@
+"""
+图片服务
+文档图片的路径解析、ETag计算、预生成变体（缩略图/WebP）和热点缓存
+"""
+import hashlib
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.models.database import Chunk, Document
+from app.utils.cache import TTLCache
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class ImageFile:
+    """已解析的图片文件"""
+    path: str
+    media_type: str
+    etag: str
+    stat_result: os.stat_result
+
+
+class ImageService:
+    """图片服务"""
+
+    # 预生成变体：名称 → 最大边长（None表示保持原尺寸）
+    VARIANTS = {
+        "thumb": 320,
+        "webp": None,
+    }
+    VARIANT_DIR = "variants"
+
+    CONTENT_TYPES = {
+        'png': 'image/png',
+        'jpg': 'image/jpeg',
+        'jpeg': 'image/jpeg',
+        'gif': 'image/gif',
+        'webp': 'image/webp'
+    }
+
+    # document_id → (kb_id, markdown_dir)
+    _documents = TTLCache(
+        maxsize=settings.image_cache_size,
+        ttl_seconds=settings.image_cache_ttl_seconds
+    )
+    # chunk_id → (document_id, chunk_type, image_filename)
+    _chunks = TTLCache(
+        maxsize=settings.image_cache_size,
+        ttl_seconds=settings.image_cache_ttl_seconds
+    )
+
+    @staticmethod
+    def resolve_document(db: Session, document_id: str) -> Optional[Tuple[str, str]]:
+        """
+        解析文档的知识库和图片目录
+
+        Args:
+            db: 数据库会话
+            document_id: 文档ID
+
+        Returns:
+            (kb_id, markdown_dir)，文档不存在或尚未转换时返回None
+        """
+        cached = ImageService._documents.get(document_id)
+        if cached is not None:
+            return cached
+
+        row = db.query(Document.kb_id, Document.local_markdown_path).filter(
+            Document.id == document_id,
+            Document.status != "deleted"
+        ).first()
+        if not row or not row.local_markdown_path:
+            return None
+
+        resolved = (row.kb_id, str(Path(row.local_markdown_path).parent))
+        ImageService._documents.set(document_id, resolved)
+        return resolved
+
+    @staticmethod
+    def resolve_chunk(db: Session, chunk_id: str) -> Optional[Tuple[str, str, Optional[str]]]:
+        """
+        解析chunk对应的文档和图片文件名
+
+        Args:
+            db: 数据库会话
+            chunk_id: Chunk ID
+
+        Returns:
+            (document_id, chunk_type, image_filename)，chunk不存在时返回None
+        """
+        cached = ImageService._chunks.get(chunk_id)
+        if cached is not None:
+            return cached
+
+        row = db.query(Chunk.document_id, Chunk.chunk_type, Chunk.image_filename).filter(
+            Chunk.id == chunk_id
+        ).first()
+        if not row:
+            return None
+
+        resolved = (row.document_id, row.chunk_type, row.image_filename)
+        ImageService._chunks.set(chunk_id, resolved)
+        return resolved
+
+    @staticmethod
+    def get_image_file(
+        markdown_dir: str,
+        image_filename: str,
+        variant: Optional[str] = None
+    ) -> Optional[ImageFile]:
+        """
+        获取图片文件（优先返回请求的预生成变体，不存在时回退到原图）
+
+        Args:
+            markdown_dir: 文档图片目录
+            image_filename: 图片文件名
+            variant: 变体名称（thumb | webp）
+
+        Returns:
+            ImageFile，文件不存在或文件名非法时返回None
+        """
+        # 只接受纯文件名，防止路径穿越
+        if not image_filename or Path(image_filename).name != image_filename:
+            return None
+
+        candidates = []
+        if variant in ImageService.VARIANTS:
+            candidates.append(ImageService._variant_path(Path(markdown_dir), image_filename, variant))
+        candidates.append(Path(markdown_dir) / image_filename)
+
+        for path in candidates:
+            image = ImageService._stat_image(str(path))
+            if image is not None:
+                return image
+
+        return None
+
+    @staticmethod
+    def _stat_image(path: str) -> Optional[ImageFile]:
+        """
+        stat图片并计算ETag
+
+        每次请求都重新stat（开销很小）：重新同步会在相同路径上重写图片，
+        缓存的大小/ETag会导致响应截断或对已变化的内容返回304
+        """
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            return None
+
+        # 基于路径、大小和修改时间的强ETag（文件内容变化时mtime随之变化）
+        etag_base = f"{path}:{stat_result.st_size}:{stat_result.st_mtime_ns}"
+        etag = f'"{hashlib.sha1(etag_base.encode()).hexdigest()[:20]}"'
+
+        ext = path.rsplit('.', 1)[-1].lower()
+        image = ImageFile(
+            path=path,
+            media_type=ImageService.CONTENT_TYPES.get(ext, 'application/octet-stream'),
+            etag=etag,
+            stat_result=stat_result
+        )
+        return image
+
+    @staticmethod
+    def is_not_modified(if_none_match: Optional[str], etag: str) -> bool:
+        """
+        判断If-None-Match是否命中当前ETag
+
+        Args:
+            if_none_match: 请求头If-None-Match
+            etag: 当前ETag
+
+        Returns:
+            是否可以返回304
+        """
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag in tags
+
+    @staticmethod
+    def _variant_path(markdown_dir: Path, image_filename: str, variant: str) -> Path:
+        """变体文件路径：{markdown_dir}/variants/{stem}.{variant}.webp"""
+        stem = Path(image_filename).stem
+        return markdown_dir / ImageService.VARIANT_DIR / f"{stem}.{variant}.webp"
+
+    @staticmethod
+    def save_variants(pil_image, output_dir: Path, image_filename: str):
+        """
+        为提取的图片预生成缩略图和WebP变体（失败不影响原图）
+
+        Args:
+            pil_image: PIL Image对象
+            output_dir: 文档图片目录
+            image_filename: 原图文件名
+        """
+        if not settings.image_variants_enabled:
+            return
+
+        variant_dir = output_dir / ImageService.VARIANT_DIR
+        variant_dir.mkdir(parents=True, exist_ok=True)
+
+        for variant, max_size in ImageService.VARIANTS.items():
+            try:
+                image = pil_image
+                if max_size is not None:
+                    image = pil_image.copy()
+                    image.thumbnail((max_size, max_size))
+                if image.mode not in ("RGB", "RGBA"):
+                    image = image.convert("RGBA")
+                image.save(
+                    ImageService._variant_path(output_dir, image_filename, variant),
+                    format="WEBP",
+                    quality=settings.image_variant_quality
+                )
+            except Exception as e:
+                logger.warning(
+                    "image_variant_failed",
+                    filename=image_filename,
+                    variant=variant,
+                    error=str(e)
+                )
+
+    @staticmethod
+    def invalidate_document(document_id: str):
+        """文档删除时清除其解析缓存"""
+        ImageService._documents.pop(document_id)
+        ImageService._chunks.invalidate(lambda chunk_id, value: value[0] == document_id)
+
+    @staticmethod
+    def invalidate_knowledge_base(kb_id: str):
+        """知识库删除时清除其所有文档的解析缓存"""
+        ImageService._documents.invalidate(lambda document_id, value: value[0] == kb_id)
+        ImageService._chunks.clear()
+
+
+def image_response(request: Request, image: ImageFile) -> Response:
+    """
+    构建图片响应：If-None-Match命中时返回304，否则返回文件（支持Range，
+    服务器支持时使用零拷贝pathsend）
+
+    图片需要权限才能访问，只允许浏览器私有缓存。
+
+    Args:
+        request: 请求对象
+        image: 图片文件
+
+    Returns:
+        Response
+    """
+    headers = {
+        "ETag": image.etag,
+        "Cache-Control": f"private, max-age={settings.image_cache_max_age_seconds}"
+    }
+
+    if ImageService.is_not_modified(request.headers.get("if-none-match"), image.etag):
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(
+        image.path,
+        media_type=image.media_type,
+        headers=headers,
+        stat_result=image.stat_result
+    )
+
+
+# 全局实例
+image_service = ImageService()
@@ -0,0 +1,220 @@
+"""
+索引清理服务
+按document_id批量删除OpenSearch中的向量，并用墓碑记录删除进度直到确认完成
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List
+
+from opensearchpy.exceptions import NotFoundError
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.models.database import IndexTombstone
+from app.utils.opensearch_client import opensearch_client
+
+logger = get_logger(__name__)
+
+
+class IndexGCService:
+    """索引清理服务"""
+
+    @staticmethod
+    def delete_document_vectors(index_name: str, document_ids: List[str]) -> int:
+        """
+        按document_id删除向量（每批文档一次delete_by_query）
+
+        Args:
+            index_name: 索引名称
+            document_ids: 文档ID列表
+
+        Returns:
+            删除的向量数量
+
+        Raises:
+            Exception: OpenSearch请求失败
+        """
+        deleted = 0
+        batch_size = settings.index_gc_batch_size
+
+        for start in range(0, len(document_ids), batch_size):
+            batch = document_ids[start:start + batch_size]
+            deleted += opensearch_client.delete_by_query(
+                index_name=index_name,
+                query={"terms": {"document_id": batch}},
+                raise_on_error=True
+            )
+
+        return deleted
+
+    @staticmethod
+    def record_tombstones(
+        db: Session,
+        kb_id: str,
+        index_name: str,
+        document_ids: List[str]
+    ):
+        """
+        记录待删除的文档向量（不提交，随调用方的事务一起提交）
+
+        Args:
+            db: 数据库会话
+            kb_id: 知识库ID
+            index_name: 索引名称
+            document_ids: 文档ID列表
+        """
+        db.add_all([
+            IndexTombstone(kb_id=kb_id, index_name=index_name, document_id=document_id)
+            for document_id in document_ids
+        ])
+
+        logger.info(
+            "index_tombstones_recorded",
+            kb_id=kb_id,
+            index_name=index_name,
+            count=len(document_ids)
+        )
+
+    @staticmethod
+    def purge_tombstones(db: Session, limit: int = 1000) -> int:
+        """
+        处理待删除的墓碑：删除向量并确认索引中已无残留
+
+        delete_by_query成功后再用count确认，未确认的墓碑保留为pending，
+        在index_gc_retry_seconds之后重试。记录时间不足sync_lease_seconds的墓碑
+        即使count为0也保持pending：删除前已开始的同步可能仍在写入该文档的向量，
+        或写入尚未刷新到可见。
+
+        Args:
+            db: 数据库会话
+            limit: 本次最多处理的墓碑数
+
+        Returns:
+            确认完成的墓碑数量
+        """
+        now = datetime.utcnow()
+        retry_before = now - timedelta(seconds=settings.index_gc_retry_seconds)
+        settled_before = now - timedelta(seconds=settings.sync_lease_seconds)
+
+        tombstones = db.query(IndexTombstone).filter(
+            IndexTombstone.status == "pending",
+            or_(
+                IndexTombstone.last_attempt_at.is_(None),
+                IndexTombstone.last_attempt_at <= retry_before
+            )
+        ).order_by(IndexTombstone.id).limit(limit).all()
+
+        if not tombstones:
+            return 0
+
+        # 结束读事务，请求OpenSearch期间不占用写连接
+        pending = [(t.id, t.index_name, t.document_id, t.created_at) for t in tombstones]
+        db.commit()
+
+        by_index = defaultdict(list)
+        for tombstone_id, index_name, document_id, created_at in pending:
+            by_index[index_name].append((tombstone_id, document_id, created_at))
+
+        confirmed_ids: List[int] = []
+        deferred_ids: List[int] = []  # 已删除但仍在等待期内，稍后再次删除
+        failed = []  # (墓碑ID列表, 错误信息)
+
+        for index_name, entries in by_index.items():
+            batch_size = settings.index_gc_batch_size
+            for start in range(0, len(entries), batch_size):
+                batch = entries[start:start + batch_size]
+                document_ids = [document_id for _, document_id, _ in batch]
+                query = {"terms": {"document_id": document_ids}}
+
+                try:
+                    opensearch_client.delete_by_query(
+                        index_name=index_name,
+                        query=query,
+                        raise_on_error=True
+                    )
+                    remaining = opensearch_client.count(index_name=index_name, query=query)
+                except NotFoundError:
+                    # 索引已不存在，视为删除完成
+                    remaining = 0
+                except Exception as e:
+                    failed.append(([tombstone_id for tombstone_id, _, _ in batch], str(e)))
+                    continue
+
+                if remaining == 0:
+                    for tombstone_id, _, created_at in batch:
+                        if created_at <= settled_before:
+                            confirmed_ids.append(tombstone_id)
+                        else:
+                            deferred_ids.append(tombstone_id)
+                else:
+                    failed.append((
+                        [tombstone_id for tombstone_id, _, _ in batch],
+                        f"{remaining} vectors still visible"
+                    ))
+
+        # 记录结果
+        if confirmed_ids:
+            db.query(IndexTombstone).filter(
+                IndexTombstone.id.in_(confirmed_ids)
+            ).update(
+                {"status": "confirmed", "confirmed_at": now, "last_attempt_at": now},
+                synchronize_session=False
+            )
+        if deferred_ids:
+            db.query(IndexTombstone).filter(
+                IndexTombstone.id.in_(deferred_ids)
+            ).update(
+                {"last_attempt_at": now},
+                synchronize_session=False
+            )
+        for tombstone_ids, error in failed:
+            db.query(IndexTombstone).filter(
+                IndexTombstone.id.in_(tombstone_ids)
+            ).update(
+                {
+                    "attempts": IndexTombstone.attempts + 1,
+                    "last_error": error,
+                    "last_attempt_at": now
+                },
+                synchronize_session=False
+            )
+        db.commit()
+
+        logger.info(
+            "index_tombstones_purged",
+            confirmed=len(confirmed_ids),
+            deferred=len(deferred_ids),
+            pending=sum(len(ids) for ids, _ in failed)
+        )
+
+        return len(confirmed_ids)
+
+    @staticmethod
+    def prune_confirmed(db: Session) -> int:
+        """
+        删除超过保留时间的已确认墓碑（避免墓碑表无限增长）
+
+        Args:
+            db: 数据库会话
+
+        Returns:
+            删除的记录数量
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.index_gc_confirmed_retention_seconds)
+
+        deleted = db.query(IndexTombstone).filter(
+            IndexTombstone.status == "confirmed",
+            IndexTombstone.confirmed_at <= cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+
+        if deleted:
+            logger.info("index_tombstones_pruned", deleted=deleted)
+
+        return deleted
+
+
+# 全局实例
+index_gc_service = IndexGCService()
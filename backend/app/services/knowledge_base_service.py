@@ -19,6 +19,7 @@ from app.core.errors import (
     KnowledgeBaseAlreadyExistsError,
     OpenSearchConnectionError
 )
+from app.services.document_index_service import DocumentIndexService, document_index_service
 from app.utils.opensearch_client import opensearch_client
 
 logger = get_logger(__name__)
@@ -56,6 +57,9 @@ class KnowledgeBaseService:
         if existing:
             raise KnowledgeBaseAlreadyExistsError(kb_data.name)
 
+        # 结束检查事务，归还写连接（创建OpenSearch索引期间不占用）
+        db.rollback()
+
         # 2. 生成ID
         kb_id = f"kb-{uuid.uuid4()}"
         index_name = f"kb_{kb_id.replace('-', '_')}_index"
@@ -68,8 +72,9 @@ class KnowledgeBaseService:
         )
 
         try:
-            # 3. 创建OpenSearch索引
+            # 3. 创建OpenSearch索引（chunk索引 + 文档级路由索引）
             opensearch_client.create_index(index_name, embedding_dimension=1024)
+            document_index_service.create_index(f"{index_name}{DocumentIndexService.INDEX_SUFFIX}")
 
             # 4. 创建数据库记录
             kb = KnowledgeBase(
@@ -79,7 +84,9 @@ class KnowledgeBaseService:
                 opensearch_index_name=index_name,
                 status="active",
                 owner_id=owner_id,
-                visibility="private"  # 默认为私有
+                visibility="private",  # 默认为私有
+                relevance_gate_enabled=kb_data.relevance_gate_enabled,
+                query_deadline_seconds=kb_data.query_deadline_seconds
             )
 
             db.add(kb)
@@ -105,6 +112,7 @@ class KnowledgeBaseService:
             # 尝试清理OpenSearch索引
             try:
                 opensearch_client.delete_index(index_name)
+                opensearch_client.delete_index(f"{index_name}{DocumentIndexService.INDEX_SUFFIX}")
             except:
                 pass
             raise
@@ -203,6 +211,13 @@ class KnowledgeBaseService:
         if kb_data.description is not None:
             kb.description = kb_data.description
 
+        # 显式传入null表示恢复使用全局配置，未传入的字段保持不变
+        if "relevance_gate_enabled" in kb_data.model_fields_set:
+            kb.relevance_gate_enabled = kb_data.relevance_gate_enabled
+
+        if "query_deadline_seconds" in kb_data.model_fields_set:
+            kb.query_deadline_seconds = kb_data.query_deadline_seconds
+
         kb.updated_at = datetime.utcnow()
 
         db.commit()
@@ -216,6 +231,9 @@ class KnowledgeBaseService:
         """
         删除知识库（软删除）
 
+        知识库和文档在一个短事务中标记为删除，OpenSearch索引、本地文件和chunks
+        由删除任务在后台清理。
+
         Args:
             db: 数据库会话
             kb_id: 知识库ID
@@ -226,20 +244,54 @@ class KnowledgeBaseService:
         Raises:
             KnowledgeBaseNotFoundError: 知识库不存在
         """
+        from app.core.permissions import invalidate_kb_permissions
+        from app.services.image_service import image_service
+        from app.services.task_service import task_service
+
         kb = KnowledgeBaseService.get_knowledge_base(db, kb_id)
 
         try:
+            now = datetime.utcnow()
+
             # 1. 软删除数据库记录
             kb.status = "deleted"
-            kb.updated_at = datetime.utcnow()
+            kb.updated_at = now
+
+            # 2. 软删除所有文档，并取消尚未开始的同步任务
+            document_ids = [
+                row.id for row in db.query(Document.id).filter(
+                    Document.kb_id == kb_id,
+                    Document.status != "deleted"
+                ).all()
+            ]
+            db.query(Document).filter(
+                Document.kb_id == kb_id,
+                Document.status != "deleted"
+            ).update(
+                {"status": "deleted", "updated_at": now},
+                synchronize_session=False
+            )
+            task_service.cancel_pending_tasks(db, kb_id)
 
-            # 2. 删除OpenSearch索引（真删除）
-            if kb.opensearch_index_name:
-                opensearch_client.delete_index(kb.opensearch_index_name)
+            # 3. 创建删除任务（删除索引、本地文件和chunks）
+            task = task_service.create_delete_task(
+                db,
+                kb_id=kb_id,
+                document_ids=document_ids,
+                commit=False
+            )
 
             db.commit()
 
-            logger.info("knowledge_base_deleted", kb_id=kb_id)
+            image_service.invalidate_knowledge_base(kb_id)
+            invalidate_kb_permissions(kb_id)
+
+            logger.info(
+                "knowledge_base_deleted",
+                kb_id=kb_id,
+                documents=len(document_ids),
+                delete_task_id=task.id
+            )
             return True
 
         except Exception as e:
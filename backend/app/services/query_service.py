@@ -2,13 +2,23 @@
 查询服务
 实现Hybrid Search和Multi-Agent问答流程
 """
+import asyncio
 import uuid
-from typing import List, Dict, AsyncGenerator
+from typing import List, Dict, AsyncGenerator, Optional, Tuple
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
+from app.core.database import run_db
+from app.core.deadline import Deadline
 from app.core.logging import get_logger
-from app.core.errors import KnowledgeBaseNotFoundError
+from app.core.errors import DeadlineExceededError, KnowledgeBaseNotFoundError
+from app.core.resilience import bedrock_breaker, opensearch_breaker, describe_failure, retry_async
+from app.core.scheduler import scheduler, WorkClass
 from app.models.database import KnowledgeBase
+from app.services.conversation_service import ConversationContext, conversation_service
+from app.services.document_index_service import document_index_service
+from app.services.document_loader import DocumentLoader
+from app.services.relevance_gate_service import relevance_gate_service
 from app.utils.opensearch_client import opensearch_client
 from app.utils.bedrock_client import bedrock_client
 
@@ -26,41 +36,207 @@ class QueryService:
     async def _hybrid_search(
         db: Session,
         kb: KnowledgeBase,
-        query_text: str
-    ) -> List[Dict]:
+        query_text: str,
+        deadline: Optional[Deadline] = None,
+        work_class: WorkClass = WorkClass.INTERACTIVE,
+        use_routing: Optional[bool] = None
+    ) -> Tuple[List[Dict], List[str]]:
         """
-        混合检索（向量 + BM25）
+        两级路由 + 混合检索（向量 + BM25）
+
+        1. 文档级kNN粗筛候选文档（文档级索引覆盖不全时跳过）
+        2. 在候选文档内做chunk混合检索（按document_id过滤）
 
         Args:
             db: 数据库会话
             kb: 知识库对象
             query_text: 查询文本
+            deadline: 检索阶段截止时间（退避重试不超过该时间）
+            work_class: 调度类别（批量查询使用background，不与交互式查询争抢）
+            use_routing: 是否使用两级路由；为空时按文档级索引覆盖情况判断（查询数据库）。
+                并发检索时由调用方预先判断后传入，避免多个线程同时使用同一个Session
 
         Returns:
-            检索结果列表
+            (检索结果列表, 候选文档ID列表)，未使用路由时候选文档为空列表
         """
         logger.info("start_hybrid_search", kb_id=kb.id)
 
         index_name = kb.opensearch_index_name
 
-        # 生成查询向量
-        query_embedding = bedrock_client.generate_embedding(query_text)
+        # 生成查询向量（按work_class调度，不阻塞事件循环；Bedrock熔断时直接失败）
+        async def embed():
+            async with scheduler.slot("bedrock", work_class):
+                return await scheduler.run_in_thread(
+                    work_class,
+                    bedrock_client.generate_embedding,
+                    query_text
+                )
+
+        query_embedding = await retry_async(
+            embed,
+            operation="query_embedding",
+            breaker=bedrock_breaker,
+            deadline=deadline
+        )
+
+        async def search(filters=None):
+            return await scheduler.run_in_thread(
+                work_class,
+                opensearch_client.hybrid_search,
+                index_name=index_name,
+                query_text=query_text,
+                query_vector=query_embedding,
+                top_k=QueryService.TOP_K,
+                filters=filters,
+                raise_on_error=True  # 检索失败要报错并计入熔断，而不是当作没有命中
+            )
+
+        # 文档级粗筛
+        if use_routing is None:
+            use_routing = await QueryService._routing_available(db, kb)
+
+        routed_ids = []
+        if use_routing:
+            routed_ids = await scheduler.run_in_thread(
+                work_class,
+                document_index_service.route,
+                kb,
+                query_embedding,
+                settings.document_routing_candidates
+            )
 
-        # 执行混合检索
-        results = opensearch_client.hybrid_search(
-            index_name=index_name,
-            query_text=query_text,
-            query_vector=query_embedding,
-            top_k=QueryService.TOP_K
+        # 执行混合检索（有候选文档时只在候选文档内检索）
+        filters = {"terms": {"document_id": routed_ids}} if routed_ids else None
+        results = await retry_async(
+            lambda: search(filters),
+            operation="hybrid_search",
+            breaker=opensearch_breaker,
+            deadline=deadline
         )
 
+        # 候选文档内没有命中时回退到不限文档的检索
+        if routed_ids and not results:
+            logger.info("document_routing_fallback", kb_id=kb.id, candidates=len(routed_ids))
+            routed_ids = []
+            results = await retry_async(
+                search,
+                operation="hybrid_search",
+                breaker=opensearch_breaker,
+                deadline=deadline
+            )
+
         logger.info(
             "hybrid_search_completed",
             kb_id=kb.id,
-            results_count=len(results)
+            results_count=len(results),
+            routed_documents=len(routed_ids)
+        )
+
+        return results, routed_ids
+
+    @staticmethod
+    async def _routing_available(db: Session, kb: KnowledgeBase) -> bool:
+        """是否可以使用两级路由（已启用且文档级索引覆盖了所有已完成文档）"""
+        return settings.document_routing_enabled and await run_db(
+            document_index_service.check_coverage, db, kb
+        )
+
+    @staticmethod
+    def _rank_documents(doc_chunks: Dict[str, Dict], routed_ids: List[str], k: int = 60) -> List[str]:
+        """
+        文档排序：chunk命中顺序与文档级路由顺序做RRF融合
+
+        只命中一个chunk的文档不会仅凭chunk排名挤掉文档级高度相关的文档。
+
+        Args:
+            doc_chunks: 按document_id分组的chunks（按首个chunk的排名有序）
+            routed_ids: 文档级路由的候选文档（按相关度排序），为空时保持chunk顺序
+            k: RRF参数
+
+        Returns:
+            排序后的文档ID列表
+        """
+        chunk_ranked = list(doc_chunks.keys())
+        if not routed_ids:
+            return chunk_ranked
+
+        route_rank = {doc_id: rank for rank, doc_id in enumerate(routed_ids, start=1)}
+        scores = {
+            doc_id: 1.0 / (k + rank) + (1.0 / (k + route_rank[doc_id]) if doc_id in route_rank else 0.0)
+            for rank, doc_id in enumerate(chunk_ranked, start=1)
+        }
+        return sorted(chunk_ranked, key=lambda doc_id: scores[doc_id], reverse=True)
+
+    @staticmethod
+    async def _gate_documents(
+        db: Session,
+        query_text: str,
+        document_ids: List[str],
+        doc_chunks: Dict[str, Dict],
+        relevant_ids: List[str]
+    ) -> AsyncGenerator[Dict, None]:
+        """
+        相关性预筛：并发判断每个候选文档是否相关，逐个推送gate事件
+
+        Args:
+            db: 数据库会话
+            query_text: 用户问题
+            document_ids: 候选文档ID列表（按相关度排序）
+            doc_chunks: 按document_id分组的命中chunks
+            relevant_ids: 输出参数，按原顺序填入通过预筛的文档ID
+
+        Yields:
+            gate事件
+        """
+        documents = await run_db(DocumentLoader(db).get_documents, document_ids)
+
+        # 找不到的文档不做预筛，交给TwoStageExecutor统一处理
+        candidates = [doc_id for doc_id in document_ids if doc_id in documents]
+        passed = {doc_id for doc_id in document_ids if doc_id not in documents}
+
+        tasks = [
+            asyncio.ensure_future(relevance_gate_service.evaluate(
+                query_text,
+                documents[doc_id],
+                doc_chunks.get(doc_id, {}).get("chunks", [])
+            ))
+            for doc_id in candidates
+        ]
+
+        try:
+            for completed, future in enumerate(asyncio.as_completed(tasks), start=1):
+                decision = await future
+                if decision.relevant:
+                    passed.add(decision.doc_id)
+
+                yield {
+                    "type": "gate",
+                    "data": {
+                        "completed": completed,
+                        "total": len(candidates),
+                        "doc_id": decision.doc_id,
+                        "doc_name": decision.doc_name,
+                        "relevant": decision.relevant,
+                        "reason": decision.reason
+                    }
+                }
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        relevant_ids.extend(doc_id for doc_id in document_ids if doc_id in passed)
+
+        logger.info(
+            "relevance_gate_completed",
+            candidates=len(candidates),
+            relevant=len(relevant_ids),
+            skipped=len(document_ids) - len(relevant_ids)
         )
 
-        return results
+    @staticmethod
+    def _get_knowledge_base(db: Session, kb_id: str):
+        """查询知识库"""
+        return db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
 
     @staticmethod
     def _group_chunks_by_document(chunks: List[Dict]) -> Dict[str, Dict]:
@@ -101,21 +277,63 @@ class QueryService:
         db: Session,
         kb_id: str,
         query_text: str,
-        user_id: int
+        user_id: int,
+        deadline_seconds: Optional[float] = None,
+        conversation_id: Optional[str] = None
+    ) -> AsyncGenerator[Dict, None]:
+        """
+        执行查询并流式返回结果（作为交互式请求参与调度，记录端到端耗时）
+
+        Args:
+            db: 数据库会话
+            kb_id: 知识库ID
+            query_text: 用户问题
+            user_id: 用户ID
+            deadline_seconds: 整体截止时间（秒），为空时使用知识库设置或全局默认
+            conversation_id: 对话ID（多轮对话时传入，调用方已校验归属）
+
+        Yields:
+            流式事件
+        """
+        async with scheduler.interactive_request():
+            async for event in QueryService._run_two_stage_query(
+                db=db,
+                kb_id=kb_id,
+                query_text=query_text,
+                user_id=user_id,
+                deadline_seconds=deadline_seconds,
+                conversation_id=conversation_id
+            ):
+                yield event
+
+    @staticmethod
+    async def _run_two_stage_query(
+        db: Session,
+        kb_id: str,
+        query_text: str,
+        user_id: int,
+        deadline_seconds: Optional[float] = None,
+        conversation_id: Optional[str] = None
     ) -> AsyncGenerator[Dict, None]:
         """
         使用TwoStageExecutor执行查询并流式返回结果
 
+        多轮对话中，检索和Stage 1使用带上文的问题；已阅读过的文档先判断已有结果是否足以回答追问，
+        足够时直接复用，只对新检索到的文档执行预筛和Stage 1。完成后保存本轮问答和新的Stage 1结果。
+
         Args:
             db: 数据库会话
             kb_id: 知识库ID
             query_text: 用户问题
             user_id: 用户ID（用于记录查询历史）
+            deadline_seconds: 整体截止时间（秒）
+            conversation_id: 对话ID
 
         Yields:
             流式事件
         """
         query_id = str(uuid.uuid4())
+        deadline = Deadline(deadline_seconds or settings.query_deadline_seconds)
 
         logger.info(
             "start_two_stage_query",
@@ -125,22 +343,43 @@ class QueryService:
         )
 
         try:
-            # 验证知识库存在
-            kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
+            # 验证知识库存在（在数据库线程池中查询）
+            kb = await run_db(QueryService._get_knowledge_base, db, kb_id)
             if not kb:
                 raise KnowledgeBaseNotFoundError(kb_id)
 
+            # 请求未指定截止时间时使用知识库设置（知识库也未设置时保留全局默认）
+            if not deadline_seconds and kb.query_deadline_seconds:
+                deadline = Deadline(kb.query_deadline_seconds - deadline.elapsed())
+
+            logger.info("query_deadline_resolved", query_id=query_id, deadline_seconds=deadline.total)
+
+            # 多轮对话：加载之前的问答和已有的Stage 1结果
+            context: Optional[ConversationContext] = None
+            if conversation_id:
+                context = await run_db(conversation_service.load_context, db, conversation_id)
+            search_text = context.contextual_query(query_text) if context else query_text
+
             # Step 1: 混合检索
             yield {
                 "type": "status",
                 "message": "正在检索相关文档..."
             }
 
-            search_results = await QueryService._hybrid_search(
-                db=db,
-                kb=kb,
-                query_text=query_text
-            )
+            # 检索阶段预算：超时按截止时间错误处理（不再重试）
+            retrieval_deadline = deadline.child(deadline.total * settings.query_retrieval_budget_ratio)
+            try:
+                search_results, routed_ids = await asyncio.wait_for(
+                    QueryService._hybrid_search(
+                        db=db,
+                        kb=kb,
+                        query_text=search_text,
+                        deadline=retrieval_deadline
+                    ),
+                    timeout=retrieval_deadline.remaining()
+                )
+            except asyncio.TimeoutError:
+                raise DeadlineExceededError("检索", deadline.total)
 
             if not search_results:
                 yield {
@@ -159,7 +398,7 @@ class QueryService:
 
             # Step 2: 提取唯一的Document ID列表
             doc_chunks = QueryService._group_chunks_by_document(search_results)
-            document_ids = list(doc_chunks.keys())[:QueryService.MAX_DOCUMENTS]
+            document_ids = QueryService._rank_documents(doc_chunks, routed_ids)[:QueryService.MAX_DOCUMENTS]
 
             logger.info(
                 "documents_retrieved",
@@ -173,7 +412,70 @@ class QueryService:
                 "document_count": len(document_ids)
             }
 
-            # Step 3: 使用TwoStageExecutor处理
+            # Step 3: 追问时判断已阅读文档的已有结果是否足以回答（足够时不再重新阅读）
+            cached_results = {}
+            if context is not None:
+                reusable = [doc_id for doc_id in document_ids if doc_id in context.cached_results]
+                if reusable:
+                    yield {
+                        "type": "status",
+                        "message": "正在判断已有阅读结果能否回答追问..."
+                    }
+                    sufficient, reason = await conversation_service.check_sufficient(query_text, context, reusable)
+                    if sufficient:
+                        cached_results = {doc_id: context.cached_results[doc_id] for doc_id in reusable}
+
+                    yield {
+                        "type": "conversation",
+                        "data": {
+                            "conversation_id": context.conversation_id,
+                            "reused": len(cached_results),
+                            "new": len(document_ids) - len(reusable),
+                            "sufficient": sufficient,
+                            "reason": reason
+                        }
+                    }
+
+            # Step 4: 相关性预筛（小模型只看标题大纲和命中片段，过滤掉无关文档；复用结果的文档不再预筛）
+            gate_ids = [doc_id for doc_id in document_ids if doc_id not in cached_results]
+            if gate_ids and relevance_gate_service.is_enabled(kb):
+                yield {
+                    "type": "status",
+                    "message": "正在筛选相关文档..."
+                }
+
+                relevant_ids: List[str] = []
+                async for event in QueryService._gate_documents(
+                    db=db,
+                    query_text=search_text,
+                    document_ids=gate_ids,
+                    doc_chunks=doc_chunks,
+                    relevant_ids=relevant_ids
+                ):
+                    yield event
+
+                logger.info(
+                    "documents_gated",
+                    query_id=query_id,
+                    document_count=len(gate_ids),
+                    relevant_count=len(relevant_ids)
+                )
+
+                if not relevant_ids and not cached_results:
+                    yield {
+                        "type": "answer_delta",
+                        "data": {"text": "抱歉，检索到的文档中没有与您问题相关的内容。"}
+                    }
+                    yield {
+                        "type": "done",
+                        "data": {"query_id": query_id, "tokens": {"total_tokens": 0}}
+                    }
+                    return
+
+                passed = set(relevant_ids)
+                document_ids = [doc_id for doc_id in document_ids if doc_id in cached_results or doc_id in passed]
+
+            # Step 5: 使用TwoStageExecutor处理
             from app.services.agentic_robot import TwoStageExecutor
 
             executor = TwoStageExecutor(
@@ -183,8 +485,32 @@ class QueryService:
 
             async for event in executor.execute_streaming(
                 query=query_text,
-                document_ids=document_ids
+                document_ids=document_ids,
+                deadline=deadline,
+                conversation=context,
+                cached_results=cached_results
             ):
+                # 多轮对话：先保存本轮结果再通知完成（客户端收到done后可能立即断开）
+                if context is not None and event.get("type") == "done":
+                    turn_index = await run_db(
+                        conversation_service.save_turn,
+                        conversation_id=context.conversation_id,
+                        query_text=query_text,
+                        answer_text=executor.answer_text,
+                        document_ids=[result.doc_id for result in executor.stage1_results],
+                        read_results=[r for r in executor.stage1_results if r.doc_id not in cached_results],
+                        read_query=search_text,
+                        reused_documents=len(cached_results),
+                        response_time_ms=int(deadline.elapsed() * 1000)
+                    )
+                    event = {
+                        "type": "done",
+                        "data": {
+                            **event.get("data", {}),
+                            "conversation_id": context.conversation_id,
+                            "turn_index": turn_index
+                        }
+                    }
                 yield event
 
             logger.info(
@@ -200,9 +526,123 @@ class QueryService:
                 exc_info=True
             )
 
+            # reason区分快速失败（熔断、不可重试错误）和重试后仍失败
+            yield {
+                "type": "error",
+                "data": {"message": f"查询执行失败: {str(e)}", **describe_failure(e)}
+            }
+
+    @staticmethod
+    async def execute_batch_query(
+        db: Session,
+        kb_id: str,
+        questions: List[str],
+        user_id: int
+    ) -> AsyncGenerator[Dict, None]:
+        """
+        批量查询：并发检索所有问题，按文档合并Stage 1调用，结果按完成顺序流式返回
+
+        批量查询按background类别调度，不使用对冲请求和相关性预筛。
+
+        Args:
+            db: 数据库会话
+            kb_id: 知识库ID
+            questions: 问题列表
+            user_id: 用户ID
+
+        Yields:
+            流式事件（见BatchExecutor.execute_streaming），另有检索阶段的status/error事件
+        """
+        from app.services.agentic_robot import BatchExecutor
+        from app.services.agentic_robot.batch_executor import BatchQuestion
+
+        batch_id = str(uuid.uuid4())
+
+        logger.info(
+            "start_batch_query",
+            batch_id=batch_id,
+            kb_id=kb_id,
+            user_id=user_id,
+            questions=len(questions)
+        )
+
+        try:
+            kb = await run_db(QueryService._get_knowledge_base, db, kb_id)
+            if not kb:
+                raise KnowledgeBaseNotFoundError(kb_id)
+
+            yield {
+                "type": "status",
+                "message": f"正在检索{len(questions)}个问题的相关文档..."
+            }
+
+            # 只判断一次是否使用两级路由：并发检索不再访问数据库会话（Session不是线程安全的）
+            use_routing = await QueryService._routing_available(db, kb)
+
+            semaphore = asyncio.Semaphore(settings.batch_retrieval_concurrency)
+
+            async def retrieve(index: int, text: str):
+                async with semaphore:
+                    try:
+                        search_results, routed_ids = await QueryService._hybrid_search(
+                            db=db,
+                            kb=kb,
+                            query_text=text,
+                            work_class=WorkClass.BACKGROUND,
+                            use_routing=use_routing
+                        )
+                    except Exception as e:
+                        return index, e
+                doc_chunks = QueryService._group_chunks_by_document(search_results)
+                return index, QueryService._rank_documents(doc_chunks, routed_ids)[:QueryService.MAX_DOCUMENTS]
+
+            retrieved = await asyncio.gather(*(retrieve(index, text) for index, text in enumerate(questions)))
+
+            batch_questions = []
+            retrieval_failed = 0
+            for index, result in retrieved:
+                if isinstance(result, Exception):
+                    logger.error("batch_retrieval_failed", batch_id=batch_id, question_index=index, error=str(result))
+                    retrieval_failed += 1
+                    yield {
+                        "type": "error",
+                        "data": {
+                            "question_index": index,
+                            "question": questions[index],
+                            "message": f"检索失败: {str(result)}",
+                            **describe_failure(result)
+                        }
+                    }
+                    continue
+                batch_questions.append(BatchQuestion(index=index, text=questions[index], document_ids=result))
+
+            executor = BatchExecutor(db_session=db, bedrock_client=bedrock_client)
+            async for event in executor.execute_streaming(batch_questions):
+                if event.get("type") == "done":
+                    event = {
+                        "type": "done",
+                        "data": {
+                            **event["data"],
+                            "batch_id": batch_id,
+                            "questions": len(questions),
+                            "failed": event["data"]["failed"] + retrieval_failed
+                        }
+                    }
+                yield event
+
+            logger.info("batch_query_finished", batch_id=batch_id)
+
+        except Exception as e:
+            logger.error(
+                "batch_query_failed",
+                batch_id=batch_id,
+                error=str(e),
+                exc_info=True
+            )
+
             yield {
                 "type": "error",
-                "data": {"message": f"查询执行失败: {str(e)}"}
+                "data": {"message": f"批量查询执行失败: {str(e)}", **describe_failure(e)}
             }
 
 
@@ -30,6 +30,7 @@ class Stage1Result:
     doc_short_id: str
     response_text: str               # 大模型返回的结构化文本
     references_map: dict             # {ref_id: 内容}
+    summary: Optional[str] = None    # 同步时预生成的文档摘要（有摘要时Stage 1不再输出文档总结）
 
 
 class ReferenceExtractor:
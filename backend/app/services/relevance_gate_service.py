@@ -0,0 +1,201 @@
+"""
+相关性预筛服务
+Stage 1之前用小模型根据文档标题大纲和命中片段判断候选文档是否与问题相关，
+只有相关文档才交给大模型做全文阅读，减少最终回答"文档中未找到直接相关信息"的无效调用
+"""
+import asyncio
+import json
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.scheduler import scheduler, WorkClass
+from app.models.database import Document, KnowledgeBase
+from app.utils.bedrock_client import bedrock_client
+
+logger = get_logger(__name__)
+
+
+GATE_PROMPT_TEMPLATE = """你需要判断一份产品文档是否可能包含回答用户问题所需的信息。
+下面提供了文档名称、标题大纲以及检索命中的片段（不是全文）。
+
+判断标准：
+- 文档主题、章节或命中片段与问题直接相关，或很可能在正文中包含答案 → 相关
+- 只是出现了相同的词语，但讨论的是无关的功能或场景 → 不相关
+- 无法确定时判断为相关
+
+只输出一行JSON，不要输出其他内容：
+{{"relevant": true或false, "reason": "不超过30字的理由"}}
+
+用户问题：{query}
+
+文档名称：{filename}
+
+标题大纲：
+{outline}
+
+命中片段：
+{chunks}
+"""
+
+_JSON_PATTERN = re.compile(r'\{.*\}', re.DOTALL)
+
+
+@dataclass
+class GateDecision:
+    """单个文档的预筛结果"""
+    doc_id: str
+    doc_name: str
+    relevant: bool
+    reason: str
+    elapsed_seconds: float = 0.0
+
+
+class RelevanceGateService:
+    """相关性预筛服务"""
+
+    @staticmethod
+    def is_enabled(kb: KnowledgeBase) -> bool:
+        """
+        知识库是否启用预筛（知识库未设置时使用全局配置）
+
+        Args:
+            kb: 知识库对象
+
+        Returns:
+            是否启用
+        """
+        if kb.relevance_gate_enabled is not None:
+            return kb.relevance_gate_enabled
+        return settings.relevance_gate_enabled
+
+    @staticmethod
+    def build_prompt(query: str, document: Document, chunks: List[Dict]) -> str:
+        """
+        构建预筛提示词：标题大纲（没有大纲时用摘要） + 排名靠前的命中片段
+
+        Args:
+            query: 用户问题
+            document: 文档对象
+            chunks: 该文档的命中chunks（OpenSearch返回格式）
+
+        Returns:
+            提示词
+        """
+        max_chars = settings.relevance_gate_max_chars
+        outline = (document.outline or document.summary or "（无）")[:max_chars // 2]
+
+        snippets = []
+        remaining = max_chars - len(outline)
+        for index, chunk in enumerate(chunks[:settings.relevance_gate_max_chunks], start=1):
+            source = chunk.get("source", {})
+            text = source.get("content") or source.get("image_description") or ""
+            if not text or remaining <= 0:
+                continue
+            text = text[:remaining]
+            remaining -= len(text)
+            snippets.append(f"[片段{index}]\n{text}")
+
+        return GATE_PROMPT_TEMPLATE.format(
+            query=query,
+            filename=document.filename,
+            outline=outline,
+            chunks="\n\n".join(snippets) or "（无）"
+        )
+
+    @staticmethod
+    def parse_decision(text: str) -> Optional[Dict]:
+        """
+        解析模型输出的JSON
+
+        Args:
+            text: 模型输出
+
+        Returns:
+            {"relevant": bool, "reason": str}，无法解析时返回None
+        """
+        match = _JSON_PATTERN.search(text or "")
+        if not match:
+            return None
+        try:
+            data = json.loads(match.group(0))
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or not isinstance(data.get("relevant"), bool):
+            return None
+        return {"relevant": data["relevant"], "reason": str(data.get("reason") or "")}
+
+    @staticmethod
+    async def evaluate(query: str, document: Document, chunks: List[Dict]) -> GateDecision:
+        """
+        判断单个文档是否相关（失败、超时或无法解析时视为相关，不因预筛漏掉文档）
+
+        Args:
+            query: 用户问题
+            document: 文档对象
+            chunks: 该文档的命中chunks
+
+        Returns:
+            GateDecision对象
+        """
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        prompt = RelevanceGateService.build_prompt(query, document, chunks)
+
+        relevant, reason = True, ""
+        try:
+            async with scheduler.slot("bedrock", WorkClass.INTERACTIVE):
+                output = await asyncio.wait_for(
+                    scheduler.run_in_thread(
+                        WorkClass.INTERACTIVE,
+                        bedrock_client.generate_text,
+                        prompt,
+                        max_tokens=200,
+                        temperature=0.0,
+                        model_id=settings.relevance_gate_model_id
+                    ),
+                    timeout=settings.relevance_gate_timeout_seconds
+                )
+
+            decision = RelevanceGateService.parse_decision(output)
+            if decision is None:
+                logger.warning("relevance_gate_unparseable", doc_id=document.id, output=output)
+                reason = "预筛结果无法解析"
+            else:
+                relevant, reason = decision["relevant"], decision["reason"]
+
+        except asyncio.TimeoutError:
+            logger.warning(
+                "relevance_gate_timeout",
+                doc_id=document.id,
+                timeout=settings.relevance_gate_timeout_seconds
+            )
+            reason = "预筛超时"
+
+        except Exception as e:
+            logger.warning("relevance_gate_failed", doc_id=document.id, error=str(e))
+            reason = "预筛失败"
+
+        elapsed = loop.time() - start_time
+        logger.info(
+            "relevance_gate_decision",
+            doc_id=document.id,
+            doc_name=document.filename,
+            relevant=relevant,
+            reason=reason,
+            elapsed_seconds=round(elapsed, 2)
+        )
+
+        return GateDecision(
+            doc_id=document.id,
+            doc_name=document.filename,
+            relevant=relevant,
+            reason=reason,
+            elapsed_seconds=round(elapsed, 2)
+        )
+
+
+# 全局实例
+relevance_gate_service = RelevanceGateService()
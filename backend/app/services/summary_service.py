@@ -0,0 +1,92 @@
+"""
+文档摘要服务
+同步时为每个文档生成一次与问题无关的结构化摘要（文档概览+章节概要），
+查询时Stage 1不再重复生成，Stage 2直接使用保存的摘要
+"""
+from typing import Optional
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.utils.bedrock_client import bedrock_client
+
+logger = get_logger(__name__)
+
+
+SUMMARY_PROMPT_TEMPLATE = """以下是一份产品文档的完整内容（图片已替换为文字描述）。
+
+请阅读文档，输出与具体问题无关的文档总结，包括文档总体简述和每个章节的简述。
+如果文档中有当前文档的版本、创建日期等信息，包含到总体简述中。
+
+**输出格式**（只输出以下内容，不要输出其他说明）
+```
+### 文档概览
+- **文档标题**：[文档名称]
+- **版本信息**：[版本号，没有则写"未注明"]
+- **创建/更新日期**：[日期，没有则写"未注明"]
+- **文档类型**：[类型说明]
+- **核心内容**：[100-200字总体概述]
+
+### 章节概要
+1. **[章节1标题]**：[简述内容，50-100字]
+2. **[章节2标题]**：[简述内容，50-100字]
+...
+```
+
+文档名称：{filename}
+
+文档内容：
+{content}
+"""
+
+
+class SummaryService:
+    """文档摘要服务"""
+
+    @staticmethod
+    def generate_summary(markdown_content: str, filename: str) -> Optional[str]:
+        """
+        生成文档摘要（同步调用Bedrock，在Worker中执行）
+
+        Args:
+            markdown_content: 纯文本Markdown（图片已替换为描述）
+            filename: 文档文件名
+
+        Returns:
+            Markdown格式的摘要；未启用或文档为空时返回None
+
+        Raises:
+            BedrockAPIError: 调用失败
+        """
+        if not settings.document_summary_enabled or not markdown_content.strip():
+            return None
+
+        # 超长文档只取开头部分（章节结构和版本信息通常在前面）
+        max_chars = settings.document_summary_max_input_chars
+        content = markdown_content
+        if len(content) > max_chars:
+            content = content[:max_chars]
+            logger.info(
+                "document_summary_input_truncated",
+                filename=filename,
+                original_length=len(markdown_content),
+                truncated_length=max_chars
+            )
+
+        summary = bedrock_client.generate_text(
+            SUMMARY_PROMPT_TEMPLATE.format(filename=filename, content=content),
+            max_tokens=settings.document_summary_max_tokens,
+            temperature=0.3
+        )
+
+        # 去掉模型可能包裹的代码块标记
+        summary = summary.strip()
+        if summary.startswith("```"):
+            summary = summary.split("\n", 1)[1] if "\n" in summary else ""
+        if summary.endswith("```"):
+            summary = summary[:-3]
+
+        return summary.strip() or None
+
+
+# 全局实例
+summary_service = SummaryService()
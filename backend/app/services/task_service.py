@@ -2,11 +2,12 @@
 同步任务服务
 管理PDF文档的异步处理任务
 """
+import json
 import uuid
 from typing import List, Optional, Tuple
-from datetime import datetime
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import desc, update, or_, and_, select, exists
 
 from app.core.config import settings
 from app.core.logging import get_logger
@@ -27,16 +28,21 @@ class TaskService:
         db: Session,
         kb_id: str,
         task_type: str,
-        document_ids: Optional[List[str]] = None
+        document_ids: Optional[List[str]] = None,
+        commit: bool = True
     ) -> SyncTask:
         """
         创建同步任务
 
+        增量同步的文档会合并进该知识库尚未开始的增量任务；已有任务在运行时，
+        新任务进入队列排队（同一知识库的任务由Worker依次执行）。
+
         Args:
             db: 数据库会话
             kb_id: 知识库ID
             task_type: 任务类型 (full_sync | incremental)
             document_ids: 文档ID列表（full_sync时为空）
+            commit: 是否提交事务（批量上传时与文档记录在同一事务中提交）
 
         Returns:
             SyncTask对象
@@ -51,33 +57,44 @@ class TaskService:
             document_count=len(document_ids) if document_ids else 0
         )
 
+        # 删除任务只由删除文档/知识库时内部创建
+        if task_type not in ("full_sync", "incremental"):
+            from app.core.errors import ASKPRDException
+            raise ASKPRDException(
+                error_code="7005",
+                message=f"不支持的任务类型: {task_type}",
+                details={"task_type": task_type},
+                status_code=400
+            )
+
         # 验证知识库存在
         kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
         if not kb:
             raise KnowledgeBaseNotFoundError(kb_id)
 
-        # 检查是否已有运行中的任务
-        running_task = db.query(SyncTask).filter(
-            SyncTask.kb_id == kb_id,
-            SyncTask.status.in_(["pending", "running"])
-        ).first()
-
-        if running_task:
-            logger.warning(
-                "sync_task_already_running",
-                kb_id=kb_id,
-                running_task_id=running_task.id
-            )
-            from app.core.errors import ASKPRDException
-            raise ASKPRDException(
-                error_code="7002",
-                message="该知识库已有同步任务在运行，请稍后再试",
-                details={"running_task_id": running_task.id},
-                status_code=409  # 使用409 Conflict更语义化
-            )
-
         # 确定要处理的文档
         if task_type == "full_sync":
+            # 全量同步会覆盖所有待处理文档，同一时间只保留一个
+            running_task = db.query(SyncTask).filter(
+                SyncTask.kb_id == kb_id,
+                SyncTask.task_type == "full_sync",
+                SyncTask.status.in_(["pending", "running"])
+            ).first()
+
+            if running_task:
+                logger.warning(
+                    "sync_task_already_running",
+                    kb_id=kb_id,
+                    running_task_id=running_task.id
+                )
+                from app.core.errors import ASKPRDException
+                raise ASKPRDException(
+                    error_code="7002",
+                    message="该知识库已有全量同步任务在运行，请稍后再试",
+                    details={"running_task_id": running_task.id},
+                    status_code=409  # 使用409 Conflict更语义化
+                )
+
             # 全量同步：所有uploaded或failed状态的文档（失败的文档支持重新同步）
             documents = db.query(Document).filter(
                 Document.kb_id == kb_id,
@@ -85,8 +102,8 @@ class TaskService:
             ).all()
             doc_ids = [doc.id for doc in documents]
         else:
-            # 增量同步：指定的文档
-            doc_ids = document_ids or []
+            # 增量同步：指定的文档（去重，保持顺序）
+            doc_ids = list(dict.fromkeys(document_ids or []))
 
             # 验证文档存在且属于该知识库
             if doc_ids:
@@ -117,12 +134,19 @@ class TaskService:
                 status_code=400
             )
 
+        # 增量同步：合并到尚未被Worker租用的增量任务
+        if task_type != "full_sync":
+            merged = TaskService._merge_into_pending_task(db, kb_id, doc_ids, commit)
+            if merged:
+                return merged
+
         # 创建任务
         task_id = f"task-{uuid.uuid4()}"
         task = SyncTask(
             id=task_id,
             kb_id=kb_id,
             task_type=task_type,
+            document_ids=json.dumps(doc_ids) if task_type != "full_sync" else None,
             status="pending",
             total_documents=len(doc_ids),
             processed_documents=0,
@@ -131,8 +155,11 @@ class TaskService:
         )
 
         db.add(task)
-        db.commit()
-        db.refresh(task)
+        if commit:
+            db.commit()
+            db.refresh(task)
+        else:
+            db.flush()
 
         logger.info(
             "sync_task_created",
@@ -143,6 +170,176 @@ class TaskService:
 
         return task
 
+    @staticmethod
+    def _merge_into_pending_task(
+        db: Session,
+        kb_id: str,
+        doc_ids: List[str],
+        commit: bool = True,
+        task_type: str = "incremental"
+    ) -> Optional[SyncTask]:
+        """
+        将文档合并到知识库中尚未开始的同类型任务（incremental | delete）
+
+        合并通过条件UPDATE完成（status仍为pending），与Worker的租用互斥；
+        任务已被租用时返回None，由调用方新建任务。
+
+        Args:
+            db: 数据库会话
+            kb_id: 知识库ID
+            doc_ids: 要追加的文档ID列表
+            commit: 是否提交事务
+            task_type: 任务类型
+
+        Returns:
+            合并后的SyncTask，没有可合并的任务时返回None
+        """
+        pending_task = db.query(SyncTask).filter(
+            SyncTask.kb_id == kb_id,
+            SyncTask.task_type == task_type,
+            SyncTask.status == "pending"
+        ).order_by(desc(SyncTask.created_at)).first()
+
+        if not pending_task:
+            return None
+
+        merged_ids = list(dict.fromkeys(
+            (TaskService.get_task_document_ids(pending_task) or []) + doc_ids
+        ))
+
+        result = db.execute(
+            update(SyncTask)
+            .where(SyncTask.id == pending_task.id, SyncTask.status == "pending")
+            .values(
+                document_ids=json.dumps(merged_ids),
+                total_documents=len(merged_ids)
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        if result.rowcount != 1:
+            return None
+
+        if commit:
+            db.commit()
+        db.refresh(pending_task)
+
+        logger.info(
+            "sync_task_merged",
+            task_id=pending_task.id,
+            kb_id=kb_id,
+            added_documents=len(doc_ids),
+            total_documents=len(merged_ids)
+        )
+
+        return pending_task
+
+    @staticmethod
+    def create_delete_task(
+        db: Session,
+        kb_id: str,
+        document_ids: List[str],
+        commit: bool = True
+    ) -> SyncTask:
+        """
+        创建删除（清理）任务：由Worker删除文档的本地文件、chunks，知识库已删除时同时删除索引
+
+        文档已在调用方的事务中软删除，这里不再校验文档状态。
+
+        Args:
+            db: 数据库会话
+            kb_id: 知识库ID
+            document_ids: 要清理的文档ID列表（删除知识库且没有文档时可为空）
+            commit: 是否提交事务
+
+        Returns:
+            SyncTask对象
+        """
+        doc_ids = list(dict.fromkeys(document_ids))
+
+        if doc_ids:
+            merged = TaskService._merge_into_pending_task(
+                db, kb_id, doc_ids, commit, task_type="delete"
+            )
+            if merged:
+                return merged
+
+        task_id = f"task-{uuid.uuid4()}"
+        task = SyncTask(
+            id=task_id,
+            kb_id=kb_id,
+            task_type="delete",
+            document_ids=json.dumps(doc_ids),
+            status="pending",
+            total_documents=len(doc_ids),
+            processed_documents=0,
+            failed_documents=0,
+            created_at=datetime.utcnow()
+        )
+
+        db.add(task)
+        if commit:
+            db.commit()
+            db.refresh(task)
+        else:
+            db.flush()
+
+        logger.info(
+            "delete_task_created",
+            task_id=task_id,
+            kb_id=kb_id,
+            total_documents=len(doc_ids)
+        )
+
+        return task
+
+    @staticmethod
+    def cancel_pending_tasks(db: Session, kb_id: str) -> int:
+        """
+        取消知识库中尚未开始的同步任务（不提交，删除任务不受影响）
+
+        Args:
+            db: 数据库会话
+            kb_id: 知识库ID
+
+        Returns:
+            取消的任务数量
+        """
+        result = db.execute(
+            update(SyncTask)
+            .where(
+                SyncTask.kb_id == kb_id,
+                SyncTask.task_type != "delete",
+                SyncTask.status == "pending"
+            )
+            .values(
+                status="failed",
+                error_message="知识库已删除",
+                completed_at=datetime.utcnow()
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        if result.rowcount:
+            logger.info("sync_tasks_cancelled", kb_id=kb_id, count=result.rowcount)
+
+        return result.rowcount
+
+    @staticmethod
+    def get_task_document_ids(task: SyncTask) -> Optional[List[str]]:
+        """
+        解析任务中记录的文档ID列表
+
+        Args:
+            task: SyncTask对象
+
+        Returns:
+            文档ID列表，全量同步任务返回None
+        """
+        if not task.document_ids:
+            return None
+        return json.loads(task.document_ids)
+
     @staticmethod
     def get_task(db: Session, task_id: str) -> Optional[SyncTask]:
         """
@@ -220,6 +417,7 @@ class TaskService:
 
         if status in ["completed", "failed", "partial_success"]:
             task.completed_at = datetime.utcnow()
+            task.lease_expires_at = None
 
         db.commit()
 
@@ -284,18 +482,20 @@ class TaskService:
         """
         if task_type == "full_sync":
             # 全量同步：所有uploaded或failed状态的文档（失败的文档支持重新同步）
+            # 以及processing状态的文档（Worker中断后接管任务时续跑）
             documents = db.query(Document).filter(
                 Document.kb_id == kb_id,
-                Document.status.in_(["uploaded", "failed"])
+                Document.status.in_(["uploaded", "failed", "processing"])
             ).all()
         else:
-            # 增量同步：指定的文档
+            # 增量同步：指定的文档（排除任务创建后被删除的文档）
             if not document_ids:
                 return []
 
             documents = db.query(Document).filter(
                 Document.id.in_(document_ids),
-                Document.kb_id == kb_id
+                Document.kb_id == kb_id,
+                Document.status != "deleted"
             ).all()
 
         logger.info(
@@ -307,6 +507,197 @@ class TaskService:
 
         return documents
 
+    @staticmethod
+    def get_finished_document_ids(db: Session, task: SyncTask) -> Tuple[List[str], List[str]]:
+        """
+        查询本任务已处理完的文档（接管中断的任务时，用于跳过这些文档并按文档状态重新计算进度）
+
+        同一知识库同时只有一个任务在执行，任务开始后状态变为completed/failed的文档即由本任务处理。
+
+        Args:
+            db: 数据库会话
+            task: 任务对象
+
+        Returns:
+            (成功的文档ID列表, 失败的文档ID列表)
+        """
+        if not task.started_at:
+            return [], []
+
+        # updated_at由SQLite写入，精度为秒
+        started_at = task.started_at.replace(microsecond=0)
+        query = db.query(Document.id, Document.status).filter(
+            Document.kb_id == task.kb_id,
+            Document.status.in_(["completed", "failed"]),
+            Document.updated_at >= started_at
+        )
+        if task.task_type != "full_sync":
+            query = query.filter(Document.id.in_(TaskService.get_task_document_ids(task)))
+
+        completed, failed = [], []
+        for doc_id, status in query.all():
+            (completed if status == "completed" else failed).append(doc_id)
+        return completed, failed
+
+    @staticmethod
+    def lease_next_task(
+        db: Session,
+        worker_id: str,
+        lease_seconds: Optional[int] = None
+    ) -> Optional[SyncTask]:
+        """
+        从持久化队列中租用下一个任务
+
+        可租用的任务：
+        1. pending状态的任务
+        2. running状态但租约已过期（或没有租约）的任务，即Worker崩溃/API重启后遗留的任务
+
+        同一知识库同时只会有一个任务处于有效租约中。
+        租用通过条件UPDATE完成（compare-and-set），多个Worker进程/主机可并行消费。
+
+        Args:
+            db: 数据库会话
+            worker_id: Worker标识
+            lease_seconds: 租约时长（默认使用配置）
+
+        Returns:
+            租用成功的SyncTask，没有可执行任务时返回None
+        """
+        lease_seconds = lease_seconds or settings.sync_lease_seconds
+        now = datetime.utcnow()
+
+        lease_expired = and_(
+            SyncTask.status == "running",
+            or_(SyncTask.lease_expires_at.is_(None), SyncTask.lease_expires_at <= now)
+        )
+        leasable = or_(SyncTask.status == "pending", lease_expired)
+
+        # 已有有效租约的知识库
+        busy_kb_ids = select(SyncTask.kb_id).where(
+            SyncTask.status == "running",
+            SyncTask.lease_expires_at > now
+        )
+
+        candidates = db.query(SyncTask).filter(
+            leasable,
+            SyncTask.kb_id.notin_(busy_kb_ids)
+        ).order_by(SyncTask.created_at).limit(5).all()
+
+        # 租用时再次确认同一知识库没有其他有效租约（SELECT之后其他Worker可能已租用同知识库的任务）
+        other = aliased(SyncTask)
+        kb_idle = ~exists().where(
+            other.kb_id == SyncTask.kb_id,
+            other.id != SyncTask.id,
+            other.status == "running",
+            other.lease_expires_at > now
+        )
+
+        # 租用失败的知识库（可能已被其他Worker租用），跳过其后续候选任务
+        contended_kb_ids = set()
+
+        for candidate in candidates:
+            if candidate.kb_id in contended_kb_ids:
+                continue
+
+            # 超过最大接管次数的任务直接标记失败
+            if candidate.status == "running" and (candidate.attempts or 0) >= settings.sync_max_attempts:
+                result = db.execute(
+                    update(SyncTask)
+                    .where(SyncTask.id == candidate.id, lease_expired)
+                    .values(
+                        status="failed",
+                        error_message="任务多次中断，超过最大重试次数",
+                        completed_at=now,
+                        lease_expires_at=None
+                    )
+                )
+                db.commit()
+                if result.rowcount == 1:
+                    logger.warning(
+                        "sync_task_abandoned",
+                        task_id=candidate.id,
+                        attempts=candidate.attempts
+                    )
+                continue
+
+            result = db.execute(
+                update(SyncTask)
+                .where(SyncTask.id == candidate.id, leasable, kb_idle)
+                .values(
+                    status="running",
+                    lease_owner=worker_id,
+                    lease_expires_at=now + timedelta(seconds=lease_seconds),
+                    heartbeat_at=now,
+                    attempts=SyncTask.attempts + 1,
+                    started_at=candidate.started_at or now
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+
+            if result.rowcount != 1:
+                # 被其他Worker抢先租用，或同一知识库的其他任务已被租用
+                contended_kb_ids.add(candidate.kb_id)
+                continue
+
+            db.refresh(candidate)
+
+            logger.info(
+                "sync_task_leased",
+                task_id=candidate.id,
+                kb_id=candidate.kb_id,
+                worker_id=worker_id,
+                attempts=candidate.attempts,
+                resumed=candidate.attempts > 1
+            )
+
+            return candidate
+
+        return None
+
+    @staticmethod
+    def heartbeat_task(
+        db: Session,
+        task_id: str,
+        worker_id: str,
+        lease_seconds: Optional[int] = None
+    ) -> bool:
+        """
+        续约任务（心跳）
+
+        Args:
+            db: 数据库会话
+            task_id: 任务ID
+            worker_id: Worker标识
+            lease_seconds: 租约时长（默认使用配置）
+
+        Returns:
+            是否续约成功（False表示租约已丢失，任务被其他Worker接管或已结束）
+        """
+        lease_seconds = lease_seconds or settings.sync_lease_seconds
+        now = datetime.utcnow()
+
+        result = db.execute(
+            update(SyncTask)
+            .where(
+                SyncTask.id == task_id,
+                SyncTask.lease_owner == worker_id,
+                SyncTask.status == "running"
+            )
+            .values(
+                heartbeat_at=now,
+                lease_expires_at=now + timedelta(seconds=lease_seconds)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+        renewed = result.rowcount == 1
+        if not renewed:
+            logger.warning("sync_task_lease_lost", task_id=task_id, worker_id=worker_id)
+
+        return renewed
+
     @staticmethod
     def cancel_task(db: Session, task_id: str) -> bool:
         """
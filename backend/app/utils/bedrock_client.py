@@ -2,12 +2,15 @@
 AWS Bedrock客户端工具类
 使用Strands Agent框架集成
 """
-from typing import List, Optional
+from typing import List, Optional, TYPE_CHECKING
 import boto3
-from strands.models import BedrockModel
 from app.core.config import settings
 from app.core.logging import get_logger
 from app.core.errors import BedrockAPIError
+from app.utils.lazy_client import LazyClient
+
+if TYPE_CHECKING:
+    from strands.models import BedrockModel
 
 logger = get_logger(__name__)
 
@@ -78,7 +81,7 @@ class BedrockClient:
         temperature: float = 0.7,
         max_tokens: int = 4096,
         streaming: bool = True
-    ) -> BedrockModel:
+    ) -> "BedrockModel":
         """
         获取生成模型（Claude Sonnet 4.5）
 
@@ -90,6 +93,9 @@ class BedrockClient:
         Returns:
             BedrockModel实例
         """
+        # strands只在生成时需要，延迟导入以减少API启动时间
+        from strands.models import BedrockModel
+
         try:
             # 注意：不能同时传boto_session和region_name
             model = BedrockModel(
@@ -309,6 +315,56 @@ class BedrockClient:
                 "operation": "analyze_image"
             })
 
+    def generate_text(
+        self,
+        prompt: str,
+        max_tokens: int = 2000,
+        temperature: float = 0.3,
+        model_id: Optional[str] = None
+    ) -> str:
+        """
+        纯文本生成（非流式，用于文档摘要、相关性预筛等短任务）
+
+        Args:
+            prompt: 提示词
+            max_tokens: 最大生成token数
+            temperature: 温度参数
+            model_id: 模型ID，默认使用generation_model_id
+
+        Returns:
+            生成的文本
+        """
+        model_id = model_id or settings.generation_model_id
+        try:
+            response = self.runtime_client.converse(
+                modelId=model_id,
+                messages=[{"role": "user", "content": [{"text": prompt}]}],
+                inferenceConfig={
+                    "maxTokens": max_tokens,
+                    "temperature": temperature
+                }
+            )
+
+            result_text = response["output"]["message"]["content"][0]["text"]
+
+            logger.debug(
+                "text_generation_completed",
+                model_id=model_id,
+                prompt_length=len(prompt),
+                result_length=len(result_text),
+                output_tokens=response.get("usage", {}).get("outputTokens", 0)
+            )
+
+            return result_text.strip()
+
+        except Exception as e:
+            logger.error("text_generation_failed", error=str(e), exc_info=True)
+            raise BedrockAPIError({
+                "error": str(e),
+                "model_id": model_id,
+                "operation": "generate_text"
+            })
+
 
-# 全局Bedrock客户端实例
-bedrock_client = BedrockClient()
+# 全局Bedrock客户端实例（首次使用时初始化）
+bedrock_client: BedrockClient = LazyClient(BedrockClient, "bedrock")
@@ -0,0 +1,59 @@
+"""
+延迟初始化的客户端代理
+首次访问属性时才构造客户端（线程安全），导入模块不再触发凭证解析和连接初始化
+"""
+import threading
+from typing import Any, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class LazyClient(Generic[T]):
+    """
+    客户端的延迟初始化代理
+
+    用法：opensearch_client = LazyClient(OpenSearchClient, "opensearch")
+    代理对象的属性访问转发给真实客户端；构造失败时抛出原异常，下次访问重试。
+    """
+
+    def __init__(self, factory: Callable[[], T], name: str):
+        """
+        Args:
+            factory: 构造客户端的函数（通常是客户端类）
+            name: 客户端名称（用于启动报告）
+        """
+        self._factory = factory
+        self._name = name
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        """获取真实客户端（首次调用时构造）"""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                instance = self._instance
+                if instance is None:
+                    instance = self._factory()
+                    self._instance = instance
+        return instance
+
+    @property
+    def initialized(self) -> bool:
+        """客户端是否已构造"""
+        return self._instance is not None
+
+    def reset(self):
+        """丢弃已构造的客户端（如凭证轮换后），下次访问时重新构造"""
+        with self._lock:
+            self._instance = None
+
+    def __getattr__(self, item: str) -> Any:
+        # 代理自身的属性尚未设置时（如copy/pickle）不转发，避免递归
+        if item in ("_factory", "_name", "_instance", "_lock"):
+            raise AttributeError(item)
+        return getattr(self.get(), item)
+
+    def __repr__(self) -> str:
+        state = "initialized" if self.initialized else "pending"
+        return f"<LazyClient {self._name} ({state})>"
@@ -2,6 +2,7 @@
 AWS OpenSearch客户端工具类
 用于向量存储和混合检索
 """
+import math
 from typing import List, Dict, Any, Optional
 import boto3
 from opensearchpy import OpenSearch, RequestsHttpConnection
@@ -9,6 +10,7 @@ from requests_aws4auth import AWS4Auth
 from app.core.config import settings
 from app.core.logging import get_logger
 from app.core.errors import OpenSearchConnectionError, VectorizationError
+from app.utils.lazy_client import LazyClient
 
 logger = get_logger(__name__)
 
@@ -16,6 +18,13 @@ logger = get_logger(__name__)
 class OpenSearchClient:
     """OpenSearch客户端封装"""
 
+    # 带过滤条件的kNN检索时候选集的扩大倍数（旧的nmslib索引后过滤时使用）
+    FILTERED_KNN_EXPANSION = 5
+    MAX_KNN_K = 10000  # kNN查询k的上限
+
+    # 支持在knn查询内过滤（先过滤再检索）的引擎
+    FILTERABLE_KNN_ENGINES = ("faiss", "lucene")
+
     def __init__(self):
         """初始化OpenSearch客户端"""
         try:
@@ -44,6 +53,9 @@ class OpenSearchClient:
                 timeout=30
             )
 
+            # 各索引向量字段使用的引擎（索引创建后不会改变）
+            self._knn_engines: Dict[str, str] = {}
+
             logger.info("opensearch_client_initialized", endpoint=settings.opensearch_endpoint)
 
         except Exception as e:
@@ -88,15 +100,18 @@ class OpenSearchClient:
                             "type": "text",
                             "analyzer": "standard"
                         },
+                        # faiss引擎支持在knn查询内过滤（按路由候选文档检索时不会漏掉chunk）；
+                        # 向量已归一化，内积等价于余弦相似度
                         "embedding": {
                             "type": "knn_vector",
                             "dimension": embedding_dimension,
                             "method": {
                                 "name": "hnsw",
-                                "space_type": "cosinesimil",
-                                "engine": "nmslib",
+                                "space_type": "innerproduct",
+                                "engine": "faiss",
                                 "parameters": {
                                     "ef_construction": 512,
+                                    "ef_search": 512,
                                     "m": 16
                                 }
                             }
@@ -121,6 +136,60 @@ class OpenSearchClient:
             logger.error("opensearch_create_index_failed", index_name=index_name, error=str(e))
             raise OpenSearchConnectionError({"error": str(e), "index_name": index_name})
 
+    def create_document_index(self, index_name: str, embedding_dimension: int = 1024) -> bool:
+        """
+        创建文档级路由索引（每个文档一条向量，由文档摘要和标题大纲生成）
+
+        Args:
+            index_name: 索引名称
+            embedding_dimension: 向量维度（Titan Embeddings V2: 1024）
+
+        Returns:
+            是否创建成功
+        """
+        try:
+            index_body = {
+                "settings": {
+                    "index": {
+                        "number_of_shards": 1,
+                        "number_of_replicas": 0,
+                        "knn": True,
+                        "knn.algo_param.ef_search": 512
+                    }
+                },
+                "mappings": {
+                    "properties": {
+                        "document_id": {"type": "keyword"},
+                        "kb_id": {"type": "keyword"},
+                        "filename": {"type": "text", "analyzer": "standard"},
+                        "summary": {"type": "text", "analyzer": "standard"},
+                        "outline": {"type": "text", "analyzer": "standard"},
+                        "embedding": {
+                            "type": "knn_vector",
+                            "dimension": embedding_dimension,
+                            "method": {
+                                "name": "hnsw",
+                                "space_type": "cosinesimil",
+                                "engine": "nmslib",
+                                "parameters": {
+                                    "ef_construction": 512,
+                                    "m": 16
+                                }
+                            }
+                        },
+                        "created_at": {"type": "date"}
+                    }
+                }
+            }
+
+            response = self.client.indices.create(index=index_name, body=index_body)
+            logger.info("opensearch_document_index_created", index_name=index_name)
+            return response.get('acknowledged', False)
+
+        except Exception as e:
+            logger.error("opensearch_create_document_index_failed", index_name=index_name, error=str(e))
+            raise OpenSearchConnectionError({"error": str(e), "index_name": index_name})
+
     def delete_index(self, index_name: str) -> bool:
         """
         删除索引
@@ -134,6 +203,7 @@ class OpenSearchClient:
         try:
             if self.index_exists(index_name):
                 response = self.client.indices.delete(index=index_name)
+                self._knn_engines.pop(index_name, None)
                 logger.info("opensearch_index_deleted", index_name=index_name)
                 return response.get('acknowledged', False)
             return True
@@ -297,13 +367,19 @@ class OpenSearchClient:
             logger.error("opensearch_delete_doc_failed", index_name=index_name, doc_id=doc_id, error=str(e))
             return False
 
-    def delete_by_query(self, index_name: str, query: Dict[str, Any]) -> int:
+    def delete_by_query(
+        self,
+        index_name: str,
+        query: Dict[str, Any],
+        raise_on_error: bool = False
+    ) -> int:
         """
         按查询删除文档
 
         Args:
             index_name: 索引名称
             query: 删除查询
+            raise_on_error: 失败时是否抛出异常（默认记录日志并返回0）
 
         Returns:
             删除的文档数量
@@ -312,7 +388,8 @@ class OpenSearchClient:
             # OpenSearch Serverless不支持refresh参数
             response = self.client.delete_by_query(
                 index=index_name,
-                body={"query": query}
+                body={"query": query},
+                params={"conflicts": "proceed"}
             )
             deleted = response.get('deleted', 0)
             logger.info("documents_deleted_by_query", index_name=index_name, deleted=deleted)
@@ -320,14 +397,107 @@ class OpenSearchClient:
 
         except Exception as e:
             logger.error("opensearch_delete_by_query_failed", index_name=index_name, error=str(e))
+            if raise_on_error:
+                raise
             return 0
 
+    def count(self, index_name: str, query: Dict[str, Any]) -> int:
+        """
+        统计匹配查询的文档数量
+
+        Args:
+            index_name: 索引名称
+            query: 查询条件
+
+        Returns:
+            文档数量
+        """
+        response = self.client.count(
+            index=index_name,
+            body={"query": query}
+        )
+        return response.get('count', 0)
+
+    def count_distinct(self, index_name: str, field: str, query: Dict[str, Any]) -> int:
+        """
+        统计匹配查询的文档中某字段的不同取值数量（cardinality聚合，4万以内基本精确）
+
+        Args:
+            index_name: 索引名称
+            field: keyword字段
+            query: 查询条件
+
+        Returns:
+            不同取值的数量
+        """
+        response = self.client.search(
+            index=index_name,
+            body={
+                "size": 0,
+                "query": query,
+                "aggs": {
+                    "distinct": {
+                        "cardinality": {"field": field, "precision_threshold": 40000}
+                    }
+                }
+            }
+        )
+        return response["aggregations"]["distinct"]["value"]
+
+    def _knn_engine(self, index_name: str) -> str:
+        """
+        查询索引向量字段使用的kNN引擎（结果缓存）
+
+        Args:
+            index_name: 索引名称
+
+        Returns:
+            引擎名称，查询失败时按nmslib处理（后过滤）
+        """
+        engine = self._knn_engines.get(index_name)
+        if engine is not None:
+            return engine
+
+        try:
+            mapping = self.client.indices.get_mapping(index=index_name)
+            properties = next(iter(mapping.values()))["mappings"]["properties"]
+            engine = properties["embedding"].get("method", {}).get("engine", "nmslib")
+        except Exception as e:
+            logger.warning("opensearch_knn_engine_lookup_failed", index_name=index_name, error=str(e))
+            return "nmslib"
+
+        self._knn_engines[index_name] = engine
+        return engine
+
+    def _post_filter_knn_k(self, index_name: str, filters: Dict[str, Any], top_k: int) -> int:
+        """
+        后过滤时的kNN候选集大小
+
+        按索引总chunk数与匹配过滤条件的chunk数之比放大k，使全局候选集中预期能包含top_k个匹配的chunk
+
+        Args:
+            index_name: 索引名称
+            filters: 过滤条件
+            top_k: 需要的结果数
+
+        Returns:
+            k值，没有匹配过滤条件的chunk时返回0
+        """
+        matched = self.count(index_name, filters)
+        if matched == 0:
+            return 0
+        total = self.count(index_name, {"match_all": {}})
+
+        k = math.ceil(top_k * total / matched)
+        return min(max(k, top_k * self.FILTERED_KNN_EXPANSION, 100), self.MAX_KNN_K)
+
     def vector_search(
         self,
         index_name: str,
         query_vector: List[float],
         top_k: int = 10,
-        filters: Optional[Dict[str, Any]] = None
+        filters: Optional[Dict[str, Any]] = None,
+        raise_on_error: bool = False
     ) -> List[Dict[str, Any]]:
         """
         向量检索（kNN）
@@ -337,6 +507,7 @@ class OpenSearchClient:
             query_vector: 查询向量
             top_k: 返回结果数量
             filters: 过滤条件
+            raise_on_error: 失败时是否抛出异常（默认记录日志并返回空列表）
 
         Returns:
             检索结果列表
@@ -356,7 +527,22 @@ class OpenSearchClient:
 
             # 添加过滤条件
             if filters:
-                query_body["query"]["knn"]["embedding"]["filter"] = filters
+                if self._knn_engine(index_name) in self.FILTERABLE_KNN_ENGINES:
+                    # 在knn查询内过滤：只在匹配过滤条件的向量中检索top_k
+                    query_body["query"]["knn"]["embedding"]["filter"] = filters
+                else:
+                    # 旧索引（nmslib）不支持knn内的filter，对扩大的kNN候选集做后过滤
+                    k = self._post_filter_knn_k(index_name, filters, top_k)
+                    if k == 0:
+                        return []
+                    knn_query = query_body["query"]
+                    knn_query["knn"]["embedding"]["k"] = k
+                    query_body["query"] = {
+                        "bool": {
+                            "must": [knn_query],
+                            "filter": [filters]
+                        }
+                    }
 
             response = self.client.search(index=index_name, body=query_body)
 
@@ -374,6 +560,8 @@ class OpenSearchClient:
 
         except Exception as e:
             logger.error("opensearch_vector_search_failed", index_name=index_name, error=str(e))
+            if raise_on_error:
+                raise
             return []
 
     def keyword_search(
@@ -381,7 +569,8 @@ class OpenSearchClient:
         index_name: str,
         query_text: str,
         top_k: int = 10,
-        filters: Optional[Dict[str, Any]] = None
+        filters: Optional[Dict[str, Any]] = None,
+        raise_on_error: bool = False
     ) -> List[Dict[str, Any]]:
         """
         关键词检索（BM25）
@@ -391,6 +580,7 @@ class OpenSearchClient:
             query_text: 查询文本
             top_k: 返回结果数量
             filters: 过滤条件
+            raise_on_error: 失败时是否抛出异常（默认记录日志并返回空列表）
 
         Returns:
             检索结果列表
@@ -433,6 +623,8 @@ class OpenSearchClient:
 
         except Exception as e:
             logger.error("opensearch_keyword_search_failed", index_name=index_name, error=str(e))
+            if raise_on_error:
+                raise
             return []
 
     def hybrid_search(
@@ -441,7 +633,8 @@ class OpenSearchClient:
         query_text: str,
         query_vector: List[float],
         top_k: int = 20,
-        filters: Optional[Dict[str, Any]] = None
+        filters: Optional[Dict[str, Any]] = None,
+        raise_on_error: bool = False
     ) -> List[Dict[str, Any]]:
         """
         混合检索（向量 + BM25）
@@ -453,15 +646,16 @@ class OpenSearchClient:
             query_vector: 查询向量
             top_k: 返回结果数量
             filters: 过滤条件
+            raise_on_error: 失败时是否抛出异常（默认失败的一路检索返回空列表）
 
         Returns:
             检索结果列表
         """
         # 1. 向量检索
-        vector_results = self.vector_search(index_name, query_vector, top_k, filters)
+        vector_results = self.vector_search(index_name, query_vector, top_k, filters, raise_on_error)
 
         # 2. 关键词检索
-        keyword_results = self.keyword_search(index_name, query_text, top_k, filters)
+        keyword_results = self.keyword_search(index_name, query_text, top_k, filters, raise_on_error)
 
         # 3. RRF合并
         merged = self._reciprocal_rank_fusion(
@@ -507,5 +701,5 @@ class OpenSearchClient:
         return merged
 
 
-# 全局OpenSearch客户端实例
-opensearch_client = OpenSearchClient()
+# 全局OpenSearch客户端实例（首次使用时初始化）
+opensearch_client: OpenSearchClient = LazyClient(OpenSearchClient, "opensearch")
@@ -8,6 +8,7 @@ from botocore.exceptions import ClientError
 from app.core.config import settings
 from app.core.logging import get_logger
 from app.core.errors import S3UploadError
+from app.utils.lazy_client import LazyClient
 
 logger = get_logger(__name__)
 
@@ -284,5 +285,5 @@ class S3Client:
             return None
 
 
-# 全局S3客户端实例
-s3_client = S3Client()
+# 全局S3客户端实例（首次使用时初始化）
+s3_client: S3Client = LazyClient(S3Client, "s3")
@@ -0,0 +1,205 @@
+"""
+清理任务Worker
+处理删除文档/知识库后的后台清理：本地文件、chunks记录和OpenSearch索引
+"""
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.database import SessionLocal
+from app.models.database import Document, KnowledgeBase, Chunk
+from app.services.task_service import task_service
+
+if TYPE_CHECKING:
+    from app.workers.queue_worker import TaskLease
+
+logger = get_logger(__name__)
+
+
+class GCWorker:
+    """清理任务Worker"""
+
+    # 每清理多少个文档更新一次任务进度
+    PROGRESS_INTERVAL = 50
+
+    # 每个事务删除chunks的文档数（保持写事务短小）
+    CHUNK_DELETE_BATCH = 200
+
+    @staticmethod
+    def process_delete_task(task_id: str, lease: Optional["TaskLease"] = None):
+        """
+        处理删除任务
+
+        1. 并行删除文档的PDF、markdown目录和text markdown（gc_concurrency个线程）
+        2. 分批删除chunks记录
+        3. 知识库已删除时删除整个OpenSearch索引
+
+        文件系统操作期间不持有数据库写连接；所有步骤可重复执行，任务被接管时从头重跑即可。
+
+        Args:
+            task_id: 任务ID
+            lease: 队列Worker持有的任务租约
+        """
+        db = SessionLocal(expire_on_commit=False)
+
+        try:
+            task = task_service.get_task(db, task_id)
+            if not task:
+                logger.error("task_not_found", task_id=task_id)
+                return
+
+            if lease is None:
+                task_service.update_task_status(db, task_id, "running")
+
+            document_ids = task_service.get_task_document_ids(task) or []
+
+            kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == task.kb_id).first()
+            drop_index = kb is not None and kb.status == "deleted"
+            index_name = kb.opensearch_index_name if kb else None
+
+            # 收集待删除路径后结束事务，文件删除期间不占用写连接
+            targets = GCWorker._collect_paths(db, document_ids)
+            db.commit()
+
+            logger.info(
+                "start_processing_delete_task",
+                task_id=task_id,
+                kb_id=task.kb_id,
+                documents=len(targets),
+                drop_index=drop_index
+            )
+
+            # 1. 并行删除本地文件
+            processed = 0
+            failed = 0
+            with ThreadPoolExecutor(
+                max_workers=settings.gc_concurrency,
+                thread_name_prefix="gc"
+            ) as executor:
+                for ok in executor.map(GCWorker._remove_document_files, targets):
+                    if ok:
+                        processed += 1
+                    else:
+                        failed += 1
+
+                    if (processed + failed) % GCWorker.PROGRESS_INTERVAL == 0:
+                        if lease is not None and lease.is_lost():
+                            logger.warning("delete_task_aborted_lease_lost", task_id=task_id)
+                            executor.shutdown(wait=True, cancel_futures=True)
+                            return
+                        task_service.update_task_progress(db, task_id, processed, failed)
+
+            task_service.update_task_progress(db, task_id, processed, failed)
+
+            # 2. 分批删除chunks记录（包含向量二进制，占用空间较大）
+            for start in range(0, len(document_ids), GCWorker.CHUNK_DELETE_BATCH):
+                batch = document_ids[start:start + GCWorker.CHUNK_DELETE_BATCH]
+                db.query(Chunk).filter(
+                    Chunk.document_id.in_(batch)
+                ).delete(synchronize_session=False)
+                db.commit()
+
+            # 3. 删除知识库索引和文档级路由索引（单个文档的向量由墓碑清理）
+            error_message = None
+            if drop_index and index_name:
+                from app.services.document_index_service import document_index_service
+                from app.utils.opensearch_client import opensearch_client
+
+                if not opensearch_client.delete_index(index_name):
+                    error_message = f"OpenSearch索引删除失败: {index_name}"
+                elif not document_index_service.drop_index(kb):
+                    error_message = f"文档级路由索引删除失败: {document_index_service.index_name_for(kb)}"
+
+            if error_message or failed:
+                task_service.update_task_status(
+                    db,
+                    task_id,
+                    "partial_success",
+                    error_message=error_message or f"{failed}个文档的文件删除失败"
+                )
+            else:
+                task_service.update_task_status(db, task_id, "completed")
+
+            logger.info(
+                "delete_task_completed",
+                task_id=task_id,
+                processed=processed,
+                failed=failed,
+                index_dropped=drop_index and not error_message
+            )
+
+        except Exception as e:
+            logger.error(
+                "delete_task_failed",
+                task_id=task_id,
+                error=str(e),
+                exc_info=True
+            )
+            db.rollback()
+            task_service.update_task_status(db, task_id, "failed", error_message=str(e))
+
+        finally:
+            db.close()
+
+    @staticmethod
+    def _collect_paths(
+        db,
+        document_ids: List[str]
+    ) -> List[Tuple[str, Optional[str], Optional[str], Optional[str]]]:
+        """读取文档的本地文件路径: (document_id, pdf, markdown, text_markdown)"""
+        targets = []
+        for start in range(0, len(document_ids), GCWorker.CHUNK_DELETE_BATCH):
+            batch = document_ids[start:start + GCWorker.CHUNK_DELETE_BATCH]
+            targets.extend(
+                db.query(
+                    Document.id,
+                    Document.local_pdf_path,
+                    Document.local_markdown_path,
+                    Document.local_text_markdown_path
+                ).filter(Document.id.in_(batch)).all()
+            )
+        return [tuple(row) for row in targets]
+
+    @staticmethod
+    def _remove_document_files(
+        target: Tuple[str, Optional[str], Optional[str], Optional[str]]
+    ) -> bool:
+        """
+        删除单个文档的本地文件（已不存在的文件直接跳过）
+
+        Returns:
+            是否全部删除成功
+        """
+        document_id, pdf_path, markdown_path, text_markdown_path = target
+
+        try:
+            if pdf_path:
+                Path(pdf_path).unlink(missing_ok=True)
+
+            # markdown目录包含content.md和所有图片
+            markdown_dir = (
+                Path(markdown_path).parent if markdown_path
+                else Path(settings.markdown_dir) / document_id
+            )
+            if markdown_dir.exists():
+                shutil.rmtree(markdown_dir)
+
+            if text_markdown_path:
+                Path(text_markdown_path).unlink(missing_ok=True)
+
+            return True
+
+        except OSError as e:
+            logger.warning(
+                "document_files_removal_failed",
+                document_id=document_id,
+                error=str(e)
+            )
+            return False
+
+
+# 全局实例
+gc_worker = GCWorker()
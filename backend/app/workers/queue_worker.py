@@ -0,0 +1,239 @@
+"""
+同步任务队列Worker
+从SQLite中的sync_tasks表租用任务并执行，可作为独立进程运行，也可内嵌在API进程中
+
+独立运行：
+    python -m app.workers.queue_worker --worker-id worker-1
+"""
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import uuid
+from typing import Optional
+
+from app.core.config import settings
+from app.core.logging import setup_logging, get_logger
+from app.core.database import SessionLocal
+from app.services.task_service import task_service
+
+logger = get_logger(__name__)
+
+
+class TaskLease:
+    """任务租约（由心跳线程续约，续约失败时标记为丢失）"""
+
+    def __init__(self, task_id: str, worker_id: str):
+        self.task_id = task_id
+        self.worker_id = worker_id
+        self._lost = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def is_lost(self) -> bool:
+        """租约是否已丢失"""
+        return self._lost.is_set()
+
+    def start_heartbeat(self):
+        """启动心跳线程"""
+        self._thread = threading.Thread(
+            target=self._heartbeat_loop,
+            name=f"lease-heartbeat-{self.task_id[:8]}",
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop_heartbeat(self):
+        """停止心跳线程"""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _heartbeat_loop(self):
+        interval = settings.sync_heartbeat_interval_seconds
+        while not self._stopped.wait(interval):
+            # 心跳使用独立会话，不与任务处理共享
+            db = SessionLocal()
+            try:
+                if not task_service.heartbeat_task(db, self.task_id, self.worker_id):
+                    self._lost.set()
+                    return
+            except Exception as e:
+                logger.error(
+                    "sync_task_heartbeat_failed",
+                    task_id=self.task_id,
+                    error=str(e)
+                )
+            finally:
+                db.close()
+
+
+class SyncQueueWorker:
+    """同步任务队列Worker"""
+
+    def __init__(self, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._gc_wakeup = threading.Event()
+        self._gc_thread: Optional[threading.Thread] = None
+
+    def wakeup(self):
+        """有新任务入队或有待清理的向量时唤醒轮询和清理线程"""
+        self._wakeup.set()
+        self._gc_wakeup.set()
+
+    def stop(self):
+        """停止Worker（当前任务处理完当前文档后退出）"""
+        self._stop.set()
+        self._wakeup.set()
+        self._gc_wakeup.set()
+
+    def run_once(self) -> bool:
+        """
+        租用并执行一个任务
+
+        Returns:
+            是否执行了任务
+        """
+        db = SessionLocal()
+        try:
+            task = task_service.lease_next_task(db, self.worker_id)
+            task_id = task.id if task else None
+            task_type = task.task_type if task else None
+        finally:
+            db.close()
+
+        if not task_id:
+            return False
+
+        lease = TaskLease(task_id, self.worker_id)
+        lease.start_heartbeat()
+        try:
+            # 延迟导入，避免Worker模块加载时引入转换/向量化依赖
+            if task_type == "delete":
+                from app.workers.gc_worker import gc_worker
+                gc_worker.process_delete_task(task_id, lease=lease)
+            else:
+                from app.workers.sync_worker import sync_worker
+                asyncio.run(sync_worker.process_sync_task(task_id, lease=lease))
+        finally:
+            lease.stop_heartbeat()
+
+        return True
+
+    def collect_garbage(self) -> int:
+        """
+        处理待删除的向量墓碑
+
+        Returns:
+            确认删除的墓碑数量
+        """
+        from app.services.index_gc_service import index_gc_service
+
+        db = SessionLocal()
+        try:
+            confirmed = index_gc_service.purge_tombstones(db)
+            index_gc_service.prune_confirmed(db)
+            return confirmed
+        finally:
+            db.close()
+
+    def _gc_loop(self):
+        """向量清理线程：按固定间隔运行，不受长时间同步任务影响"""
+        while not self._stop.is_set():
+            try:
+                self.collect_garbage()
+            except Exception as e:
+                logger.error(
+                    "index_gc_error",
+                    worker_id=self.worker_id,
+                    error=str(e),
+                    exc_info=True
+                )
+
+            self._gc_wakeup.wait(settings.index_gc_interval_seconds)
+            self._gc_wakeup.clear()
+
+    def run_forever(self):
+        """持续消费任务队列，直到stop()被调用"""
+        logger.info("sync_queue_worker_started", worker_id=self.worker_id)
+
+        self._gc_thread = threading.Thread(
+            target=self._gc_loop,
+            name="index-gc",
+            daemon=True
+        )
+        self._gc_thread.start()
+
+        while not self._stop.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception as e:
+                logger.error(
+                    "sync_queue_worker_error",
+                    worker_id=self.worker_id,
+                    error=str(e),
+                    exc_info=True
+                )
+
+            self._wakeup.wait(settings.sync_poll_interval_seconds)
+            self._wakeup.clear()
+
+        self._gc_thread.join(timeout=5)
+        logger.info("sync_queue_worker_stopped", worker_id=self.worker_id)
+
+
+# API进程内嵌Worker
+_embedded_worker: Optional[SyncQueueWorker] = None
+_embedded_thread: Optional[threading.Thread] = None
+
+
+def start_embedded_worker():
+    """在API进程中以后台线程启动Worker"""
+    global _embedded_worker, _embedded_thread
+
+    if _embedded_thread and _embedded_thread.is_alive():
+        return
+
+    _embedded_worker = SyncQueueWorker()
+    _embedded_thread = threading.Thread(
+        target=_embedded_worker.run_forever,
+        name="sync-queue-worker",
+        daemon=True
+    )
+    _embedded_thread.start()
+
+
+def stop_embedded_worker(timeout: float = 10.0):
+    """停止内嵌Worker"""
+    if _embedded_worker:
+        _embedded_worker.stop()
+    if _embedded_thread:
+        _embedded_thread.join(timeout=timeout)
+
+
+def notify_new_task():
+    """通知内嵌Worker有新任务或待清理的向量（独立Worker进程通过轮询发现）"""
+    if _embedded_worker:
+        _embedded_worker.wakeup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASK-PRD 同步任务Worker")
+    parser.add_argument("--worker-id", default=None, help="Worker标识（默认: 主机名-进程号）")
+    args = parser.parse_args()
+
+    setup_logging()
+
+    worker = SyncQueueWorker(worker_id=args.worker_id)
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,33 +4,46 @@
 """
 import asyncio
 from pathlib import Path
-from typing import List
+from typing import List, Optional, TYPE_CHECKING
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
 from app.core.logging import get_logger
 from app.core.database import SessionLocal
-from app.models.database import Document, SyncTask
+from app.core.scheduler import scheduler, WorkClass
+from app.models.database import Document, KnowledgeBase, SyncTask
 from app.services.task_service import task_service
 from app.services.conversion_service import conversion_service
 from app.services.chunking_service import chunking_service
 from app.services.embedding_service import embedding_service
+from app.services.summary_service import summary_service
+from app.services.document_index_service import document_index_service
+from app.services.index_gc_service import index_gc_service
+
+if TYPE_CHECKING:
+    from app.workers.queue_worker import TaskLease
 
 logger = get_logger(__name__)
 
+# 文档处理阶段（按顺序），Document.ingest_stage记录最近完成的阶段
+INGEST_STAGES = ["converted", "described", "summarized", "chunked", "embedded", "indexed"]
+
 
 class SyncWorker:
     """同步任务Worker"""
 
     @staticmethod
-    async def process_sync_task(task_id: str):
+    async def process_sync_task(task_id: str, lease: Optional["TaskLease"] = None):
         """
         异步处理同步任务
 
         Args:
             task_id: 任务ID
+            lease: 队列Worker持有的任务租约（租约丢失时在文档之间中止）
         """
-        db = SessionLocal()
+        # 写连接只有一个：提交后不自动刷新对象，避免在转换/调用Bedrock等长耗时步骤期间
+        # 因访问属性重新开启事务而长时间占用写连接
+        db = SessionLocal(expire_on_commit=False)
 
         try:
             # 获取任务
@@ -47,15 +60,16 @@ class SyncWorker:
                 total_documents=task.total_documents
             )
 
-            # 更新任务状态为running
-            task_service.update_task_status(db, task_id, "running")
+            # 通过队列租用的任务已是running状态，直接调用时才需要更新
+            if lease is None:
+                task_service.update_task_status(db, task_id, "running")
 
             # 获取要处理的文档
             documents = task_service.get_documents_to_process(
                 db=db,
                 kb_id=task.kb_id,
                 task_type=task.task_type,
-                document_ids=None  # TODO: 从任务中获取document_ids
+                document_ids=task_service.get_task_document_ids(task)
             )
 
             if not documents:
@@ -63,11 +77,65 @@ class SyncWorker:
                 task_service.update_task_status(db, task_id, "completed")
                 return
 
+            # 接管中断的任务：跳过本任务已处理完的文档，按文档状态重新计算进度
+            # （不能沿用已记录的计数：中断时正在处理的文档和之前失败的文档会再次返回，重复计数）
+            processed = failed = 0
+            if (task.attempts or 0) > 1:
+                completed_ids, failed_ids = task_service.get_finished_document_ids(db, task)
+                finished = set(completed_ids) | set(failed_ids)
+                documents = [doc for doc in documents if doc.id not in finished]
+                processed, failed = len(completed_ids), len(failed_ids)
+
+                logger.info(
+                    "sync_task_resumed",
+                    task_id=task_id,
+                    processed=processed,
+                    failed=failed,
+                    remaining=len(documents)
+                )
+
+            # 结束读事务，释放写连接
+            db.commit()
+
+            # 按任务规模划分调度类别（后台/批量），低于交互式查询
+            work_class = scheduler.classify_sync_task(task.task_type, len(documents))
+
             # 处理每个文档
-            processed = 0
-            failed = 0
 
             for doc in documents:
+                # 文档之间的让出点：交互式查询繁忙时暂缓下一个文档
+                await scheduler.yield_point(work_class)
+
+                # 租约丢失（心跳失败或被其他Worker接管）时停止，不再写入任务状态
+                if lease is not None and lease.is_lost():
+                    logger.warning(
+                        "sync_task_aborted_lease_lost",
+                        task_id=task_id,
+                        processed=processed,
+                        failed=failed
+                    )
+                    return
+
+                # 任务执行期间知识库或文档被删除：停止任务 / 跳过文档
+                kb_status = db.query(KnowledgeBase.status).filter(
+                    KnowledgeBase.id == task.kb_id
+                ).scalar()
+                doc_status = db.query(Document.status).filter(
+                    Document.id == doc.id
+                ).scalar()
+                db.commit()
+
+                if kb_status == "deleted":
+                    logger.warning("sync_task_aborted_kb_deleted", task_id=task_id)
+                    task_service.update_task_status(
+                        db, task_id, "failed", error_message="知识库已删除"
+                    )
+                    return
+
+                if doc_status == "deleted":
+                    logger.info("document_deleted_skipped", task_id=task_id, document_id=doc.id)
+                    continue
+
                 try:
                     logger.info(
                         "processing_document",
@@ -80,7 +148,8 @@ class SyncWorker:
                     # 处理单个文档
                     success = await SyncWorker._process_single_document(
                         db=db,
-                        document=doc
+                        document=doc,
+                        work_class=work_class
                     )
 
                     if success:
@@ -156,24 +225,79 @@ class SyncWorker:
         finally:
             db.close()
 
+    @staticmethod
+    def _stage_done(document: Document, stage: str) -> bool:
+        """文档是否已完成指定处理阶段"""
+        if document.ingest_stage not in INGEST_STAGES:
+            return False
+        return INGEST_STAGES.index(document.ingest_stage) >= INGEST_STAGES.index(stage)
+
+    @staticmethod
+    def _checkpoint(db: Session, document: Document, stage: str):
+        """记录文档完成的处理阶段"""
+        document.ingest_stage = stage
+        db.commit()
+
+        logger.info("document_stage_checkpoint", document_id=document.id, stage=stage)
+
+    @staticmethod
+    def _reconcile_deleted(db: Session, document: Document) -> bool:
+        """
+        检查文档是否在处理期间被删除，是则为刚写入的向量补记墓碑
+
+        Args:
+            db: 数据库会话
+            document: 文档对象
+
+        Returns:
+            文档是否已被删除
+        """
+        status = db.query(Document.status).filter(Document.id == document.id).scalar()
+        if status != "deleted":
+            db.commit()
+            return False
+
+        kb = document.knowledge_base
+        if kb and kb.opensearch_index_name:
+            index_gc_service.record_tombstones(
+                db,
+                kb_id=kb.id,
+                index_name=kb.opensearch_index_name,
+                document_ids=[document.id]
+            )
+            index_gc_service.record_tombstones(
+                db,
+                kb_id=kb.id,
+                index_name=document_index_service.index_name_for(kb),
+                document_ids=[document.id]
+            )
+        db.commit()
+
+        logger.info("document_deleted_during_indexing", document_id=document.id)
+        return True
+
     @staticmethod
     async def _process_single_document(
         db: Session,
-        document: Document
+        document: Document,
+        work_class: WorkClass = WorkClass.BACKGROUND
     ) -> bool:
         """
         处理单个文档
 
-        流程：
-        1. 下载PDF from S3
-        2. PDF → Markdown (conversion_service)
-        3. 文本分块 (chunking_service)
-        4. 生成向量并索引 (embedding_service)
-        5. 清理临时文件
+        流程（每个阶段完成后记录断点，重试时从最近完成的阶段继续）：
+        1. PDF → Markdown (conversion_service)            → converted
+        2. 图片描述并生成纯文本Markdown                     → described
+        3. 生成文档摘要和标题大纲 (summary_service)          → summarized
+        4. 流式分块并保存，边分块边向量化 (chunking_service)  → chunked
+        5. 补齐缺失的向量 (embedding_service)              → embedded
+        6. 索引到OpenSearch，并写入文档级路由索引             → indexed
+        7. 清理临时文件
 
         Args:
             db: 数据库会话
             document: 文档对象
+            work_class: 调度类别
 
         Returns:
             是否成功
@@ -181,135 +305,215 @@ class SyncWorker:
         document_id = document.id
 
         try:
-            logger.info("start_document_processing", document_id=document_id)
+            # 已完整处理过的文档重新同步时从头开始
+            if document.ingest_stage == INGEST_STAGES[-1]:
+                document.ingest_stage = None
 
-            # Step 1: 获取本地PDF路径
-            pdf_local_path = document.local_pdf_path
-            if not pdf_local_path or not Path(pdf_local_path).exists():
-                raise FileNotFoundError(f"PDF file not found: {pdf_local_path}")
+            # 原始markdown丢失时无法续跑，需要重新转换
+            if SyncWorker._stage_done(document, "converted") and not (
+                document.local_markdown_path and Path(document.local_markdown_path).exists()
+            ):
+                document.ingest_stage = None
+
+            document.status = "processing"
+            db.commit()
 
             logger.info(
-                "pdf_path_verified",
+                "start_document_processing",
                 document_id=document_id,
-                local_path=pdf_local_path
+                resume_from=document.ingest_stage
             )
 
-            # Step 2: PDF → Markdown + 图片提取
-            # 创建markdown输出目录（markdown和图片保存在同一目录）
             markdown_dir = Path(settings.markdown_dir) / document_id
-            markdown_dir.mkdir(parents=True, exist_ok=True)
 
-            logger.info("converting_pdf", document_id=document_id)
+            # Step 1: PDF → Markdown + 图片提取
+            if not SyncWorker._stage_done(document, "converted"):
+                # 获取本地PDF路径
+                pdf_local_path = document.local_pdf_path
+                if not pdf_local_path or not Path(pdf_local_path).exists():
+                    raise FileNotFoundError(f"PDF file not found: {pdf_local_path}")
 
-            # 将输出目录传给ConversionService
-            markdown_content, images_info = conversion_service.convert_pdf_to_markdown(
-                db=db,
-                document_id=document_id,
-                pdf_local_path=pdf_local_path,
-                output_dir=markdown_dir
-            )
+                logger.info(
+                    "pdf_path_verified",
+                    document_id=document_id,
+                    local_path=pdf_local_path
+                )
 
-            logger.info(
-                "pdf_converted",
-                document_id=document_id,
-                markdown_length=len(markdown_content),
-                images_count=len(images_info)
-            )
+                # 创建markdown输出目录（markdown和图片保存在同一目录）
+                markdown_dir.mkdir(parents=True, exist_ok=True)
 
-            # Step 2.1: 立即保存原始markdown（Marker转换结果）
-            content_markdown_path = markdown_dir / "content.md"
-            with open(content_markdown_path, 'w', encoding='utf-8') as f:
-                f.write(markdown_content)
+                logger.info("converting_pdf", document_id=document_id)
 
-            # 更新数据库记录（原始markdown已保存）
-            document.local_markdown_path = str(content_markdown_path)
-            db.commit()
+                # 将输出目录传给ConversionService（占用CPU槽位）
+                with scheduler.slot_sync("cpu", work_class):
+                    markdown_content, images_info = conversion_service.convert_pdf_to_markdown(
+                        db=db,
+                        document_id=document_id,
+                        pdf_local_path=pdf_local_path,
+                        output_dir=markdown_dir
+                    )
 
-            logger.info(
-                "content_markdown_saved",
-                document_id=document_id,
-                path=str(content_markdown_path)
-            )
+                logger.info(
+                    "pdf_converted",
+                    document_id=document_id,
+                    markdown_length=len(markdown_content),
+                    images_count=len(images_info)
+                )
+
+                # 立即保存原始markdown（Marker转换结果）
+                content_markdown_path = markdown_dir / "content.md"
+                with open(content_markdown_path, 'w', encoding='utf-8') as f:
+                    f.write(markdown_content)
+
+                # 更新数据库记录（原始markdown已保存）
+                document.local_markdown_path = str(content_markdown_path)
+                SyncWorker._checkpoint(db, document, "converted")
+            else:
+                # 续跑：读取已保存的转换结果
+                with open(document.local_markdown_path, 'r', encoding='utf-8') as f:
+                    markdown_content = f.read()
+                images_info = conversion_service.load_images_info(markdown_content, markdown_dir)
+
+                logger.info(
+                    "conversion_skipped",
+                    document_id=document_id,
+                    markdown_length=len(markdown_content),
+                    images_count=len(images_info)
+                )
+
+            # Step 2: 生成带上下文的图片描述并替换markdown中的图片引用
+            if not SyncWorker._stage_done(document, "described"):
+                # 图片描述逐张串行调用Bedrock，占用一个Bedrock槽位
+                with scheduler.slot_sync("bedrock", work_class):
+                    markdown_with_descriptions = conversion_service.generate_and_replace_images(
+                        markdown_content=markdown_content,
+                        doc_dir=str(markdown_dir),
+                        document_id=document_id
+                    )
 
-            # Step 3: 生成带上下文的图片描述并替换markdown中的图片引用
-            markdown_with_descriptions = conversion_service.generate_and_replace_images(
-                markdown_content=markdown_content,
-                doc_dir=str(markdown_dir),
-                document_id=document_id
-            )
+                # 保存纯文本版markdown（用于向量化，图片已替换为描述）
+                text_markdown_path = Path(settings.text_markdown_dir) / f"{document_id}.md"
+                text_markdown_path.parent.mkdir(parents=True, exist_ok=True)
 
-            # Step 3.1: 保存纯文本版markdown（用于向量化，图片已替换为描述）
-            text_markdown_path = Path(settings.text_markdown_dir) / f"{document_id}.md"
-            text_markdown_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(text_markdown_path, 'w', encoding='utf-8') as f:
+                    f.write(markdown_with_descriptions)
 
-            with open(text_markdown_path, 'w', encoding='utf-8') as f:
-                f.write(markdown_with_descriptions)
+                # 更新数据库记录（text markdown已保存）
+                document.local_text_markdown_path = str(text_markdown_path)
+                SyncWorker._checkpoint(db, document, "described")
+            else:
+                markdown_with_descriptions = None
 
-            # 更新数据库记录（text markdown已保存）
-            document.local_text_markdown_path = str(text_markdown_path)
-            db.commit()
+            # Step 3: 生成文档摘要（查询时Stage 1不再重复生成；失败不影响入库，查询时回退到Stage 1生成）
+            if not SyncWorker._stage_done(document, "summarized"):
+                if markdown_with_descriptions is None:
+                    with open(document.local_text_markdown_path, 'r', encoding='utf-8') as f:
+                        markdown_with_descriptions = f.read()
 
-            logger.info(
-                "text_markdown_saved",
-                document_id=document_id,
-                path=str(text_markdown_path)
-            )
+                # 标题大纲（无需调用模型，用于文档级路由）
+                document.outline = document_index_service.extract_outline(markdown_with_descriptions)
 
-            # Step 4: 文本分块
-            logger.info("chunking_text", document_id=document_id)
+                try:
+                    with scheduler.slot_sync("bedrock", work_class):
+                        document.summary = summary_service.generate_summary(
+                            markdown_with_descriptions,
+                            document.filename
+                        )
+                    logger.info(
+                        "document_summarized",
+                        document_id=document_id,
+                        summary_length=len(document.summary or "")
+                    )
+                except Exception as e:
+                    document.summary = None
+                    logger.warning(
+                        "document_summary_failed",
+                        document_id=document_id,
+                        error=str(e)
+                    )
 
-            text_chunks, image_chunks = chunking_service.chunk_markdown(
-                db=db,
-                document_id=document_id,
-                markdown_content=markdown_content,
-                images_info=images_info
-            )
+                SyncWorker._checkpoint(db, document, "summarized")
 
-            logger.info(
-                "text_chunked",
-                document_id=document_id,
-                text_chunks=len(text_chunks),
-                image_chunks=len(image_chunks)
-            )
+            # Step 4: 流式分块并保存，每批保存后立即向量化（分块完成前即开始向量化）
+            chunk_rows = None
+            if not SyncWorker._stage_done(document, "chunked"):
+                # 清理上次中断时遗留的chunks
+                chunking_service.delete_document_chunks(db, document_id)
 
-            # Step 6: 保存chunks到数据库
-            logger.info("saving_chunks", document_id=document_id)
+                logger.info("chunking_text", document_id=document_id)
 
-            chunk_ids = chunking_service.save_chunks_to_db(
-                db=db,
-                document_id=document_id,
-                text_chunks=text_chunks,
-                image_chunks=image_chunks
-            )
+                chunk_rows = []
+                embedded_count = 0
 
-            logger.info(
-                "chunks_saved",
-                document_id=document_id,
-                total_chunks=len(chunk_ids)
-            )
+                # 向量化按批串行调用Bedrock，占用一个Bedrock槽位
+                with scheduler.slot_sync("bedrock", work_class):
+                    for rows in chunking_service.stream_chunks_to_db(
+                        db=db,
+                        document_id=document_id,
+                        markdown_content=markdown_content,
+                        images_info=images_info
+                    ):
+                        embedded_count += embedding_service.generate_embeddings(
+                            db=db,
+                            document_id=document_id,
+                            chunk_rows=rows
+                        )
+                        chunk_rows.extend(rows)
+
+                logger.info(
+                    "chunks_saved",
+                    document_id=document_id,
+                    total_chunks=len(chunk_rows),
+                    embedded_count=embedded_count
+                )
+
+                SyncWorker._checkpoint(db, document, "chunked")
+
+            # Step 5: 生成向量（只处理尚未向量化的chunks）
+            if not SyncWorker._stage_done(document, "embedded"):
+                logger.info("generating_embeddings", document_id=document_id)
+
+                # 向量化按批串行调用Bedrock，占用一个Bedrock槽位
+                with scheduler.slot_sync("bedrock", work_class):
+                    embedded_count = embedding_service.generate_embeddings(
+                        db=db,
+                        document_id=document_id,
+                        chunk_rows=chunk_rows
+                    )
 
-            # Step 7: 生成向量并索引
-            logger.info("generating_embeddings", document_id=document_id)
+                logger.info(
+                    "embeddings_generated",
+                    document_id=document_id,
+                    embedded_count=embedded_count
+                )
 
-            indexed_count = embedding_service.generate_and_index_embeddings(
+                SyncWorker._checkpoint(db, document, "embedded")
+
+            # Step 6: 索引到OpenSearch（使用已保存的向量）
+            indexed_count = embedding_service.index_document_chunks(
                 db=db,
                 document_id=document_id,
-                chunk_ids=chunk_ids
+                chunk_rows=chunk_rows
             )
 
             logger.info(
-                "embeddings_generated",
+                "chunks_indexed",
                 document_id=document_id,
                 indexed_count=indexed_count
             )
 
-            # Step 9: 清理临时文件
-            conversion_service.cleanup_temp_files(document_id)
+            # 文档级路由向量（摘要+标题大纲），失败时该文档只能通过不限文档的chunk检索命中
+            with scheduler.slot_sync("bedrock", work_class):
+                document_index_service.index_document(db, document.knowledge_base, document)
 
-            # 清理下载的PDF（本地存储模式下不需要清理PDF）
-            # PDF是永久存储的，不是临时文件
-            # if Path(pdf_local_path).exists():
-            #     Path(pdf_local_path).unlink()
+            # 索引期间文档被删除：删除时记录的墓碑可能早于本次写入，补记墓碑清理刚写入的向量
+            if SyncWorker._reconcile_deleted(db, document):
+                return True
+
+            SyncWorker._checkpoint(db, document, "indexed")
+
+            # Step 7: 清理临时文件
+            conversion_service.cleanup_temp_files(document_id)
 
             logger.info(
                 "document_processing_completed",
@@ -322,9 +526,18 @@ class SyncWorker:
             logger.error(
                 "document_processing_failed",
                 document_id=document_id,
+                stage=document.ingest_stage,
                 error=str(e),
                 exc_info=True
             )
+
+            # 标记失败，保留ingest_stage供下次同步续跑
+            db.rollback()
+            if document.status != "failed":
+                document.status = "failed"
+                document.error_message = str(e)
+                db.commit()
+
             return False
 
     @staticmethod
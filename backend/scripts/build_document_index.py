@@ -0,0 +1,100 @@
+"""
+文档级路由索引补建脚本
+为已有知识库创建文档级索引，并为已完成的文档补齐标题大纲、写入文档级向量
+
+运行方式:
+    python scripts/build_document_index.py
+
+需先运行 python scripts/migrate_add_document_outline.py。
+没有摘要的文档只用文件名和标题大纲生成向量，重新同步后会生成摘要并覆盖。
+"""
+import sys
+from pathlib import Path
+
+# 添加app目录到Python路径
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.database import Document, KnowledgeBase
+from app.services.document_index_service import document_index_service
+
+
+def fill_outline(db, document: Document) -> bool:
+    """从纯文本Markdown中补齐标题大纲"""
+    if document.outline or not document.local_text_markdown_path:
+        return False
+
+    markdown_path = Path(document.local_text_markdown_path)
+    if not markdown_path.exists():
+        return False
+
+    document.outline = document_index_service.extract_outline(
+        markdown_path.read_text(encoding='utf-8')
+    )
+    db.commit()
+    return document.outline is not None
+
+
+def main():
+    """主函数"""
+    print("=" * 60)
+    print("ASK-PRD 文档级路由索引补建")
+    print("=" * 60)
+    print(f"数据库路径: {settings.database_path}")
+    print(f"OpenSearch: {settings.opensearch_endpoint}")
+    print()
+
+    indexed = failed = 0
+
+    db = SessionLocal()
+    try:
+        kbs = db.query(KnowledgeBase).filter(
+            KnowledgeBase.status == "active",
+            KnowledgeBase.opensearch_index_name.isnot(None)
+        ).all()
+
+        for kb in kbs:
+            index_name = document_index_service.index_name_for(kb)
+            print(f"📚 {kb.name} → {index_name}")
+            document_index_service.create_index(index_name)
+
+            documents = db.query(Document).filter(
+                Document.kb_id == kb.id,
+                Document.status == "completed"
+            ).all()
+
+            for document in documents:
+                outline_filled = fill_outline(db, document)
+
+                if document_index_service.index_document(db, kb, document):
+                    indexed += 1
+                    suffix = "（已补齐大纲）" if outline_filled else ""
+                    print(f"   ✅ {document.filename}{suffix}")
+                else:
+                    failed += 1
+                    print(f"   ❌ {document.filename}")
+
+            print()
+
+        print("=" * 60)
+        print(f"✅ 完成：写入 {indexed} 个文档，失败 {failed} 个")
+        print("=" * 60)
+
+    except Exception as e:
+        print(f"❌ 补建失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        db.close()
+
+    if failed:
+        # 覆盖不全的知识库查询时会自动回退到不限文档的chunk检索
+        print("⚠️  部分文档写入失败，可重新运行本脚本")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
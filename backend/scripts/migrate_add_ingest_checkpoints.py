@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+数据库迁移脚本：添加文档处理断点字段
+
+新增字段:
+    documents.ingest_stage  最近完成的处理阶段
+    chunks.embedding        已生成的向量（float32打包）
+
+运行方式:
+    python scripts/migrate_add_ingest_checkpoints.py
+"""
+import sqlite3
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+NEW_COLUMNS = {
+    "documents": [("ingest_stage", "VARCHAR")],
+    "chunks": [("embedding", "BLOB")],
+}
+
+
+def migrate_database():
+    """执行数据库迁移"""
+    db_path = settings.database_path
+
+    logger.info("starting_migration", db_path=db_path)
+
+    # 检查数据库文件是否存在
+    if not Path(db_path).exists():
+        logger.error("database_not_found", db_path=db_path)
+        print(f"❌ 数据库文件不存在: {db_path}")
+        return False
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        added = []
+        for table, columns in NEW_COLUMNS.items():
+            cursor.execute(f"PRAGMA table_info({table})")
+            column_names = [col[1] for col in cursor.fetchall()]
+
+            for name, column_type in columns:
+                if name in column_names:
+                    continue
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+                added.append(f"{table}.{name}")
+                print(f"✅ 添加字段 {table}.{name}")
+
+        # 已完成的文档视为已索引
+        cursor.execute(
+            "UPDATE documents SET ingest_stage = 'indexed' "
+            "WHERE status = 'completed' AND ingest_stage IS NULL"
+        )
+
+        conn.commit()
+
+        logger.info("migration_completed", added_columns=added)
+        if not added:
+            print("✅ 断点字段已存在，无需迁移")
+
+        return True
+
+    except Exception as e:
+        logger.error("migration_failed", error=str(e), exc_info=True)
+        print(f"❌ 迁移失败: {e}")
+        conn.rollback()
+        return False
+
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("数据库迁移：添加文档处理断点字段")
+    print("=" * 60)
+    print()
+
+    success = migrate_database()
+
+    if success:
+        print("\n🎉 迁移成功完成！")
+        sys.exit(0)
+    else:
+        print("\n❌ 迁移失败，请查看日志")
+        sys.exit(1)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+数据库迁移脚本：为 knowledge_bases 表添加查询默认截止时间
+
+新增字段:
+    query_deadline_seconds  查询默认截止时间（秒，为空时使用全局配置 QUERY_DEADLINE_SECONDS）
+
+运行方式:
+    python scripts/migrate_add_kb_query_deadline.py
+"""
+import sqlite3
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+def migrate_database():
+    """执行数据库迁移"""
+    db_path = settings.database_path
+
+    logger.info("starting_migration", db_path=db_path)
+
+    # 检查数据库文件是否存在
+    if not Path(db_path).exists():
+        logger.error("database_not_found", db_path=db_path)
+        print(f"❌ 数据库文件不存在: {db_path}")
+        return False
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        # 1. 检查字段是否已存在
+        cursor.execute("PRAGMA table_info(knowledge_bases)")
+        column_names = [col[1] for col in cursor.fetchall()]
+
+        logger.info("current_columns", columns=column_names)
+
+        added = False
+        if "query_deadline_seconds" not in column_names:
+            cursor.execute("ALTER TABLE knowledge_bases ADD COLUMN query_deadline_seconds INTEGER")
+            added = True
+            print("✅ 添加字段 knowledge_bases.query_deadline_seconds")
+
+        conn.commit()
+
+        logger.info("migration_completed", added=added)
+        if not added:
+            print("✅ query_deadline_seconds 字段已存在，无需迁移")
+
+        # 已有知识库保持为空，跟随全局配置
+        return True
+
+    except Exception as e:
+        logger.error("migration_failed", error=str(e), exc_info=True)
+        print(f"❌ 迁移失败: {e}")
+        conn.rollback()
+        return False
+
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("数据库迁移：添加 knowledge_bases 查询默认截止时间")
+    print("=" * 60)
+    print()
+
+    success = migrate_database()
+
+    if success:
+        print("\n🎉 迁移成功完成！")
+        sys.exit(0)
+    else:
+        print("\n❌ 迁移失败，请查看日志")
+        sys.exit(1)
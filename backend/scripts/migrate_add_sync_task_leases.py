@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+数据库迁移脚本：为 sync_tasks 表添加任务租约字段（持久化任务队列）
+
+新增字段:
+    lease_owner, lease_expires_at, heartbeat_at, attempts
+
+运行方式:
+    python scripts/migrate_add_sync_task_leases.py
+"""
+import sqlite3
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+NEW_COLUMNS = [
+    ("lease_owner", "VARCHAR(100)"),
+    ("lease_expires_at", "DATETIME"),
+    ("heartbeat_at", "DATETIME"),
+    ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+
+def migrate_database():
+    """执行数据库迁移"""
+    db_path = settings.database_path
+
+    logger.info("starting_migration", db_path=db_path)
+
+    # 检查数据库文件是否存在
+    if not Path(db_path).exists():
+        logger.error("database_not_found", db_path=db_path)
+        print(f"❌ 数据库文件不存在: {db_path}")
+        return False
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        # 1. 检查已有字段
+        cursor.execute("PRAGMA table_info(sync_tasks)")
+        column_names = [col[1] for col in cursor.fetchall()]
+
+        logger.info("current_columns", columns=column_names)
+
+        # 2. 添加缺失字段（SQLite支持ADD COLUMN）
+        added = []
+        for name, column_type in NEW_COLUMNS:
+            if name in column_names:
+                continue
+            cursor.execute(f"ALTER TABLE sync_tasks ADD COLUMN {name} {column_type}")
+            added.append(name)
+            print(f"✅ 添加字段 sync_tasks.{name}")
+
+        # 3. 创建租约查询索引
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sync_tasks_status_lease "
+            "ON sync_tasks(status, lease_expires_at)"
+        )
+
+        conn.commit()
+
+        logger.info("migration_completed", added_columns=added)
+        if not added:
+            print("✅ 租约字段已存在，无需迁移")
+
+        return True
+
+    except Exception as e:
+        logger.error("migration_failed", error=str(e), exc_info=True)
+        print(f"❌ 迁移失败: {e}")
+        conn.rollback()
+        return False
+
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("数据库迁移：添加 sync_tasks 任务租约字段")
+    print("=" * 60)
+    print()
+
+    success = migrate_database()
+
+    if success:
+        print("\n🎉 迁移成功完成！")
+        sys.exit(0)
+    else:
+        print("\n❌ 迁移失败，请查看日志")
+        sys.exit(1)
@@ -147,9 +147,9 @@ def test_chunking_and_embedding():
         logger.info("1. 文本分块:")
         logger.info("   text_chunks, image_chunks = chunking_service.chunk_markdown(db, doc_id, markdown, images)")
         logger.info("2. 保存chunks:")
-        logger.info("   chunk_ids = chunking_service.save_chunks_to_db(db, doc_id, text_chunks, image_chunks)")
+        logger.info("   chunk_rows = chunking_service.save_chunks_to_db(db, doc_id, text_chunks, image_chunks)")
         logger.info("3. 生成向量并索引:")
-        logger.info("   count = embedding_service.generate_and_index_embeddings(db, doc_id, chunk_ids)")
+        logger.info("   count = embedding_service.generate_and_index_embeddings(db, doc_id, chunk_rows)")
         logger.info("4. 更新图片S3路径:")
         logger.info("   embedding_service.update_chunk_s3_paths(db, doc_id, image_s3_keys)")
 
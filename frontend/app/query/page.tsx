@@ -227,6 +227,11 @@ function QueryPageContent() {
                   ? `已完成 ${progressData.completed}/${progressData.total} 个文档（失败: ${progressData.doc_name}）`
                   : `已完成 ${progressData.completed}/${progressData.total} 个文档: ${progressData.doc_name}`;
                 setStatus(statusText);
+              } else if (data.type === 'gate') {
+                // 相关性预筛事件
+                const gateData = (data as any).data;
+                const verdict = gateData.relevant ? '相关' : '不相关，跳过';
+                setStatus(`正在筛选文档 ${gateData.completed}/${gateData.total}: ${gateData.doc_name}（${verdict}）`);
               } else if (data.type === 'retrieved_documents') {
                 // Two-Stage系统的文档检索事件
                 const docData = (data as any);
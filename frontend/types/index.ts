@@ -37,6 +37,8 @@ export interface KnowledgeBase {
   opensearch_collection_id?: string;
   opensearch_index_name?: string;
   status: string;
+  relevance_gate_enabled?: boolean | null;
+  query_deadline_seconds?: number | null;
   created_at: string;
   updated_at: string;
 }
@@ -262,6 +264,29 @@ export interface ProgressEvent extends StreamEvent {
   };
 }
 
+export interface GateEvent extends StreamEvent {
+  type: 'gate';
+  data: {
+    completed: number;
+    total: number;
+    doc_id: string;
+    doc_name: string;
+    relevant: boolean;
+    reason: string;
+  };
+}
+
+export interface ConversationEvent extends StreamEvent {
+  type: 'conversation';
+  data: {
+    conversation_id: string;
+    reused: number;
+    new: number;
+    sufficient: boolean;
+    reason: string;
+  };
+}
+
 export interface ReferencesEvent extends StreamEvent {
   type: 'references';
   data: Array<{
@@ -286,4 +311,6 @@ export type QueryStreamEvent =
   | AnswerDeltaEvent
   | AnswerCompleteEvent
   | ProgressEvent
+  | GateEvent
+  | ConversationEvent
   | ReferencesEvent;